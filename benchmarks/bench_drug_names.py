@@ -0,0 +1,63 @@
+"""
+Time to compile the drug-name automaton and to screen a medication list.
+
+    python benchmarks/bench_drug_names.py --lines 500
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.services.cpic_guidelines import current_guidelines  # noqa: E402
+from core.services.drug_names import DrugMatcher, drug_matcher, read_synonyms  # noqa: E402
+
+OTHER_MEDICATIONS = [
+    'Metformin 500 mg PO BID with meals', 'Lisinopril 10 mg daily', 'Atorvastatin 40 mg nightly',
+    'Aspirin 81 mg daily', 'Omeprazole 20 mg before breakfast', 'Levothyroxine 50 mcg qAM',
+    'Amlodipine 5 mg daily', 'Furosemide 40 mg PO daily; hold if SBP < 100',
+]
+
+
+def medication_list(rng, lines):
+    names = list(read_synonyms()) + list(current_guidelines().drug_gene)
+    return '\n'.join(
+        f"{i + 1}. {rng.choice(names).title()} 75 mg PO daily" if rng.random() < 0.2
+        else f"{i + 1}. {rng.choice(OTHER_MEDICATIONS)}"
+        for i in range(lines)
+    )
+
+
+def best_ms(fn, repeat=200):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=500)
+    args = parser.parse_args()
+
+    guidelines = current_guidelines()
+    names = {drug: drug for drug in guidelines.drug_gene}
+    names.update(read_synonyms())
+    text = medication_list(random.Random(7), args.lines)
+    matcher = drug_matcher()
+
+    print(f"{len(names)} names, {len(matcher.goto)} automaton states, {args.lines} lines ({len(text)} chars)")
+    print(f"{'compile':>10} {best_ms(lambda: DrugMatcher(names), repeat=20):>8.3f} ms")
+    for name in ('scan', 'screen', 'normalize'):
+        method = getattr(matcher, name)
+        print(f"{name:>10} {best_ms(lambda: method(text)):>8.3f} ms")
+    drugs, matches, unmatched = matcher.screen(text)
+    print(f"found {', '.join(drugs)} in {len(matches)} entries; {len(unmatched)} unmatched")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Per-assessment cost of RiskEngine at 1, 100 and 100k assessments.
+
+    python benchmarks/bench_risk_engine.py
+"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.services.risk_engine import RiskEngine, compiled_rules  # noqa: E402
+from core.services.allele_index import definitions_path, read_definitions  # noqa: E402
+
+RSID_GENES = {row['rsid']: row['gene'] for row in read_definitions(definitions_path())}
+
+DRUGS = ['CODEINE', 'WARFARIN', 'CLOPIDOGREL', 'SIMVASTATIN', 'AZATHIOPRINE', 'FLUOROURACIL']
+
+
+def patient_variants(rng):
+    rsids = list(RSID_GENES) + [f"rs{i}" for i in range(20)]
+    genes = sorted(set(RSID_GENES.values()))
+    return [
+        {'rsid': rng.choice(rsids), 'gene': rng.choice(genes), 'chromosome': '1',
+         'position': i, 'genotype': '0/1', 'ref': 'A', 'alt': 'G'}
+        for i in range(rng.randrange(0, 8))
+    ]
+
+
+def cohort(rng, n_samples):
+    sites = [
+        {'rsid': rsid, 'gene': gene, 'chromosome': '1', 'position': i, 'ref': 'A', 'alt': 'G'}
+        for i, (rsid, gene) in enumerate(list(RSID_GENES.items()) * 3)
+    ]
+    np_rng = np.random.default_rng(rng.randrange(2**32))
+    genotypes = np_rng.choice(np.array([0, 0, 0, 1], dtype=np.int8), size=(n_samples, len(sites), 2))
+    return {'sites': sites, 'genotypes': genotypes, 'missing': genotypes < 0}
+
+
+def per_assessment(fn, assessments, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best / assessments * 1e6
+
+
+def main():
+    rng = random.Random(11)
+    compiled_rules()  # compile outside the timings
+
+    rows = []
+    for total in (1, 100, 100_000):
+        drugs = DRUGS[:total] if total < len(DRUGS) else DRUGS
+        n_patients = max(1, total // len(drugs))
+        patients = [patient_variants(rng) for _ in range(n_patients)]
+        assessments = n_patients * len(drugs)
+
+        single = per_assessment(
+            lambda: [RiskEngine(v).predict(d) for v in patients for d in drugs], assessments
+        )
+        batched = per_assessment(
+            lambda: [RiskEngine(v).predict_many(drugs) for v in patients], assessments
+        )
+        data = cohort(rng, n_patients)
+        vectorized = per_assessment(lambda: RiskEngine.predict_cohort(data, drugs), assessments)
+        rows.append((assessments, single, batched, vectorized))
+
+    print(f"{'assessments':>12} {'predict':>12} {'predict_many':>14} {'predict_cohort':>16}   (us/assessment)")
+    for assessments, single, batched, vectorized in rows:
+        print(f"{assessments:>12} {single:>12.2f} {batched:>14.2f} {vectorized:>16.2f}")
+
+
+if __name__ == '__main__':
+    main()
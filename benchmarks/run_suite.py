@@ -0,0 +1,264 @@
+"""
+Times every pipeline stage on seeded synthetic VCFs and writes the
+results as JSON, optionally flagging regressions against a baseline run.
+
+Stages: VCFParser.parse (plain / gzip, with and without GENE= tags),
+VCFParser.parse_cohort, RiskEngine.predict_many, JSONFormatter.format_output,
+an end-to-end upload through the Django test client (upload view + job
+worker, with the Groq call stubbed out) and ResultsView, cold and cached.
+Everything runs against a throwaway database and media directory.
+
+    python benchmarks/run_suite.py --output bench.json
+    python benchmarks/run_suite.py --baseline bench.json --tolerance 0.15
+    python benchmarks/run_suite.py --large 2G     # adds a multi-GB parse
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pharmaguard.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+
+from synthetic_vcf import parse_size, write_vcf  # noqa: E402
+
+DRUGS = ['CODEINE', 'WARFARIN', 'CLOPIDOGREL', 'SIMVASTATIN', 'AZATHIOPRINE', 'FLUOROURACIL']
+
+# name -> write_vcf arguments
+PROFILES = {
+    'panel': {'lines': 2_000, 'target_every': 50},
+    'wgs_slice': {'lines': 200_000},
+    'wgs_slice_gz': {'lines': 200_000, 'gz': True},
+    'wgs_slice_untagged': {'lines': 200_000, 'gene_tags': False},
+    'cohort_100': {'lines': 20_000, 'samples': 100, 'target_every': 200},
+}
+
+STUB_EXPLANATION = {
+    "summary": "Benchmark stub.",
+    "biological_mechanism": "N/A",
+    "clinical_impact": "N/A",
+    "variant_evidence": "N/A",
+    "success": True,
+}
+
+
+def measure(fn, repeat):
+    """Runs fn repeat times; returns (stats dict, last result)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return {
+        'runs': repeat,
+        'min_s': min(times),
+        'median_s': statistics.median(times),
+        'mean_s': statistics.fmean(times),
+    }, result
+
+
+def make_files(tmp, profiles, seed):
+    paths = {}
+    for name, spec in profiles.items():
+        spec = dict(spec)
+        path = os.path.join(tmp, name + ('.vcf.gz' if spec.pop('gz', False) else '.vcf'))
+        write_vcf(path, seed=seed, **spec)
+        paths[name] = path
+    return paths
+
+
+def isolate(tmp):
+    """Points the database, media storage and cache at throwaway locations."""
+    settings.DATABASES['default']['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+    settings.MEDIA_ROOT = os.path.join(tmp, 'media')
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    settings.ALLOWED_HOSTS = ['testserver']
+    settings.GROQ_API_KEY = 'benchmark'
+
+    from django.core.management import call_command
+    from core.services.llm_service import LLMService
+
+    call_command('migrate', verbosity=0)
+    LLMService._request_explanation = lambda self, data, session=None: dict(STUB_EXPLANATION)
+
+
+def bench_stages(paths, repeat):
+    from core.services.json_formatter import JSONFormatter
+    from core.services.risk_engine import RiskEngine, compiled_rules
+    from core.services.vcf_parser import VCFParser
+
+    compiled_rules()
+    results = {}
+    for name, path in paths.items():
+        parser = VCFParser(path)
+        if name.startswith('cohort'):
+            stats, parsed = measure(parser.parse_cohort, repeat)
+            stats['sites_kept'] = len(parsed['sites'])
+        else:
+            stats, parsed = measure(parser.parse, repeat)
+            stats['variants_kept'] = len(parsed['variants'])
+        stats['bytes'] = os.path.getsize(path)
+        stats['mb_per_s'] = stats['bytes'] / stats['median_s'] / 1e6
+        results[f'parse.{name}'] = stats
+
+    variants = VCFParser(paths['panel']).parse()['variants']
+    batch = 1000
+    stats, predictions = measure(
+        lambda: [RiskEngine(variants).predict_many(DRUGS) for _ in range(batch)], repeat
+    )
+    stats['us_per_assessment'] = stats['median_s'] / (batch * len(DRUGS)) * 1e6
+    results['predict_many.panel'] = stats
+
+    rows = [dict(p, drug=d) for p, d in zip(predictions[0], DRUGS)] * batch
+    stats, _ = measure(
+        lambda: [JSONFormatter.format_output(r, STUB_EXPLANATION, 'bench') for r in rows], repeat
+    )
+    stats['us_per_assessment'] = stats['median_s'] / len(rows) * 1e6
+    results['format_output'] = stats
+    return results
+
+
+def bench_upload(path, repeat):
+    from django.core.cache import cache
+    from django.test import Client
+    from core.services.jobs import JobRunner, claim_next
+
+    client = Client()
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    state = {'n': 0, 'patient_id': None}
+
+    def upload():
+        # A unique trailing comment keeps content dedup from skipping work.
+        state['n'] += 1
+        body = data + f"##run={state['n']}\n".encode()
+        response = client.post('/upload/', {
+            'uploaded_file': _named(body, 'bench.vcf'),
+            'drugs': ','.join(DRUGS),
+        })
+        assert response.status_code == 302, response.status_code
+        job = JobRunner(claim_next()).run()
+        assert job.status == 'done', job.error
+        state['patient_id'] = job.patient_id
+
+    results = {}
+    results['upload_e2e.panel'], _ = measure(upload, repeat)
+
+    url = f"/results/{state['patient_id']}/"
+
+    def cold():
+        cache.clear()
+        assert client.get(url).status_code == 200
+
+    results['results_view.cold'], _ = measure(cold, repeat)
+    results['results_view.cached'], _ = measure(lambda: client.get(url), repeat)
+    etag = client.get(url)['ETag']
+    results['results_view.304'], _ = measure(
+        lambda: client.get(url, HTTP_IF_NONE_MATCH=etag), repeat
+    )
+    return results
+
+
+def _named(data, name):
+    import io
+    handle = io.BytesIO(data)
+    handle.name = name
+    return handle
+
+
+def compare(results, baseline, tolerance):
+    """Names whose median got slower than baseline by more than tolerance."""
+    regressions = []
+    for name, stats in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        ratio = stats['median_s'] / before['median_s']
+        stats['vs_baseline'] = ratio
+        if ratio > 1 + tolerance:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help="Write results JSON here (default: stdout).")
+    parser.add_argument('--baseline', help="Results JSON of an earlier run to compare against.")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="Allowed median slowdown vs the baseline (0.15 = 15%%).")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--large', type=parse_size, default=None,
+                        help="Also parse a generated VCF of this size, e.g. 2G.")
+    parser.add_argument('--only', choices=('stages', 'upload'), default=None)
+    args = parser.parse_args()
+
+    profiles = dict(PROFILES)
+    if args.large:
+        profiles['large'] = {'size': args.large, 'gene_tags': False}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        isolate(tmp)
+        paths = make_files(tmp, profiles, args.seed)
+        results = {}
+        if args.only in (None, 'stages'):
+            results.update(bench_stages(paths, args.repeat))
+        if args.only in (None, 'upload'):
+            results.update(bench_upload(paths['panel'], args.repeat))
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'profiles': profiles,
+        },
+        'results': results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as handle:
+            regressions = compare(results, json.load(handle), args.tolerance)
+        report['regressions'] = [name for name, _ in regressions]
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(text + '\n')
+    else:
+        print(text)
+
+    for name, stats in results.items():
+        print(f"{name:28} {stats['median_s'] * 1e3:10.2f} ms", file=sys.stderr)
+    for name, ratio in regressions:
+        print(f"REGRESSION {name}: {ratio:.2f}x baseline median", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Seeded synthetic VCF generator for the benchmarks.
+
+Background lines are random SNVs; every --target-every-th line is one of
+the allele-defining sites from the allele definitions TSV, with its real
+coordinates, so both rsID and position lookups find it. With --no-gene-tags
+the GENE=/STAR= INFO tags are omitted and genes come from the allele index
+alone. Output is gzip-compressed when the path ends in .gz. The same seed
+and arguments always produce the same bytes.
+
+    python benchmarks/synthetic_vcf.py out.vcf --lines 200000
+    python benchmarks/synthetic_vcf.py big.vcf.gz --size 2G --samples 100 --no-gene-tags
+"""
+import argparse
+import gzip
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.services.allele_index import definitions_path, read_definitions  # noqa: E402
+
+GENOTYPES = ("0/0", "0/0", "0/1", "1/1")
+SIZE_UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+
+def parse_size(text):
+    """'512M' / '2G' / '1000' -> bytes."""
+    unit = text[-1:].upper()
+    if unit in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[unit])
+    return int(text)
+
+
+def target_sites():
+    """One entry per distinct defining site, in TSV order."""
+    sites = {}
+    for row in read_definitions(definitions_path()):
+        sites.setdefault(row['rsid'], row)
+    return list(sites.values())
+
+
+def header(samples):
+    names = "\t".join(f"SAMPLE{i + 1}" for i in range(samples))
+    return (
+        "##fileformat=VCFv4.2\n"
+        '##INFO=<ID=DP,Number=1,Type=Integer,Description="Depth">\n'
+        '##INFO=<ID=GENE,Number=1,Type=String,Description="Gene">\n'
+        '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n'
+        '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">\n'
+        f"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{names}\n"
+    )
+
+
+def write_vcf(path, lines=None, size=None, samples=1, gene_tags=True, target_every=1000, seed=7):
+    """
+    Writes a synthetic VCF of `lines` data lines, or of about `size`
+    uncompressed bytes when size is given. Returns the data line count.
+    """
+    rng = random.Random(seed)
+    targets = target_sites()
+    opener = gzip.open if path.endswith('.gz') else open
+    written = 0
+    n = 0
+    with opener(path, 'wt') as out:
+        text = header(samples)
+        out.write(text)
+        written += len(text)
+        while (n < lines) if lines is not None else (written < size):
+            calls = "\t".join(
+                f"{rng.choice(GENOTYPES)}:{rng.randrange(10, 60)}" for _ in range(samples)
+            )
+            if n % target_every == 0:
+                site = targets[(n // target_every) % len(targets)]
+                info = f"DP={rng.randrange(10, 90)}"
+                if gene_tags:
+                    info += f";GENE={site['gene']}"
+                text = (
+                    f"{site['chrom']}\t{site['pos']}\t{site['rsid']}\t{site['ref']}\t{site['alt']}"
+                    f"\t50\tPASS\t{info}\tGT:DP\t{calls}\n"
+                )
+            else:
+                text = (
+                    f"1\t{n + 1}\trs{rng.randrange(10**8, 10**9)}\tA\tG\t50\tPASS"
+                    f"\tDP={rng.randrange(10, 90)}\tGT:DP\t{calls}\n"
+                )
+            out.write(text)
+            written += len(text)
+            n += 1
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path')
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument('--lines', type=int, default=None)
+    size.add_argument('--size', type=parse_size, default=None, help="e.g. 500M or 2G (uncompressed)")
+    parser.add_argument('--samples', type=int, default=1)
+    parser.add_argument('--no-gene-tags', dest='gene_tags', action='store_false')
+    parser.add_argument('--target-every', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    lines = write_vcf(
+        args.path,
+        lines=args.lines if args.lines is not None or args.size is not None else 10000,
+        size=args.size,
+        samples=args.samples,
+        gene_tags=args.gene_tags,
+        target_every=args.target_every,
+        seed=args.seed,
+    )
+    print(f"Wrote {lines} data lines to {args.path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import json
+import zlib
+
+from django.db import models
+
+from .json_codec import dumps, loads
+
+# Preset zlib dictionary for JSONFormatter output: the key skeleton every
+# assessment repeats. Stored rows depend on it, so never edit it; a new
+# layout needs a new dictionary and field class.
+ASSESSMENT_ZDICT = json.dumps({
+    "patient_id": "", "drug": "", "timestamp": "",
+    "risk_assessment": {"risk_label": "Adjust Dosage", "confidence_score": 0.95, "severity": "Medium"},
+    "pharmacogenomic_profile": {
+        "primary_gene": "", "diplotype": "", "phenotype": "",
+        "detected_variants": [{"rsid": "rs", "chromosome": "", "position": "", "genotype": "0/1"}],
+    },
+    "clinical_recommendation": {
+        "action": "",
+        "cpic_guideline_reference": "https://cpicpgx.org/guidelines/guideline-for-",
+        "monitoring_required": True,
+    },
+    "llm_generated_explanation": {
+        "summary": "", "biological_mechanism": "", "clinical_impact": "", "variant_evidence": "",
+    },
+    "quality_metrics": {
+        "vcf_parsing_success": True, "genes_detected_count": 0, "llm_generation_success": False,
+    },
+}, separators=(',', ':')).encode()
+
+
+class CompressedJSONField(models.BinaryField):
+    """
+    JSON stored as compact bytes, zlib-compressed once the encoding reaches
+    COMPRESS_THRESHOLD bytes (with the subclass's preset dictionary, if
+    any), and decoded transparently on load.
+
+    zlib streams start with 0x78 ('x'), which no JSON document does, so the
+    two encodings need no marker. Values still stored as JSON text (rows
+    written by a JSONField) load as well.
+    """
+    COMPRESS_THRESHOLD = 512
+    zdict = None
+
+    def encode(self, value):
+        data = dumps(value)
+        if len(data) < self.COMPRESS_THRESHOLD:
+            return data
+        compressor = zlib.compressobj(6, zdict=self.zdict) if self.zdict else zlib.compressobj(6)
+        return compressor.compress(data) + compressor.flush()
+
+    def decode(self, value):
+        if value is None:
+            return None
+        return loads(self.json_bytes(value))
+
+    def json_bytes(self, value):
+        """The stored JSON document as bytes, decompressed but not parsed."""
+        if isinstance(value, str):
+            return value.encode()
+        value = bytes(value)
+        if value[:1] == b'x':
+            decompressor = zlib.decompressobj(zdict=self.zdict) if self.zdict else zlib.decompressobj()
+            value = decompressor.decompress(value) + decompressor.flush()
+        return value
+
+    def from_db_value(self, value, expression, connection):
+        return self.decode(value)
+
+    def to_python(self, value):
+        if isinstance(value, (str, bytes, memoryview)):
+            return self.decode(value)
+        return value
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        return self.encode(value)
+
+    def value_to_string(self, obj):
+        return dumps(self.value_from_object(obj)).decode()
+
+
+class AssessmentJSONField(CompressedJSONField):
+    """CompressedJSONField primed with the assessment key skeleton."""
+    zdict = ASSESSMENT_ZDICT
@@ -8,7 +8,7 @@ class VCFUploadForm(forms.ModelForm):
             'placeholder': 'CODEINE, WARFARIN, CLOPIDOGREL, ...',
             'id': 'drug_input'
         }),
-        help_text="Comma-separated list of drugs to assess."
+        help_text="Comma-separated drug or brand names to assess (e.g. Plavix, warfarin sodium)."
     )
 
     class Meta:
@@ -18,6 +18,6 @@ class VCFUploadForm(forms.ModelForm):
             'uploaded_file': forms.FileInput(attrs={
                 'class': 'form-control',
                 'id': 'vcf_file',
-                'accept': '.vcf'
+                'accept': '.vcf,.vcf.gz'
             })
         }
@@ -0,0 +1,19 @@
+"""
+orjson-backed JSON encoding shared by the stored JSON fields, the API
+renderer and the assessment payload cache.
+"""
+import orjson
+from django.core.serializers.json import DjangoJSONEncoder
+
+_fallback = DjangoJSONEncoder().default
+
+
+def dumps(value, pretty=False):
+    """Compact (or two-space indented) UTF-8 JSON bytes; datetimes in UTC end in Z."""
+    option = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+    if pretty:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(value, default=_fallback, option=option)
+
+
+loads = orjson.loads
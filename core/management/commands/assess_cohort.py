@@ -0,0 +1,124 @@
+import os
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import Patient, DrugAssessment
+from core.services.vcf_parser import VCFParser
+from core.services.risk_engine import RiskEngine
+from core.services.drug_names import normalize_drugs
+from core.services.llm_service import EXPLANATION_MODES, LLMService
+from core.services.json_formatter import JSONFormatter
+from core.services import analytics
+from core.services.pipeline import save_profiles
+
+
+class Command(BaseCommand):
+    help = "Assess every sample of a multi-sample VCF, storing one Patient per sample."
+
+    def add_arguments(self, parser):
+        parser.add_argument('vcf_path')
+        parser.add_argument('--drugs', required=True, help="Comma-separated drug or brand names to assess.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--explanations', choices=EXPLANATION_MODES, default=None,
+            help="Explanation mode (default: EXPLANATION_MODE setting).",
+        )
+
+    def handle(self, *args, **options):
+        vcf_parser = VCFParser(options['vcf_path'])
+        validation_ok, msg = vcf_parser.validate()
+        if not validation_ok:
+            raise CommandError(msg)
+
+        cohort = vcf_parser.parse_cohort()
+        if not cohort['success']:
+            raise CommandError(cohort['error'])
+
+        drug_names = normalize_drugs(options['drugs'])
+        predictions = RiskEngine.predict_cohort(cohort, drug_names)
+        batch_size = options['batch_size']
+
+        with open(options['vcf_path'], 'rb') as handle:
+            stored_name = default_storage.save(
+                'vcf_uploads/' + os.path.basename(options['vcf_path']), File(handle)
+            )
+
+        with transaction.atomic():
+            patients = Patient.objects.bulk_create(
+                [Patient(uploaded_file=stored_name, sample_name=s) for s in cohort['samples']],
+                batch_size=batch_size,
+            )
+
+        # Samples sharing drug, phenotype and variants get the same explanation,
+        # so a cohort only pays for the distinct combinations, which are
+        # generated concurrently in one batch.
+        requests_by_key = {}
+        for sample_predictions in predictions:
+            for drug_name, prediction in zip(drug_names, sample_predictions):
+                prediction['drug'] = drug_name
+                key = self._explanation_key(drug_name, prediction)
+                if key not in requests_by_key:
+                    requests_by_key[key] = {
+                        'drug': drug_name,
+                        'gene': prediction['gene'],
+                        'phenotype': prediction['phenotype'],
+                        'risk_label': prediction['risk_label'],
+                        'action': prediction.get('action', ''),
+                        'detected_variants': prediction.get('detected_variants', []),
+                    }
+        explanations = dict(zip(
+            requests_by_key,
+            LLMService().generate_explanations(
+                list(requests_by_key.values()), mode=options['explanations']
+            ),
+        ))
+
+        pending, profiles = [], []
+        for patient, sample_predictions in zip(patients, predictions):
+            # Carried sites of the assessed genes, once per gene
+            detected = {}
+            for prediction in sample_predictions:
+                detected.setdefault(prediction['gene'], prediction.get('detected_variants', []))
+            profiles.append((patient, [v for vs in detected.values() for v in vs], sample_predictions))
+
+            for drug_name, prediction in zip(drug_names, sample_predictions):
+                key = self._explanation_key(drug_name, prediction)
+                pending.append(DrugAssessment(
+                    patient=patient,
+                    drug_name=drug_name,
+                    risk_label=prediction['risk_label'],
+                    confidence_score=prediction['confidence_score'],
+                    severity=prediction['severity'],
+                    json_output=JSONFormatter.format_output(
+                        prediction, explanations[key], patient.patient_id
+                    ),
+                    needs_enrichment=bool(explanations[key].get('enrich')),
+                    guideline_version=prediction['guideline_version'],
+                    gene=prediction['gene'],
+                    phenotype_call=prediction.get('phenotype_call', ''),
+                ))
+            if len(pending) >= batch_size:
+                with transaction.atomic():
+                    analytics.save_assessments(pending)
+                    save_profiles(profiles)
+                pending, profiles = [], []
+
+        if pending:
+            with transaction.atomic():
+                analytics.save_assessments(pending)
+                save_profiles(profiles)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Assessed {len(patients)} samples x {len(drug_names)} drugs "
+            f"({len(explanations)} distinct explanations)."
+        ))
+
+    @staticmethod
+    def _explanation_key(drug_name, prediction):
+        return (
+            drug_name, prediction['gene'], prediction['phenotype'], prediction['risk_label'],
+            tuple(v['rsid'] for v in prediction.get('detected_variants', [])),
+        )
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Patient
+from core.services.pipeline import save_profiles
+
+
+class Command(BaseCommand):
+    help = "Fill PatientVariant / PatientGenePhenotype rows from stored assessment JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        patients = (
+            Patient.objects.filter(gene_phenotypes__isnull=True, assessments__isnull=False)
+            .distinct().order_by('id').prefetch_related('assessments')
+        )
+
+        done = 0
+        batch = []
+        for patient in patients.iterator(chunk_size=batch_size):
+            profiles = [
+                dict(a.json_output.get('pharmacogenomic_profile', {}), phenotype_call=a.phenotype_call)
+                for a in patient.assessments.all() if a.json_output
+            ]
+            variants = {}
+            for profile in profiles:
+                for v in profile.get('detected_variants', []):
+                    v = dict(v, gene=profile.get('primary_gene'))
+                    variants.setdefault((v['gene'], v['chromosome'], v['position']), v)
+            batch.append((patient, list(variants.values()), profiles))
+            if len(batch) >= batch_size:
+                done += self._save(batch)
+                batch = []
+        done += self._save(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled profiles for {done} patients."))
+
+    @staticmethod
+    def _save(batch):
+        with transaction.atomic():
+            save_profiles(batch)
+        return len(batch)
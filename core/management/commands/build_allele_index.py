@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.allele_index import AlleleIndex, definitions_path, index_path, read_definitions
+
+
+class Command(BaseCommand):
+    help = "Rebuild the memory-mapped rsID / position -> gene / star-allele index from a TSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'definitions', nargs='?',
+            default=definitions_path(),
+            help="Allele-definition TSV (gene, allele, rsid, chrom, pos, ref, alt).",
+        )
+        parser.add_argument(
+            '--output', default=index_path(),
+            help="Where to write the binary index.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            rows = read_definitions(options['definitions'])
+        except OSError as e:
+            raise CommandError(str(e))
+
+        missing = {'gene', 'allele', 'rsid'} - set(rows[0] if rows else ())
+        if missing:
+            raise CommandError(f"Definitions file is missing columns: {', '.join(sorted(missing))}")
+
+        n_rsid, n_pos = AlleleIndex.build(rows, options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {n_rsid} rsIDs and {n_pos} positions into {options['output']}."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.services.llm_service import LLMService
+
+
+class Command(BaseCommand):
+    help = "Delete cached LLM explanations written for another model or prompt template."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Delete every cached explanation.")
+
+    def handle(self, *args, **options):
+        deleted = LLMService().cache.invalidate(everything=options['all'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} cached explanations."))
@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Patient, VCFContent
+from core.services.vcf_store import content_variants
+
+
+class Command(BaseCommand):
+    help = (
+        "Drop raw VCFs not uploaded for --days (default VCF_RETENTION_DAYS), "
+        "keeping their parsed variants, then VACUUM SQLite."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'VCF_RETENTION_DAYS', 90))
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be dropped.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        contents = (
+            VCFContent.objects.exclude(file='')
+            .annotate(last_upload=Coalesce(Max('patients__uploaded_at'), 'created_at'))
+            .filter(last_upload__lt=cutoff)
+            .order_by('id')
+        )
+
+        dropped = freed = 0
+        for content in contents.iterator():
+            try:
+                # Parsed variants are what the pipeline needs once the file is gone.
+                content_variants(content)
+            except ValueError as e:
+                self.stderr.write(f"Keeping {content.file.name}: {e}")
+                continue
+            if not options['dry_run']:
+                for name in (content.file.name, content.file.name + '.tbi', content.file.name + '.csi'):
+                    if default_storage.exists(name):
+                        freed += default_storage.size(name)
+                        default_storage.delete(name)
+                VCFContent.objects.filter(id=content.id).update(file='')
+                Patient.objects.filter(content=content).update(uploaded_file='')
+            dropped += 1
+
+        verb = "Would drop" if options['dry_run'] else "Dropped"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {dropped} raw VCFs older than {options['days']} days ({freed} bytes freed)."
+        ))
+
+        if connection.vendor == 'sqlite' and not options['dry_run']:
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.cpic_guidelines import GuidelineError, current_guidelines, load_guidelines
+from core.services.llm_service import EXPLANATION_MODES
+from core.services.pipeline import record_guidelines
+from core.services.reassess import (
+    affected_assessments, last_assessment_id, mark_unaffected, reassess, rule_changes, snapshot, stale_versions,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Bring stored assessments up to the current guideline file: diff every older "
+        "guideline version against it and recompute only the affected rows from their "
+        "stored variants. Explanations are regenerated only where the risk label changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help="Only report the affected rows.")
+        parser.add_argument('--explanations', choices=EXPLANATION_MODES, default=None,
+                            help="Explanation mode for relabelled rows (default EXPLANATION_MODE).")
+        parser.add_argument('--legacy-rules', metavar='PATH', default=None,
+                            help="Guideline file that produced assessments stored without a version.")
+
+    def handle(self, *args, **options):
+        current = current_guidelines()
+        record_guidelines([current.version])
+
+        for version in stale_versions(current):
+            try:
+                if version:
+                    old = snapshot(version)
+                else:
+                    legacy = options['legacy_rules']
+                    old = load_guidelines(legacy, require_rules=False) if legacy else None
+            except (OSError, GuidelineError) as e:
+                raise CommandError(f"Cannot load the rules for {version or 'unversioned rows'}: {e}")
+            if old is None:
+                self.stderr.write(
+                    f"Skipping {version}: no stored snapshot." if version else
+                    "Skipping unversioned assessments; pass --legacy-rules to include them."
+                )
+                continue
+
+            up_to = last_assessment_id(version)
+            keyed, whole = rule_changes(old, current)
+            ids = [i for i in affected_assessments(version, keyed, whole) if i <= up_to]
+            self.stdout.write(
+                f"{version or 'unversioned'} -> {current.version}: {len(keyed)} changed rule keys, "
+                f"{sum(len(drugs) for drugs in whole.values())} drugs remapped, {len(ids)} affected assessments."
+            )
+            if options['dry_run']:
+                continue
+            updated, relabelled = reassess(ids, options['batch_size'], options['explanations'])
+            unaffected = mark_unaffected(version, current, up_to)
+            self.stdout.write(self.style.SUCCESS(
+                f"Updated {updated} assessments ({relabelled} with a new risk label and explanation); "
+                f"{unaffected} unaffected ones moved to {current.version}."
+            ))
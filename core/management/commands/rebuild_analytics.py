@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.services.analytics import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the analytics counters from scratch from the stored assessments."
+
+    def handle(self, *args, **options):
+        counters = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {counters} analytics counters."))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.services.jobs import JobRunner, claim_next, enrich_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker that runs queued upload assessments (parse, risk, explain, save) and, "
+        "when the queue is empty, LLM enrichment of hybrid-mode explanations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds between polls of an empty queue.")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            job = claim_next()
+            if job is None:
+                enriched = enrich_pending()
+                if enriched:
+                    self.stdout.write(f"Enriched {enriched} explanations.")
+                    continue
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+
+            job = JobRunner(job).run()
+            timings = ', '.join(
+                f"{stage} {info['seconds']:.2f}s"
+                for stage, info in job.stages.items() if info['seconds'] is not None
+            )
+            style = self.style.SUCCESS if job.status == 'done' else self.style.ERROR
+            self.stdout.write(style(f"Job {job.id} {job.status}: {timings}{' - ' + job.error if job.error else ''}"))
@@ -0,0 +1,94 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_vcfcontent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PatientGenePhenotype",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("gene", models.CharField(max_length=20)),
+                ("diplotype", models.CharField(max_length=100)),
+                ("phenotype", models.CharField(max_length=100)),
+                ("activity_score", models.FloatField(blank=True, null=True)),
+                (
+                    "patient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="gene_phenotypes",
+                        to="core.patient",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["gene", "phenotype", "patient"],
+                        name="gene_phenotype_patient_idx",
+                    ),
+                    models.Index(
+                        fields=["gene", "diplotype", "patient"],
+                        name="gene_diplotype_patient_idx",
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("patient", "gene"), name="unique_patient_gene_phenotype"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="PatientVariant",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("rsid", models.CharField(blank=True, max_length=32)),
+                ("gene", models.CharField(max_length=20)),
+                ("chromosome", models.CharField(max_length=10)),
+                ("position", models.BigIntegerField()),
+                ("genotype", models.CharField(max_length=20)),
+                (
+                    "patient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="variants",
+                        to="core.patient",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["rsid", "patient"], name="variant_rsid_patient_idx"
+                    ),
+                    models.Index(
+                        fields=["gene", "patient"], name="variant_gene_patient_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:34
+
+import json
+
+import core.fields
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def reencode(apps, schema_editor):
+    """Rewrites rows still holding JSON text in the compressed encoding."""
+    for model_name, field in (('DrugAssessment', 'json_output'), ('VCFContent', 'variants')):
+        model = apps.get_model('core', model_name)
+        ids = list(model.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(ids), BATCH_SIZE):
+            rows = list(model.objects.filter(id__in=ids[start:start + BATCH_SIZE]).only('id', field))
+            model.objects.bulk_update(rows, [field])
+
+
+def decode(apps, schema_editor):
+    """Rewrites every row as JSON text again, for the JSONField columns of 0007."""
+    quote = schema_editor.quote_name
+    for model_name, field in (('DrugAssessment', 'json_output'), ('VCFContent', 'variants')):
+        model = apps.get_model('core', model_name)
+        sql = (
+            f"UPDATE {quote(model._meta.db_table)} SET {quote(model._meta.get_field(field).column)} = %s "
+            f"WHERE {quote(model._meta.pk.column)} = %s"
+        )
+        ids = list(model.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(ids), BATCH_SIZE):
+            rows = model.objects.filter(id__in=ids[start:start + BATCH_SIZE]).values_list(field, 'id')
+            with schema_editor.connection.cursor() as cursor:
+                cursor.executemany(sql, [
+                    (None if value is None else json.dumps(value), pk) for value, pk in rows
+                ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_drugassessment_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='drugassessment',
+            name='json_output',
+            field=core.fields.AssessmentJSONField(),
+        ),
+        migrations.AlterField(
+            model_name='vcfcontent',
+            name='variants',
+            field=core.fields.CompressedJSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(reencode, decode),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_explanation_modes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drugassessment',
+            name='guideline_version',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
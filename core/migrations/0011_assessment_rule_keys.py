@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:49
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def backfill_rule_keys(apps, schema_editor):
+    """
+    Fills gene and phenotype_call from the stored assessment JSON. Rows
+    that fell through to the default rule report "Normal Metabolizer",
+    which is the uncalled "NM" phenotype.
+    """
+    DrugAssessment = apps.get_model('core', 'DrugAssessment')
+    ids = list(DrugAssessment.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), BATCH_SIZE):
+        rows = list(DrugAssessment.objects.filter(id__in=ids[start:start + BATCH_SIZE]).only('id', 'json_output'))
+        for row in rows:
+            profile = row.json_output.get('pharmacogenomic_profile', {})
+            phenotype = profile.get('phenotype', '')
+            row.gene = profile.get('primary_gene', '')
+            row.phenotype_call = {'Normal Metabolizer': 'NM', 'Unknown': ''}.get(phenotype, phenotype)
+        DrugAssessment.objects.bulk_update(rows, ['gene', 'phenotype_call'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_drugassessment_guideline_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GuidelineVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=64, unique=True)),
+                ('content', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='drugassessment',
+            name='gene',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='drugassessment',
+            name='phenotype_call',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='drugassessment',
+            index=models.Index(fields=['gene', 'phenotype_call', 'guideline_version'], name='assessment_rule_key_idx'),
+        ),
+        migrations.RunPython(backfill_rule_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:51
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate, Trim, Upper
+
+
+def count_existing(apps, schema_editor):
+    """Fills the counters from the assessments stored so far."""
+    DrugAssessment = apps.get_model('core', 'DrugAssessment')
+    AssessmentCounter = apps.get_model('core', 'AssessmentCounter')
+    groups = (
+        DrugAssessment.objects
+        .annotate(day=TruncDate('created_at'), drug=Upper(Trim('drug_name')))
+        .values('day', 'drug', 'gene', 'phenotype_call', 'risk_label')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    AssessmentCounter.objects.bulk_create(
+        [
+            AssessmentCounter(
+                day=group['day'], drug=group['drug'], gene=group['gene'],
+                phenotype=group['phenotype_call'], risk_label=group['risk_label'], count=group['n'],
+            )
+            for group in groups
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_assessment_rule_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssessmentCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('drug', models.CharField(max_length=100)),
+                ('gene', models.CharField(max_length=20)),
+                ('phenotype', models.CharField(max_length=20)),
+                ('risk_label', models.CharField(max_length=50)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['gene', 'phenotype', 'day'], name='counter_gene_phenotype_idx'),
+                    models.Index(fields=['day'], name='counter_day_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(
+                        fields=('drug', 'gene', 'phenotype', 'risk_label', 'day'), name='unique_assessment_counter',
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(count_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def store_phenotype_calls(apps, schema_editor):
+    """
+    Replaces each gene profile's rule-resolved phenotype with the caller's
+    phenotype code, as recorded on the patient's assessments of that gene.
+    """
+    DrugAssessment = apps.get_model('core', 'DrugAssessment')
+    PatientGenePhenotype = apps.get_model('core', 'PatientGenePhenotype')
+    calls = DrugAssessment.objects.filter(
+        patient=OuterRef('patient'), gene=OuterRef('gene'),
+    ).exclude(phenotype_call='').order_by('-id').values('phenotype_call')[:1]
+    PatientGenePhenotype.objects.update(phenotype=Coalesce(Subquery(calls), 'phenotype'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_assessment_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(store_phenotype_calls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_job_heartbeats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='assessmentjob',
+            name='drugs',
+            field=models.TextField(),
+        ),
+    ]
@@ -1,9 +1,23 @@
 from django.db import models
 import uuid
 
+from .fields import AssessmentJSONField, CompressedJSONField
+
+class VCFContent(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='vcf_uploads/')
+    size = models.BigIntegerField()
+    variants = CompressedJSONField(null=True, blank=True) # VCFParser.parse() variants, filled on first parse
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"VCF {self.sha256[:12]}"
+
 class Patient(models.Model):
     patient_id = models.CharField(max_length=100, unique=True, default=uuid.uuid4)
     uploaded_file = models.FileField(upload_to='vcf_uploads/')
+    content = models.ForeignKey(VCFContent, null=True, blank=True, on_delete=models.PROTECT, related_name='patients')
+    sample_name = models.CharField(max_length=255, blank=True) # Set for cohort (multi-sample) VCFs
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -15,8 +29,122 @@ class DrugAssessment(models.Model):
     risk_label = models.CharField(max_length=50) # Safe, Adjust Dosage, Toxic, Ineffective, Unknown
     confidence_score = models.FloatField()
     severity = models.CharField(max_length=50) # Low, Medium, High
-    json_output = models.JSONField()
+    json_output = AssessmentJSONField()
+    needs_enrichment = models.BooleanField(default=False, db_index=True) # Local explanation awaiting LLM enrichment (hybrid mode)
+    guideline_version = models.CharField(max_length=64, blank=True, db_index=True) # Guidelines.version that produced the risk result
+    gene = models.CharField(max_length=20, blank=True) # Rule lookup key: gene and called phenotype code
+    phenotype_call = models.CharField(max_length=20, blank=True)
+    job = models.ForeignKey('AssessmentJob', null=True, blank=True, on_delete=models.SET_NULL, related_name='assessments') # Job that saved it, if any
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True) # Drives the results page ETag / Last-Modified
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['gene', 'phenotype_call', 'guideline_version'], name='assessment_rule_key_idx'),
+        ]
 
     def __str__(self):
         return f"{self.drug_name} assessment for {self.patient.patient_id}"
+
+class PatientVariant(models.Model):
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='variants')
+    rsid = models.CharField(max_length=32, blank=True)
+    gene = models.CharField(max_length=20)
+    chromosome = models.CharField(max_length=10)
+    position = models.BigIntegerField()
+    genotype = models.CharField(max_length=20)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['rsid', 'patient'], name='variant_rsid_patient_idx'),
+            models.Index(fields=['gene', 'patient'], name='variant_gene_patient_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.rsid or self.position} ({self.genotype}) for {self.patient_id}"
+
+class PatientGenePhenotype(models.Model):
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='gene_phenotypes')
+    gene = models.CharField(max_length=20)
+    diplotype = models.CharField(max_length=100)
+    phenotype = models.CharField(max_length=100) # Called phenotype code (DrugAssessment.phenotype_call)
+    activity_score = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'gene'], name='unique_patient_gene_phenotype'),
+        ]
+        indexes = [
+            models.Index(fields=['gene', 'phenotype', 'patient'], name='gene_phenotype_patient_idx'),
+            models.Index(fields=['gene', 'diplotype', 'patient'], name='gene_diplotype_patient_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.gene} {self.phenotype} for {self.patient_id}"
+
+class AssessmentCounter(models.Model):
+    # Materialized assessment counts for the analytics API, adjusted in the
+    # same transaction as the assessments (see services/analytics.py)
+    day = models.DateField()
+    drug = models.CharField(max_length=100) # Upper-cased drug name
+    gene = models.CharField(max_length=20)
+    phenotype = models.CharField(max_length=20) # DrugAssessment.phenotype_call
+    risk_label = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['drug', 'gene', 'phenotype', 'risk_label', 'day'], name='unique_assessment_counter',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['gene', 'phenotype', 'day'], name='counter_gene_phenotype_idx'),
+            models.Index(fields=['day'], name='counter_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.drug} {self.gene} {self.phenotype} {self.risk_label}: {self.count}"
+
+class GuidelineVersion(models.Model):
+    # Snapshot of every guideline file that produced stored assessments, so
+    # reassess_guidelines can diff it against the current one
+    version = models.CharField(max_length=64, unique=True)
+    content = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Guidelines {self.version}"
+
+class CachedExplanation(models.Model):
+    # sha256 of the normalized prompt inputs, model name and prompt template
+    key = models.CharField(max_length=64, unique=True)
+    fingerprint = models.CharField(max_length=64, db_index=True) # Model name + prompt template
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Cached explanation {self.key[:12]}"
+
+class AssessmentJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='jobs')
+    drugs = models.TextField() # Comma-separated canonical drug names (medication lists can be long)
+    explanation_mode = models.CharField(max_length=10, blank=True) # Blank uses EXPLANATION_MODE
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', db_index=True)
+    stage = models.CharField(max_length=20, blank=True) # Stage currently running
+    stages = models.JSONField(default=dict) # {stage: {"status": ..., "seconds": ...}}
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True) # Last sign of life from the running worker
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status}) for {self.patient.patient_id}"
@@ -0,0 +1,24 @@
+from rest_framework.renderers import BaseRenderer
+
+from .json_codec import dumps
+
+
+class ORJSONRenderer(BaseRenderer):
+    """DRF JSON renderer using orjson; `; indent=<n>` in Accept pretty-prints."""
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        pretty = 'indent' in self.parse_params(accepted_media_type)
+        return dumps(data, pretty=pretty)
+
+    @staticmethod
+    def parse_params(media_type):
+        params = {}
+        for part in (media_type or '').split(';')[1:]:
+            key, _, value = part.partition('=')
+            params[key.strip()] = value.strip()
+        return params
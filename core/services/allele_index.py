@@ -0,0 +1,240 @@
+import csv
+import hashlib
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+DEFAULT_DEFINITIONS_PATH = os.path.join(DATA_DIR, 'allele_definitions.tsv')
+DEFAULT_INDEX_PATH = os.path.join(DATA_DIR, 'allele_index.bin')
+
+MAGIC = b'PGXIDX01'
+# magic, rsid count, position count, string count, string blob size
+HEADER = struct.Struct('<8sIIII')
+
+
+def _setting(name, default):
+    try:
+        return str(getattr(settings, name, default))
+    except ImproperlyConfigured:
+        return default
+
+
+def definitions_path():
+    """ALLELE_DEFINITIONS_PATH, defaulting to the TSV shipped in core/data."""
+    return _setting('ALLELE_DEFINITIONS_PATH', DEFAULT_DEFINITIONS_PATH)
+
+
+def index_path():
+    """ALLELE_INDEX_PATH, defaulting to allele_index.bin next to the TSV."""
+    return _setting('ALLELE_INDEX_PATH', DEFAULT_INDEX_PATH)
+
+
+def rsid_key(raw_id):
+    """Numeric key of an rsID ("rs123" or b"rs123"), or 0 if it isn't one."""
+    if isinstance(raw_id, str):
+        raw_id = raw_id.encode()
+    if raw_id[:2] == b'rs' and raw_id[2:].isdigit():
+        return int(raw_id[2:])
+    return 0
+
+
+def position_key(chrom, pos, ref, alt):
+    """64-bit hash of a normalized (chrom, pos, ref, alt) tuple."""
+    chrom = chrom.decode() if isinstance(chrom, bytes) else str(chrom)
+    if chrom.startswith('chr'):
+        chrom = chrom[3:]
+    ref = ref.decode() if isinstance(ref, bytes) else ref
+    alt = alt.decode() if isinstance(alt, bytes) else alt
+    digest = hashlib.blake2b(f"{chrom}:{int(pos)}:{ref}:{alt}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+def read_definitions(tsv_path):
+    """Rows of the allele-definition TSV as dicts (comment lines skipped)."""
+    with open(tsv_path, newline='') as handle:
+        lines = (line for line in handle if line.strip() and not line.startswith('#'))
+        return list(csv.DictReader(lines, delimiter='\t'))
+
+
+class AlleleIndex:
+    """
+    Read-only, memory-mapped rsID / position -> (gene, star alleles) index.
+
+    The file holds two sorted uint64 key arrays (rsID number and position
+    hash), each with a parallel uint32 array of (gene, alleles) string ids,
+    followed by a string table. Nothing is copied into the process: lookups
+    binary-search the mapped pages, which the OS shares between workers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as handle:
+            magic, n_rsid, n_pos, n_strings, blob_size = HEADER.unpack(handle.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an allele index.")
+
+        self._offset = HEADER.size
+        self.rsid_keys = self._map('<u8', (n_rsid,))
+        self.rsid_values = self._map('<u4', (n_rsid, 2))
+        self.pos_keys = self._map('<u8', (n_pos,))
+        self.pos_values = self._map('<u4', (n_pos, 2))
+        string_offsets = self._map('<u4', (n_strings + 1,))
+        blob = self._map('u1', (blob_size,))
+        # The string table is tiny (gene names and allele labels), so decode it once.
+        self.strings = [
+            bytes(blob[string_offsets[i]:string_offsets[i + 1]]).decode()
+            for i in range(n_strings)
+        ]
+
+    def _map(self, dtype, shape):
+        """Maps the next section of the file (numpy can't map zero bytes)."""
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if size:
+            array = np.memmap(self.path, dtype=dtype, mode='r', offset=self._offset, shape=shape)
+        else:
+            array = np.zeros(shape, dtype=dtype)
+        self._offset += size
+        return array
+
+    @staticmethod
+    def build(rows, path):
+        """Writes an index for the definition rows, atomically replacing path."""
+        strings, string_ids = [], {}
+
+        def intern(value):
+            if value not in string_ids:
+                string_ids[value] = len(strings)
+                strings.append(value)
+            return string_ids[value]
+
+        by_rsid, by_position = {}, {}
+        for row in rows:
+            alleles = [] if row['allele'] in ('', '.') else [row['allele']]
+            key = rsid_key(row['rsid'])
+            if key:
+                entry = by_rsid.setdefault(key, (row['gene'], set()))
+                entry[1].update(alleles)
+            if row.get('pos'):
+                key = position_key(row['chrom'], row['pos'], row['ref'], row['alt'])
+                entry = by_position.setdefault(key, (row['gene'], set()))
+                entry[1].update(alleles)
+
+        def section(entries):
+            keys = np.array(sorted(entries), dtype='<u8')
+            values = np.array(
+                [(intern(entries[k][0]), intern(','.join(sorted(entries[k][1])))) for k in keys.tolist()],
+                dtype='<u4',
+            ).reshape(-1, 2)
+            return keys, values
+
+        rsid_keys, rsid_values = section(by_rsid)
+        pos_keys, pos_values = section(by_position)
+        encoded = [s.encode() for s in strings]
+        string_offsets = np.cumsum([0] + [len(s) for s in encoded], dtype='<u4')
+        blob = b''.join(encoded)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as handle:
+            handle.write(HEADER.pack(MAGIC, len(rsid_keys), len(pos_keys), len(strings), len(blob)))
+            for array in (rsid_keys, rsid_values, pos_keys, pos_values, string_offsets):
+                handle.write(array.tobytes())
+            handle.write(blob)
+        os.replace(tmp_path, path)
+        return len(rsid_keys), len(pos_keys)
+
+    def _find(self, keys, values, key):
+        i = int(np.searchsorted(keys, key))
+        if i < len(keys) and keys[i] == key:
+            gene, alleles = values[i]
+            return self.strings[gene], self.strings[alleles]
+        return None
+
+    def lookup_rsid(self, rsid):
+        """(gene, comma-joined star alleles) for an rsID, or None."""
+        key = rsid_key(rsid)
+        return self._find(self.rsid_keys, self.rsid_values, key) if key else None
+
+    def lookup_position(self, chrom, pos, ref, alt):
+        """(gene, comma-joined star alleles) for a site, or None."""
+        return self._find(self.pos_keys, self.pos_values, position_key(chrom, pos, ref, alt))
+
+    def genes_for_rsids(self, raw_ids):
+        """
+        Vectorized rsID -> gene lookup for a batch of raw ID columns.
+        Returns a list aligned with raw_ids holding a gene name or None.
+        """
+        if not raw_ids or not len(self.rsid_keys):
+            return [None] * len(raw_ids)
+        keys = np.fromiter((rsid_key(raw_id) for raw_id in raw_ids), dtype='<u8', count=len(raw_ids))
+        found = np.searchsorted(self.rsid_keys, keys)
+        found[found >= len(self.rsid_keys)] = 0
+        hit = (self.rsid_keys[found] == keys) & (keys != 0)
+        genes = self.rsid_values[found, 0]
+        strings = self.strings
+        return [strings[g] if h else None for g, h in zip(genes.tolist(), hit.tolist())]
+
+
+def reload_interval():
+    """Seconds between checks of the definition and index files (ALLELE_RELOAD_INTERVAL)."""
+    return float(_setting('ALLELE_RELOAD_INTERVAL', 5.0))
+
+
+def file_signature(*paths):
+    """
+    (path, inode, mtime, size) per path, None for a missing one; changes
+    when a file is edited in place or replaced.
+    """
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            signature.append(None)
+        else:
+            signature.append((path, stat.st_ino, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+_index = None
+_signature = None
+_check_after = 0.0
+_lock = threading.Lock()
+
+
+def get_allele_index():
+    """
+    Process-wide AlleleIndex. At most every ALLELE_RELOAD_INTERVAL seconds
+    the index and definitions files are checked: the binary index is
+    rebuilt from the TSV when it is missing or older than the definitions
+    file, and mapped again when another process replaced it (e.g.
+    build_allele_index). Other threads keep the previous index meanwhile.
+    """
+    global _index, _signature, _check_after
+    now = time.monotonic()
+    if _index is not None and now < _check_after:
+        return _index
+    if not _lock.acquire(blocking=_index is None):
+        return _index
+    try:
+        _check_after = now + reload_interval()
+        path, source = index_path(), definitions_path()
+        signature = file_signature(path, source)
+        if _index is None or signature != _signature:
+            stale = not os.path.exists(path) or (
+                os.path.exists(source)
+                and os.path.getmtime(source) > os.path.getmtime(path)
+            )
+            if stale:
+                AlleleIndex.build(read_definitions(source), path)
+                signature = file_signature(path, source)
+            _index = AlleleIndex(path)
+            _signature = signature
+    finally:
+        _lock.release()
+    return _index
@@ -0,0 +1,134 @@
+"""
+Cohort analytics from AssessmentCounter rows: one count per (day, drug,
+gene, called phenotype, risk label), adjusted in the same transaction
+that inserts or re-labels assessments. Queries aggregate counter rows,
+whose number depends on days x keys, never on the number of assessments.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth, Trim, Upper
+from django.utils import timezone
+
+from core.models import AssessmentCounter, DrugAssessment
+
+DIMENSIONS = ('drug', 'gene', 'phenotype', 'risk_label')
+INTERVALS = {'day': None, 'month': TruncMonth}
+
+
+def counter_key(assessment):
+    created = timezone.localtime(assessment.created_at) if assessment.created_at else timezone.localtime()
+    return (
+        created.date(),
+        assessment.drug_name.upper().strip(),
+        assessment.gene,
+        assessment.phenotype_call,
+        assessment.risk_label,
+    )
+
+
+def adjust(deltas):
+    """
+    Applies {counter_key: delta} to the counters. Missing rows are
+    inserted at zero first, so concurrent writers only ever increment.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    AssessmentCounter.objects.bulk_create(
+        [
+            AssessmentCounter(day=day, drug=drug, gene=gene, phenotype=phenotype, risk_label=risk_label)
+            for day, drug, gene, phenotype, risk_label in deltas
+        ],
+        ignore_conflicts=True,
+    )
+    for (day, drug, gene, phenotype, risk_label), delta in deltas.items():
+        AssessmentCounter.objects.filter(
+            day=day, drug=drug, gene=gene, phenotype=phenotype, risk_label=risk_label
+        ).update(count=F('count') + delta)
+
+
+def record(assessments, sign=1):
+    """Counts (or with sign=-1 uncounts) assessments; call inside their transaction."""
+    adjust(Counter({key: sign * n for key, n in Counter(map(counter_key, assessments)).items()}))
+
+
+def save_assessments(rows):
+    """bulk_create()s DrugAssessment rows and counts them, atomically."""
+    with transaction.atomic():
+        DrugAssessment.objects.bulk_create(rows)
+        record(rows)
+    return rows
+
+
+def _counters(filters):
+    counters = AssessmentCounter.objects.all()
+    if filters.get('since'):
+        counters = counters.filter(day__gte=filters['since'])
+    if filters.get('until'):
+        counters = counters.filter(day__lte=filters['until'])
+    for dimension in DIMENSIONS:
+        if filters.get(dimension) is not None:
+            value = filters[dimension]
+            counters = counters.filter(**{dimension: value.upper().strip() if dimension == 'drug' else value})
+    return counters
+
+
+def distribution(by, **filters):
+    """Assessment counts and shares per value of one dimension."""
+    rows = list(
+        _counters(filters).values(by).annotate(total=Sum('count')).filter(total__gt=0).order_by('-total', by)
+    )
+    total = sum(row['total'] for row in rows)
+    return {
+        'by': by,
+        'total': total,
+        'counts': [
+            {'value': row[by], 'count': row['total'], 'share': row['total'] / total} for row in rows
+        ],
+    }
+
+
+def timeseries(interval='day', by='risk_label', **filters):
+    """Per-period totals, with counts and shares per value of `by`."""
+    trunc = INTERVALS[interval]
+    counters = _counters(filters)
+    if trunc is not None:
+        counters = counters.annotate(period=trunc('day'))
+    else:
+        counters = counters.annotate(period=F('day'))
+    periods = {}
+    for row in counters.values('period', by).annotate(total=Sum('count')).order_by('period', by):
+        if not row['total']:
+            continue
+        period = periods.setdefault(row['period'], {'period': row['period'], 'total': 0, 'counts': {}})
+        period['total'] += row['total']
+        period['counts'][row[by]] = row['total']
+    for period in periods.values():
+        period['shares'] = {value: n / period['total'] for value, n in period['counts'].items()}
+    return {'interval': interval, 'by': by, 'periods': list(periods.values())}
+
+
+def rebuild():
+    """Recomputes every counter from the DrugAssessment table."""
+    groups = (
+        DrugAssessment.objects
+        .annotate(day=TruncDate('created_at'), drug=Upper(Trim('drug_name')))
+        .values('day', 'drug', 'gene', 'phenotype_call', 'risk_label')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        AssessmentCounter.objects.all().delete()
+        AssessmentCounter.objects.bulk_create(
+            [
+                AssessmentCounter(
+                    day=group['day'], drug=group['drug'], gene=group['gene'],
+                    phenotype=group['phenotype_call'], risk_label=group['risk_label'], count=group['n'],
+                )
+                for group in groups.iterator()
+            ],
+            batch_size=1000,
+        )
+    return AssessmentCounter.objects.count()
@@ -0,0 +1,51 @@
+"""
+Assessment JSON served as bytes. json_output is stored as the compact
+encoding JSONFormatter's output got at write time, so the compact payload
+is those bytes, decompressed but never parsed. Compact and pretty
+variants are cached under the row's updated_at, so a hot read is one
+small query plus a cache hit.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BinaryField, ExpressionWrapper, F
+
+from core.json_codec import dumps, loads
+from core.models import DrugAssessment
+
+
+def _cache_key(assessment_id, updated_at, pretty):
+    return f"assessment-{assessment_id}-{updated_at.timestamp()}-{'pretty' if pretty else 'compact'}"
+
+
+def _stored_bytes(assessment_id):
+    # Wrapping the column as a plain BinaryField skips the field's decoder.
+    stored = DrugAssessment.objects.filter(id=assessment_id).annotate(
+        stored=ExpressionWrapper(F('json_output'), output_field=BinaryField())
+    ).values_list('stored', flat=True).first()
+    return DrugAssessment._meta.get_field('json_output').json_bytes(stored)
+
+
+def assessment_json(assessment_id, updated_at, pretty=False, value=None):
+    """
+    JSON bytes of one assessment. Pass the decoded json_output as value
+    when the caller already has it, to avoid reading the column again.
+    """
+    key = _cache_key(assessment_id, updated_at, pretty)
+    data = cache.get(key)
+    if data is None:
+        if value is not None:
+            data = dumps(value, pretty=pretty)
+        else:
+            data = _stored_bytes(assessment_id)
+            if pretty:
+                data = dumps(loads(data), pretty=True)
+        cache.set(key, data, getattr(settings, 'RESULTS_CACHE_TIMEOUT', 24 * 3600))
+    return data
+
+
+def assessment_payload(assessment_id, pretty=False):
+    """assessment_json() for an id, or None if there is no such assessment."""
+    updated_at = DrugAssessment.objects.filter(id=assessment_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return assessment_json(assessment_id, updated_at, pretty)
@@ -0,0 +1,117 @@
+import os
+import tarfile
+import zipfile
+
+from django.conf import settings
+from django.db import transaction
+
+from core.models import Patient
+from . import analytics, metrics
+from .llm_service import LLMService
+from .pipeline import assessment_rows, explanation_requests, predict, save_profiles
+from .vcf_store import content_variants, store_vcf
+
+VCF_SUFFIXES = ('.vcf', '.vcf.gz')
+
+
+def archive_members(upload):
+    """
+    Yields (name, file object) for every VCF inside a zip or tar(.gz)
+    upload. Members are streamed straight out of the archive.
+    """
+    name = upload.name.lower()
+    if name.endswith('.zip'):
+        with zipfile.ZipFile(upload) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.endswith(VCF_SUFFIXES):
+                    with archive.open(info) as member:
+                        yield os.path.basename(info.filename), member
+    elif name.endswith(('.tar', '.tar.gz', '.tgz')):
+        with tarfile.open(fileobj=upload, mode='r:*') as archive:
+            for info in archive:
+                if info.isfile() and info.name.endswith(VCF_SUFFIXES):
+                    yield os.path.basename(info.name), archive.extractfile(info)
+    else:
+        raise ValueError(f"{upload.name} is not a .zip, .tar or .tar.gz archive.")
+
+
+class BulkIngestor:
+    """
+    Assesses many VCFs against one drug list.
+
+    Files are stored and parsed one by one, and content seen before is
+    neither stored nor parsed again. Every batch_size files, explanations
+    for the whole batch are generated in one concurrent call and the
+    batch's Patient and DrugAssessment rows are written with bulk_create
+    inside a single transaction.
+    """
+
+    def __init__(self, drug_names, batch_size=None, explanation_mode=None):
+        self.drug_names = drug_names
+        self.explanation_mode = explanation_mode
+        self.batch_size = batch_size or getattr(settings, 'BULK_INGEST_BATCH_SIZE', 200)
+        self.llm_service = LLMService()
+        self.patients = []
+        self.errors = []
+        self._batch = []
+
+    def add(self, name, handle):
+        """Stores and parses one VCF; parse failures are reported, not raised."""
+        metrics.inc('pharmaguard_uploads_total', source='bulk')
+        timings = {}
+        try:
+            with metrics.timed('store', timings):
+                content = store_vcf(handle, name)
+            with metrics.timed('parse', timings):
+                variants = content_variants(content)
+        except ValueError as e:
+            self.errors.append({"file": name, "error": str(e)})
+            return
+
+        with metrics.timed('risk', timings):
+            predictions = predict(variants, self.drug_names)
+        self._batch.append((name, content, variants, predictions, timings))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        predictions = [p for _, _, _, file_predictions, _ in batch for p in file_predictions]
+        # Explanations and saving are per batch; each file records the batch's time.
+        batch_timings = {}
+        with metrics.timed('explain', batch_timings):
+            explanations = iter(
+                self.llm_service.generate_explanations(
+                    explanation_requests(predictions), mode=self.explanation_mode
+                )
+            )
+
+        with metrics.timed('save'), transaction.atomic():
+            patients = Patient.objects.bulk_create(
+                [Patient(content=content, uploaded_file=content.file.name) for _, content, _, _, _ in batch]
+            )
+            rows = []
+            for patient, (_, _, _, file_predictions, timings) in zip(patients, batch):
+                file_explanations = [next(explanations) for _ in file_predictions]
+                rows.extend(assessment_rows(
+                    patient, file_predictions, file_explanations, {**timings, **batch_timings}
+                ))
+            analytics.save_assessments(rows)
+            save_profiles([
+                (patient, variants, file_predictions)
+                for patient, (_, _, variants, file_predictions, _) in zip(patients, batch)
+            ])
+
+        for patient, (name, _, _, file_predictions, _) in zip(patients, batch):
+            self.patients.append({
+                "file": name,
+                "id": patient.id,
+                "patient_id": str(patient.patient_id),
+                "assessments": len(file_predictions),
+            })
+
+    def finish(self):
+        self.flush()
+        return {"patients": self.patients, "errors": self.errors}
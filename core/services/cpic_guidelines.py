@@ -1,89 +1,193 @@
-# CPIC-based logic and drug-gene associations
-
-DRUG_GENE_MAPPING = {
-    "CODEINE": "CYP2D6",
-    "WARFARIN": "CYP2C9",
-    "CLOPIDOGREL": "CYP2C19",
-    "SIMVASTATIN": "SLCO1B1",
-    "AZATHIOPRINE": "TPMT",
-    "FLUOROURACIL": "DPYD"
-}
-
-GENE_PH_MAPPING = {
-    "CYP2D6": {
-        "PM": "Poor Metabolizer",
-        "IM": "Intermediate Metabolizer",
-        "NM": "Normal Metabolizer",
-        "UM": "Ultra-rapid Metabolizer"
-    },
-    "CYP2C19": {
-        "PM": "Poor Metabolizer",
-        "IM": "Intermediate Metabolizer",
-        "NM": "Normal Metabolizer",
-        "RM": "Rapid Metabolizer",
-        "UM": "Ultra-rapid Metabolizer"
-    },
-    "CYP2C9": {
-        "PM": "Poor Metabolizer",
-        "IM": "Intermediate Metabolizer",
-        "NM": "Normal Metabolizer"
-    },
-    "SLCO1B1": {
-        "deficient": "Deficient Transporter Function",
-        "low": "Decreased Transporter Function",
-        "normal": "Normal Transporter Function"
-    },
-    "TPMT": {
-        "low": "Low/Intermediate Activity",
-        "deficient": "No Activity (Poor Metabolizer)",
-        "normal": "Normal Activity"
-    },
-    "DPYD": {
-        "deficient": "Deficient Metabolism (Poor)",
-        "low": "Decreased Metabolism (Intermediate)",
-        "normal": "Normal Metabolism"
-    }
-} 
-
-RULES = {
-    "CODEINE": {
-        "CYP2D6": {
-            "PM": {"risk": "Ineffective", "severity": "High", "action": "Avoid codeine; use alternative analgesic."},
-            "UM": {"risk": "Toxic", "severity": "High", "action": "Avoid codeine; high risk of respiratory depression."},
-            "NM": {"risk": "Safe", "severity": "Low", "action": "Normal therapeutic dose."},
-            "IM": {"risk": "Adjust Dosage", "severity": "Medium", "action": "Use standard starting dose, monitor for efficacy."}
-        }
-    },
-    "WARFARIN": {
-        "CYP2C9": {
-            "PM": {"risk": "Toxic", "severity": "High", "action": "Significant dose reduction required."},
-            "IM": {"risk": "Adjust Dosage", "severity": "Medium", "action": "Lower starting dose recommended."},
-            "NM": {"risk": "Safe", "severity": "Low", "action": "Standard starting dose."}
-        }
-    },
-    "CLOPIDOGREL": {
-        "CYP2C19": {
-            "PM": {"risk": "Ineffective", "severity": "High", "action": "Avoid clopidogrel; use prasugrel or ticagrelor."},
-            "IM": {"risk": "Adjust Dosage", "severity": "Medium", "action": "Consider alternative antiplatelet therapy."},
-            "NM": {"risk": "Safe", "severity": "Low", "action": "Standard dose."}
-        }
-    },
-    "SIMVASTATIN": {
-        "SLCO1B1": {
-            "deficient": {"risk": "Toxic", "severity": "High", "action": "Lower dose or alternative statin recommended (e.g., Rosuvastatin)."},
-            "normal": {"risk": "Safe", "severity": "Low", "action": "Standard dose."}
-        }
-    },
-    "AZATHIOPRINE": {
-        "TPMT": {
-            "low": {"risk": "Toxic", "severity": "High", "action": "Reduce dose by 90% or use alternative."},
-            "normal": {"risk": "Safe", "severity": "Low", "action": "Standard dose."}
-        }
-    },
-    "FLUOROURACIL": {
-        "DPYD": {
-            "deficient": {"risk": "Toxic", "severity": "High", "action": "Avoid or drastically reduce dose."},
-            "normal": {"risk": "Safe", "severity": "Low", "action": "Standard dose."}
-        }
-    }
-}
+# CPIC-based logic and drug-gene associations, loaded from a versioned data
+# file (CPIC_GUIDELINES_PATH, core/data/cpic_guidelines.json by default).
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GUIDELINES_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cpic_guidelines.json'
+)
+
+SEVERITIES = ('Low', 'Medium', 'High')
+
+
+class GuidelineError(ValueError):
+    """The guideline file is malformed or inconsistent."""
+
+
+@dataclass(frozen=True)
+class Guidelines:
+    """
+    One validated version of the guideline file, as read-only mappings.
+
+    version is "<declared version>+<content digest>", so two files that
+    declare the same version but differ still get different IDs.
+    drug_gene: drug -> gene; gene_phenotypes: gene -> phenotype -> name;
+    rules: drug -> gene -> phenotype -> {risk, severity, action};
+    activity_phenotypes: gene -> ((upper activity bound, phenotype), ...).
+    raw is the file content it was parsed from.
+    """
+    version: str
+    drug_gene: MappingProxyType
+    gene_phenotypes: MappingProxyType
+    rules: MappingProxyType
+    activity_phenotypes: MappingProxyType
+    raw: bytes = field(default=b'', repr=False, compare=False)
+
+
+def _setting(name, default):
+    try:
+        value = getattr(settings, name, None)
+    except ImproperlyConfigured:
+        return default
+    return default if value is None else value
+
+
+def guidelines_path():
+    return str(_setting('CPIC_GUIDELINES_PATH', DEFAULT_GUIDELINES_PATH))
+
+
+def _frozen(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _frozen(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_frozen(v) for v in value)
+    return value
+
+
+def parse_guidelines(raw, require_rules=True):
+    """
+    Validates the guideline file's bytes and returns a Guidelines. Older
+    versions, parsed only to diff against, pass require_rules=False to skip
+    the check that every activity phenotype has a rule.
+    """
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        raise GuidelineError(f"Not valid JSON: {e}")
+    for key in ('version', 'drug_gene', 'gene_phenotypes', 'rules', 'activity_phenotypes'):
+        if key not in data:
+            raise GuidelineError(f"Missing {key!r}.")
+    if not isinstance(data['version'], str) or not data['version']:
+        raise GuidelineError("'version' must be a non-empty string.")
+    for key in ('drug_gene', 'gene_phenotypes', 'rules', 'activity_phenotypes'):
+        if not isinstance(data[key], dict):
+            raise GuidelineError(f"{key!r} must be an object.")
+
+    gene_phenotypes = data['gene_phenotypes']
+    for drug, gene in data['drug_gene'].items():
+        if gene not in gene_phenotypes:
+            raise GuidelineError(f"{drug} maps to {gene}, which has no gene_phenotypes entry.")
+
+    for drug, genes in data['rules'].items():
+        for gene, phenotypes in genes.items():
+            if data['drug_gene'].get(drug) != gene:
+                raise GuidelineError(f"Rules for {drug}/{gene} don't match drug_gene.")
+            for phenotype, rule in phenotypes.items():
+                where = f"{drug}/{gene}/{phenotype}"
+                if phenotype not in gene_phenotypes[gene]:
+                    raise GuidelineError(f"{where}: unknown phenotype.")
+                if not isinstance(rule, dict) or not all(
+                    isinstance(rule.get(k), str) for k in ('risk', 'severity', 'action')
+                ):
+                    raise GuidelineError(f"{where}: risk, severity and action are required.")
+                if rule['severity'] not in SEVERITIES:
+                    raise GuidelineError(f"{where}: severity must be one of {', '.join(SEVERITIES)}.")
+
+    activity_phenotypes = {}
+    for gene, bands in data['activity_phenotypes'].items():
+        # A null upper bound means "no upper bound" (JSON has no infinity).
+        bounds = [float('inf') if upper is None else float(upper) for upper, _ in bands]
+        if bounds != sorted(bounds) or not bounds or bounds[-1] != float('inf'):
+            raise GuidelineError(f"{gene}: activity bands must ascend and end with null.")
+        for _, phenotype in bands:
+            if phenotype not in gene_phenotypes.get(gene, ()):
+                raise GuidelineError(f"{gene}: unknown activity phenotype {phenotype!r}.")
+        activity_phenotypes[gene] = [(upper, ph) for upper, (_, ph) in zip(bounds, bands)]
+
+    # Every phenotype the diplotype caller can assign needs a rule, or the
+    # risk engine would fall back to its no-variants default.
+    for drug, gene in data['drug_gene'].items() if require_rules else ():
+        gene_rules = data['rules'].get(drug, {}).get(gene, {})
+        for _, phenotype in activity_phenotypes.get(gene, ()):
+            if phenotype not in gene_rules:
+                raise GuidelineError(f"{drug}/{gene}/{phenotype}: activity phenotype has no rule.")
+
+    return Guidelines(
+        version=f"{data['version']}+{hashlib.sha256(raw).hexdigest()[:8]}",
+        drug_gene=_frozen(data['drug_gene']),
+        gene_phenotypes=_frozen(gene_phenotypes),
+        rules=_frozen(data['rules']),
+        activity_phenotypes=_frozen(activity_phenotypes),
+        raw=raw,
+    )
+
+
+def load_guidelines(path=None, require_rules=True):
+    with open(path or guidelines_path(), 'rb') as handle:
+        return parse_guidelines(handle.read(), require_rules)
+
+
+_current = None
+_loaded = {}
+_signature = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+
+def current_guidelines():
+    """
+    The process-wide Guidelines. At most every GUIDELINES_RELOAD_INTERVAL
+    seconds the file's mtime and size are checked; when they changed, one
+    thread loads and validates the new version and swaps it in with a
+    single assignment while the others keep using the previous one. A file
+    that fails validation is logged and the previous version stays active.
+    """
+    global _current, _signature, _checked_at
+    now = time.monotonic()
+    interval = _setting('GUIDELINES_RELOAD_INTERVAL', 5.0)
+    if _current is not None and now - _checked_at < interval:
+        return _current
+    if not _lock.acquire(blocking=_current is None):
+        return _current
+    try:
+        _checked_at = now
+        path = guidelines_path()
+        signature = _file_signature(path)
+        if _current is None or signature != _signature:
+            _signature = signature
+            try:
+                guidelines = load_guidelines(path)
+                _loaded[guidelines.version] = guidelines
+                _current = guidelines
+            except (OSError, GuidelineError) as e:
+                if _current is None:
+                    raise
+                logger.error("Keeping guidelines %s; %s is invalid: %s", _current.version, path, e)
+    finally:
+        _lock.release()
+    return _current
+
+
+def loaded_guidelines(version):
+    """A Guidelines version this process has loaded, or None."""
+    return _loaded.get(version)
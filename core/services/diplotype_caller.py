@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from .allele_index import definitions_path, file_signature, position_key, read_definitions, reload_interval
+
+REFERENCE_ALLELE = '*1'
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(words):
+        """Set bits per row of a (..., n_words) uint64 array."""
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:
+    _BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+    def popcount(words):
+        """Set bits per row of a (..., n_words) uint64 array."""
+        as_bytes = np.ascontiguousarray(words).view(np.uint8)
+        return _BYTE_COUNTS[as_bytes].sum(axis=-1)
+
+
+def observed_copies(variant):
+    """Alt-allele copies in a variant's genotype; 1 when it has no usable GT."""
+    alleles = str(variant.get('genotype', '')).replace('|', '/').split('/')
+    if not all(a.isdigit() or a == '.' for a in alleles):
+        return 1
+    return min(2, sum(1 for a in alleles if a.isdigit() and a != '0'))
+
+
+def phenotype_for(activity_phenotypes, gene, activity):
+    """Phenotype of an activity score under one Guidelines' activity bands."""
+    for upper, phenotype in activity_phenotypes.get(gene, ()):
+        if activity <= upper:
+            return phenotype
+    return 'NM'
+
+
+class DiplotypeCaller:
+    """
+    Star-allele diplotype caller for one gene.
+
+    Every allele is compiled into a bitset over the gene's defining sites,
+    and every unordered allele pair into its union/intersection/xor
+    bitsets. A call drops alleles with an unobserved defining variant, then
+    scores the remaining pairs at once against the observed het and hom-alt
+    bitsets, preferring (in order) no defining variant missing, no observed
+    variant left unexplained, and the most matched sites.
+    """
+
+    def __init__(self, gene, rows, activities):
+        self.gene = gene
+        self.site_index = {}
+        sites = []
+        allele_sites = {REFERENCE_ALLELE: set()}
+        for row in rows:
+            if row['allele'] in ('', '.'):
+                continue
+            site = row['rsid'] or f"{row['chrom']}:{row['pos']}:{row['ref']}:{row['alt']}"
+            if site not in self.site_index:
+                self.site_index[site] = len(sites)
+                sites.append(site)
+                if row.get('pos'):
+                    key = position_key(row['chrom'], row['pos'], row['ref'], row['alt'])
+                    self.site_index[key] = self.site_index[site]
+            allele_sites.setdefault(row['allele'], set()).add(self.site_index[site])
+
+        self.n_sites = len(sites)
+        self.n_words = max(1, (self.n_sites + 63) // 64)
+        self.alleles = list(allele_sites)
+        self.activities = activities
+        self.masks = masks = np.stack([self._mask(allele_sites[a]) for a in self.alleles])
+
+        first, second = np.triu_indices(len(self.alleles))
+        self.pairs = np.stack([first, second], axis=1)
+        self.either = masks[first] | masks[second]
+        self.both = masks[first] & masks[second]
+        self.single = masks[first] ^ masks[second]
+        allele_activity = np.array([activities.get(a, 1.0) for a in self.alleles])
+        self.pair_activity = allele_activity[first] + allele_activity[second]
+        # Lexicographic weights: one missing variant outweighs any number of
+        # unexplained ones (at most two per site), which outweigh any number
+        # of matched sites.
+        self.weight = 2 * self.n_sites + 1
+
+    def _mask(self, site_ids):
+        words = np.zeros(self.n_words, dtype=np.uint64)
+        for i in site_ids:
+            words[i // 64] |= np.uint64(1 << (i % 64))
+        return words
+
+    def site_of(self, variant):
+        """Defining-site number of a variant dict, or None."""
+        site = self.site_index.get(variant.get('rsid'))
+        if site is None and variant.get('position') is not None and variant.get('alt'):
+            site = self.site_index.get(position_key(
+                variant['chromosome'], variant['position'], variant['ref'], variant['alt']
+            ))
+        return site
+
+    def call(self, observations, activity_phenotypes):
+        """
+        Calls a diplotype from (variant dict, alt copies) observations.
+        Returns a dict with diplotype, activity_score and phenotype, the
+        phenotype from the activity_phenotypes bands of the Guidelines the
+        caller assesses with.
+        """
+        observations = [(v, copies) for v, copies in observations if copies > 0]
+        starred = self._call_from_star_tags(observations, activity_phenotypes)
+        if starred is not None:
+            return starred
+
+        het, hom = set(), set()
+        for variant, copies in observations:
+            site = self.site_of(variant)
+            if site is not None:
+                (hom if copies > 1 else het).add(site)
+        het, hom = self._mask(het - hom), self._mask(hom)
+        candidates = self.candidates(het | hom)
+        best = int(candidates[np.argmax(self.score(het, hom, candidates))])
+        first, second = self.pairs[best]
+        return self._result(
+            (self.alleles[first], self.alleles[second]), float(self.pair_activity[best]), activity_phenotypes
+        )
+
+    def candidates(self, observed):
+        """
+        Pairs of alleles whose defining variants were all observed. The
+        reference pair always qualifies, so the best-scoring pair is among
+        these and the rest need not be scored.
+        """
+        complete = popcount(self.masks & ~observed) == 0
+        return np.flatnonzero(complete[self.pairs[:, 0]] & complete[self.pairs[:, 1]])
+
+    def score(self, het, hom, pairs=slice(None)):
+        """Score of allele pairs against observed het/hom-alt bitsets."""
+        observed = het | hom
+        either, both, single = self.either[pairs], self.both[pairs], self.single[pairs]
+        missing = popcount(either & ~observed) + popcount(both & het)
+        unexplained = popcount(observed & ~either) + popcount(hom & single)
+        matched = popcount(either & observed)
+        return matched - self.weight * unexplained - self.weight * self.weight * missing
+
+    def _call_from_star_tags(self, observations, activity_phenotypes):
+        """Fast path for VCFs whose carried lines all carry a known STAR= tag."""
+        if not observations or not all(v.get('star') in self.activities for v, _ in observations):
+            return None
+        copies = {}
+        for variant, n in observations:
+            copies[variant['star']] = max(copies.get(variant['star'], 0), n)
+        alleles = [a for a, n in copies.items() for _ in range(n)]
+        if len(alleles) > 2:
+            return None
+        alleles = sorted(alleles + [REFERENCE_ALLELE] * (2 - len(alleles)), key=self._allele_order)
+        return self._result(alleles, sum(self.activities[a] for a in alleles), activity_phenotypes)
+
+    def _allele_order(self, allele):
+        return self.alleles.index(allele) if allele in self.alleles else len(self.alleles)
+
+    def _result(self, alleles, activity, activity_phenotypes):
+        return {
+            "diplotype": "/".join(alleles),
+            "activity_score": activity,
+            "phenotype": phenotype_for(activity_phenotypes, self.gene, activity),
+        }
+
+
+def compile_callers(definition_rows, function_rows):
+    """DiplotypeCaller per gene from allele-definition and -function rows."""
+    activities = {}
+    for row in function_rows:
+        activities.setdefault(row['gene'], {})[row['allele']] = float(row['activity'])
+    by_gene = {}
+    for row in definition_rows:
+        by_gene.setdefault(row['gene'], []).append(row)
+    return {
+        gene: DiplotypeCaller(gene, rows, activities.get(gene, {REFERENCE_ALLELE: 1.0}))
+        for gene, rows in by_gene.items()
+    }
+
+
+_callers = None
+_signature = None
+_check_after = 0.0
+_lock = threading.Lock()
+
+
+def diplotype_callers():
+    """
+    Process-wide callers compiled from the allele-definition TSV and the
+    allele_functions.tsv next to it, recompiled when either file changes
+    (checked at most every ALLELE_RELOAD_INTERVAL seconds).
+    """
+    global _callers, _signature, _check_after
+    now = time.monotonic()
+    if _callers is not None and now < _check_after:
+        return _callers
+    if not _lock.acquire(blocking=_callers is None):
+        return _callers
+    try:
+        _check_after = now + reload_interval()
+        source = definitions_path()
+        functions = os.path.join(os.path.dirname(source), 'allele_functions.tsv')
+        signature = file_signature(source, functions)
+        if _callers is None or signature != _signature:
+            _callers = compile_callers(read_definitions(source), read_definitions(functions))
+            _signature = signature
+    finally:
+        _lock.release()
+    return _callers
@@ -0,0 +1,194 @@
+"""
+Drug-name normalization for free-text medication input.
+
+The supported drugs and their generic, salt and brand names
+(core/data/drug_synonyms.tsv) are compiled once per guideline version into
+an Aho-Corasick automaton over word tokens. A medication list is split into
+words by one str.translate() pass and the automaton walks the words once,
+so screening costs the same however many names the table holds.
+"""
+import csv
+import os
+
+from .cpic_guidelines import current_guidelines
+
+SYNONYMS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'drug_synonyms.tsv'
+)
+
+# Entries of a medication list are comma-, semicolon- or line-separated.
+SEPARATORS = ',;\r\n'
+ENTRY_BREAK = '|'
+
+
+class _WordTable(dict):
+    """
+    str.translate() table keeping [a-z0-9], turning entry separators into
+    ENTRY_BREAK and anything else into a space; filled lazily. Every value
+    is one character, which keeps translate() on its fast path.
+    """
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        if char in SEPARATORS:
+            value = ENTRY_BREAK
+        elif char.isascii() and char.isalnum():
+            value = char
+        else:
+            value = ' '
+        self[codepoint] = value
+        return value
+
+
+_WORDS = _WordTable()
+
+
+def tokens(text):
+    """
+    Lower-cased alphanumeric words of text, with an ENTRY_BREAK token per
+    separator; other punctuation only separates words.
+    """
+    return text.lower().translate(_WORDS).replace(ENTRY_BREAK, f' {ENTRY_BREAK} ').split()
+
+
+def split_entries(text):
+    """The entries of a medication list, blank ones included, unstripped."""
+    for separator in SEPARATORS[:-1]:
+        text = text.replace(separator, SEPARATORS[-1])
+    return text.split(SEPARATORS[-1])
+
+
+def read_synonyms(tsv_path=SYNONYMS_PATH):
+    """{synonym: drug} from the synonym TSV (comment lines skipped)."""
+    with open(tsv_path, newline='') as handle:
+        lines = (line for line in handle if line.strip() and not line.startswith('#'))
+        return {row['synonym']: row['drug'].upper().strip() for row in csv.DictReader(lines, delimiter='\t')}
+
+
+class DrugMatcher:
+    """
+    Aho-Corasick automaton mapping word sequences to drug names.
+
+    State 0 is the root; goto[state] maps a token to the next state,
+    fail[state] is the state of the longest proper suffix that is also a
+    prefix of some name, and out[state] holds the drugs of every name
+    ending at that state (its own and those reached through fail links).
+    """
+
+    def __init__(self, names, version=''):
+        self.version = version
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+        for name, drug in names.items():
+            state = 0
+            for token in tokens(name):
+                next_state = self.goto[state].get(token)
+                if next_state is None:
+                    next_state = self.goto[state][token] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                state = next_state
+            if state and drug not in self.out[state]:
+                self.out[state] += (drug,)
+
+        # Breadth-first, so a state's fail target is final before its children.
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for token, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(token, 0)
+                self.fail[child] = target
+                self.out[child] += tuple(d for d in self.out[target] if d not in self.out[child])
+
+    def matches(self, words):
+        """
+        (entry number, drug) for every name ending in a token sequence;
+        entries are numbered by counting ENTRY_BREAK tokens.
+        """
+        goto, fail, out = self.goto, self.fail, self.out
+        root = goto[0]
+        state = entry = 0
+        for token in words:
+            if state:
+                while state and token not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(token, 0)
+            else:
+                state = root.get(token, 0)
+            if state:
+                for drug in out[state]:
+                    yield entry, drug
+            elif token == ENTRY_BREAK:
+                entry += 1
+
+    def scan(self, text):
+        """Every supported drug named anywhere in text, in order of first mention."""
+        return list(dict.fromkeys(drug for _, drug in self.matches(tokens(text))))
+
+    def entries(self, text):
+        """
+        Splits a medication list into entries (commas, semicolons or lines)
+        and matches them in one pass over the whole text. Returns
+        [(entry, drugs)] for the non-blank entries, drugs in order of first
+        mention.
+        """
+        found = {}
+        for n, drug in self.matches(tokens(text)):
+            found.setdefault(n, {})[drug] = None
+        return [
+            (entry, list(found[n]) if n in found else [])
+            for n, entry in enumerate(map(str.strip, split_entries(text))) if entry
+        ]
+
+    def screen(self, text):
+        """
+        Matches a medication list entry by entry. Returns (drugs, matches,
+        unmatched): the drugs in order of first mention, [{'entry', 'drugs'}]
+        per matching entry, and the entries that name no supported drug.
+        """
+        drugs, matches, unmatched = {}, [], []
+        for entry, found in self.entries(text):
+            if found:
+                matches.append({'entry': entry, 'drugs': found})
+                drugs.update(dict.fromkeys(found))
+            else:
+                unmatched.append(entry)
+        return list(drugs), matches, unmatched
+
+    def normalize(self, text):
+        """
+        Drug names to assess from user input: the canonical name of every
+        drug an entry mentions, and unmatched entries as typed (they are
+        assessed as unsupported), without duplicates.
+        """
+        names = {}
+        for entry, found in self.entries(text):
+            names.update(dict.fromkeys(found or [entry]))
+        return list(names)
+
+
+_matcher = None
+
+
+def drug_matcher():
+    """The DrugMatcher of the current guideline version, compiled once per version."""
+    global _matcher
+    guidelines = current_guidelines()
+    matcher = _matcher
+    if matcher is None or matcher.version != guidelines.version:
+        names = {drug: drug for drug in guidelines.drug_gene}
+        for synonym, drug in read_synonyms().items():
+            if drug in guidelines.drug_gene:
+                names.setdefault(synonym, drug)
+        matcher = _matcher = DrugMatcher(names, guidelines.version)
+    return matcher
+
+
+def normalize_drugs(text):
+    """DrugMatcher.normalize() with the current guideline version."""
+    return drug_matcher().normalize(text)
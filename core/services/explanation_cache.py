@@ -0,0 +1,131 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_SIZE = 2048
+
+
+def prompt_inputs(data):
+    """
+    The fields of an explanation request that reach the prompt, normalized
+    so that equivalent requests (drug case, rsID order) share one key.
+    """
+    rsids = sorted({v.get('rsid') or 'unknown' for v in data.get('detected_variants', [])})
+    return {
+        "drug": str(data.get('drug', 'N/A')).strip().upper(),
+        "gene": data.get('gene', 'N/A'),
+        "phenotype": data.get('phenotype', 'N/A'),
+        "risk_label": data.get('risk_label', 'N/A'),
+        "rsids": rsids,
+    }
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+class ExplanationCache:
+    """
+    Two-tier cache of successful LLM explanations.
+
+    An in-process LRU (with a TTL) sits in front of CachedExplanation rows
+    shared by every worker. Keys hash the normalized prompt inputs together
+    with a fingerprint of the model name and prompt template, so changing
+    either misses every old entry; invalidate() then deletes them.
+    """
+
+    def __init__(self, fingerprint, ttl=None, size=None):
+        self.fingerprint = fingerprint
+        self.ttl = ttl if ttl is not None else getattr(settings, 'EXPLANATION_CACHE_TTL', DEFAULT_TTL)
+        self.size = size if size is not None else getattr(settings, 'EXPLANATION_CACHE_SIZE', DEFAULT_SIZE)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+    def key(self, data):
+        return _digest([self.fingerprint, prompt_inputs(data)])
+
+    def get(self, data):
+        """Cached explanation for the request, or None."""
+        from core.models import CachedExplanation
+
+        key = self.key(data)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return dict(entry[1])
+
+        try:
+            row = CachedExplanation.objects.filter(
+                key=key, created_at__gte=timezone.now() - timedelta(seconds=self.ttl)
+            ).values_list('payload', 'created_at').first()
+        except DatabaseError:
+            row = None
+        if row is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        payload, created_at = row
+        remaining = self.ttl - (timezone.now() - created_at).total_seconds()
+        self._remember(key, payload, now + remaining)
+        with self._lock:
+            self.stats["db_hits"] += 1
+        return dict(payload)
+
+    def set(self, data, explanation):
+        """Stores a successful explanation; failures are never cached."""
+        from core.models import CachedExplanation
+
+        if not explanation.get('success'):
+            return
+        key = self.key(data)
+        self._remember(key, explanation, time.monotonic() + self.ttl)
+        try:
+            CachedExplanation.objects.update_or_create(
+                key=key,
+                defaults={
+                    "fingerprint": self.fingerprint,
+                    "payload": explanation,
+                    "created_at": timezone.now(),
+                },
+            )
+        except DatabaseError:
+            pass
+
+    def _remember(self, key, payload, expires):
+        with self._lock:
+            self._entries[key] = (expires, dict(payload))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, everything=False):
+        """
+        Drops entries written under another model/template fingerprint (or
+        all entries) from both tiers. Returns the number of rows deleted.
+        """
+        from core.models import CachedExplanation
+
+        with self._lock:
+            self._entries.clear()
+        rows = CachedExplanation.objects.all()
+        if not everything:
+            rows = rows.exclude(fingerprint=self.fingerprint)
+        return rows.delete()[0]
+
+
+def fingerprint(model, *templates):
+    """Identifies the model and prompt text an explanation was generated with."""
+    return _digest([model, *templates])
@@ -0,0 +1,58 @@
+"""
+Server-sent events for one assessment job. Served by JobStreamView, which
+needs an ASGI server to actually stream (under WSGI Django buffers the
+whole response, so the job is only followed there, never run).
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+
+from core.json_codec import dumps
+from core.models import AssessmentJob, DrugAssessment
+from .jobs import JobRunner, claim, job_status
+
+POLL_INTERVAL = 1.0
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+async def job_events(job_id, run=True):
+    """
+    Yields SSE frames for a job. With run, a still-queued job is claimed
+    and run right here, so each drug's "risk" frame goes out as soon as
+    the risk stage finishes and its "assessment" frame as soon as its
+    explanation is ready. Otherwise (or if a worker already claimed it)
+    the job is followed by polling, and its saved assessments are sent
+    once it is done. Either way the last frame is "done" with the job
+    status.
+    """
+    job = await sync_to_async(claim)(job_id) if run else None
+    if job is not None:
+        yield sse('status', job_status(job))
+        events = JobRunner(job).events()
+        try:
+            # The runner is synchronous (ORM, thread pool); step it on the
+            # sync thread so it always sees the same database connection.
+            while (item := await sync_to_async(next)(events, None)) is not None:
+                yield sse(*item)
+        finally:
+            await sync_to_async(events.close)()
+        return
+
+    last = None
+    while True:
+        job = await AssessmentJob.objects.aget(id=job_id)
+        status = job_status(job)
+        if status != last:
+            yield sse('status', status)
+            last = status
+        if job.status in ('done', 'failed'):
+            break
+        await asyncio.sleep(POLL_INTERVAL)
+
+    if job.status == 'done':
+        async for assessment in DrugAssessment.objects.filter(patient_id=job.patient_id).order_by('id'):
+            yield sse('assessment', assessment.json_output)
+    yield sse('done', status)
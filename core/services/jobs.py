@@ -0,0 +1,262 @@
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import AssessmentJob, DrugAssessment, PatientVariant
+from . import analytics, metrics
+from .json_formatter import JSONFormatter
+from .llm_service import LLMService
+from .pipeline import assessment_rows, explanation_requests, predict, save_profiles
+from .vcf_store import patient_variants
+
+STAGES = ('parse', 'risk', 'explain', 'save')
+EXPLANATION_FIELDS = ('summary', 'biological_mechanism', 'clinical_impact', 'variant_evidence')
+
+
+def enqueue(patient, drug_names, explanation_mode=''):
+    """Queues the parse -> risk -> explain -> save pipeline for a patient."""
+    return AssessmentJob.objects.create(
+        patient=patient,
+        drugs=','.join(drug_names),
+        explanation_mode=explanation_mode or '',
+        stages=_pending_stages(),
+    )
+
+
+def _pending_stages():
+    return {stage: {"status": "pending", "seconds": None} for stage in STAGES}
+
+
+def requeue_stale():
+    """
+    Puts running jobs whose worker has not sent a heartbeat for
+    JOB_STALE_AFTER seconds back in the queue, on the assumption that the
+    worker died. Returns how many.
+    """
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'JOB_STALE_AFTER', 600))
+    return AssessmentJob.objects.filter(status='running', heartbeat_at__lt=cutoff).update(
+        status='queued', stage='', stages=_pending_stages(), started_at=None, heartbeat_at=None
+    )
+
+
+def claim_next():
+    """
+    Atomically marks the oldest queued job as running and returns it, or
+    None when the queue is empty. Stale running jobs are requeued first.
+    The conditional UPDATE makes concurrent workers skip a job another
+    worker claimed first.
+    """
+    requeue_stale()
+    while True:
+        job_id = (
+            AssessmentJob.objects.filter(status='queued')
+            .order_by('id').values_list('id', flat=True).first()
+        )
+        if job_id is None:
+            return None
+        now = timezone.now()
+        claimed = AssessmentJob.objects.filter(id=job_id, status='queued').update(
+            status='running', started_at=now, heartbeat_at=now
+        )
+        if claimed:
+            return AssessmentJob.objects.select_related('patient', 'patient__content').get(id=job_id)
+
+
+def claim(job_id):
+    """Claims one specific job if it is still queued; returns it or None."""
+    now = timezone.now()
+    claimed = AssessmentJob.objects.filter(id=job_id, status='queued').update(
+        status='running', started_at=now, heartbeat_at=now
+    )
+    if claimed:
+        return AssessmentJob.objects.select_related('patient', 'patient__content').get(id=job_id)
+    return None
+
+
+def job_status(job):
+    """The job's status as served by JobStatusAPI and the job stream."""
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'stage': job.stage,
+        'stages': job.stages,
+        'error': job.error,
+        'results_url': reverse('results', args=[job.patient_id]) if job.status == 'done' else None,
+    }
+
+
+class JobRunner:
+    """Runs one claimed job, recording per-stage status and timings on it."""
+
+    def __init__(self, job):
+        self.job = job
+        self.patient = job.patient
+        self.drug_names = [d for d in job.drugs.split(',') if d]
+        self.timings = {}
+
+    def run(self):
+        for _event in self.events():
+            pass
+        return self.job
+
+    def events(self):
+        """
+        Runs the job, yielding (event, data) pairs as results become
+        available: "risk" with each drug's deterministic assessment (no
+        explanation yet), "assessment" with each complete assessment JSON as
+        its explanation arrives, then "done" with the final job status. If
+        the consumer stops early the job is put back in the queue.
+        """
+        job = self.job
+        try:
+            variants = self._stage('parse', self.parse)
+            predictions = self._stage('risk', lambda: self.predict(variants))
+            for prediction in predictions:
+                yield 'risk', self.risk_payload(prediction)
+
+            explanations = [None] * len(predictions)
+            with self._running('explain'):
+                for i, explanation in self.iter_explanations(predictions):
+                    explanations[i] = explanation
+                    self.heartbeat()
+                    yield 'assessment', JSONFormatter.format_output(
+                        predictions[i], explanation, self.patient.patient_id
+                    )
+            self._stage('save', lambda: self.save(variants, predictions, explanations))
+        except GeneratorExit:
+            job.status = 'queued'
+            job.stage = ''
+            job.stages = _pending_stages()
+            job.started_at = job.heartbeat_at = None
+            job.save(update_fields=['status', 'stage', 'stages', 'started_at', 'heartbeat_at'])
+            raise
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+        else:
+            job.status = 'done'
+        job.stage = ''
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'stage', 'stages', 'error', 'finished_at'])
+        yield 'done', job_status(job)
+
+    def _stage(self, name, fn):
+        with self._running(name):
+            return fn()
+
+    @contextmanager
+    def _running(self, name):
+        job = self.job
+        job.stage = name
+        job.stages[name] = {"status": "running", "seconds": None}
+        job.heartbeat_at = timezone.now()
+        job.save(update_fields=['stage', 'stages', 'heartbeat_at'])
+        try:
+            with metrics.timed(name, self.timings):
+                yield
+        except Exception:
+            job.stages[name] = {"status": "failed", "seconds": self.timings[name]}
+            raise
+        job.stages[name] = {"status": "done", "seconds": self.timings[name]}
+        job.heartbeat_at = timezone.now()
+        job.save(update_fields=['stages', 'heartbeat_at'])
+
+    def heartbeat(self):
+        """Tells requeue_stale() the job's worker is still alive."""
+        self.job.heartbeat_at = timezone.now()
+        AssessmentJob.objects.filter(id=self.job.id).update(heartbeat_at=self.job.heartbeat_at)
+
+    def parse(self):
+        return patient_variants(self.patient)
+
+    def predict(self, variants):
+        return predict(variants, self.drug_names)
+
+    def iter_explanations(self, predictions):
+        return LLMService().iter_explanations(
+            explanation_requests(predictions), mode=self.job.explanation_mode or None
+        )
+
+    def risk_payload(self, prediction):
+        """The assessment JSON without the explanation, which comes later."""
+        payload = JSONFormatter.format_output(
+            prediction, dict.fromkeys(EXPLANATION_FIELDS, ''), self.patient.patient_id
+        )
+        del payload['llm_generated_explanation']
+        del payload['quality_metrics']['llm_generation_success']
+        del payload['quality_metrics']['explanation_source']
+        return payload
+
+    def save(self, variants, predictions, explanations):
+        """
+        Saves the job's assessments and profiles. If an earlier run of the
+        same job already saved (its worker was presumed dead but finished),
+        that run's rows and counts are replaced rather than duplicated.
+        """
+        with transaction.atomic():
+            AssessmentJob.objects.select_for_update().filter(id=self.job.id).first()
+            previous = list(DrugAssessment.objects.filter(job=self.job))
+            if previous:
+                analytics.record(previous, sign=-1)
+                DrugAssessment.objects.filter(id__in=[a.id for a in previous]).delete()
+                PatientVariant.objects.filter(patient=self.patient).delete()
+            rows = assessment_rows(self.patient, predictions, explanations, self.timings)
+            for row in rows:
+                row.job = self.job
+            analytics.save_assessments(rows)
+            save_profiles([(self.patient, variants, predictions)])
+
+
+def enrich_pending(limit=50):
+    """
+    Replaces the local explanations of up to `limit` assessments flagged
+    needs_enrichment (hybrid mode) with LLM ones. Rows are claimed with a
+    conditional UPDATE so concurrent workers never enrich the same one;
+    rows whose LLM call fails keep their local text. Returns the number
+    of rows claimed.
+    """
+    ids = list(
+        DrugAssessment.objects.filter(needs_enrichment=True)
+        .order_by('id').values_list('id', flat=True)[:limit]
+    )
+    claimed = [
+        i for i in ids
+        if DrugAssessment.objects.filter(id=i, needs_enrichment=True).update(needs_enrichment=False)
+    ]
+    if not claimed:
+        return 0
+
+    assessments = list(DrugAssessment.objects.filter(id__in=claimed))
+    requests = []
+    for a in assessments:
+        profile = a.json_output.get('pharmacogenomic_profile', {})
+        requests.append({
+            'drug': a.json_output.get('drug', a.drug_name),
+            'gene': profile.get('primary_gene', 'N/A'),
+            'phenotype': profile.get('phenotype', 'N/A'),
+            'risk_label': a.risk_label,
+            'action': a.json_output.get('clinical_recommendation', {}).get('action', ''),
+            'detected_variants': profile.get('detected_variants', []),
+        })
+
+    with metrics.timed('enrich'):
+        explanations = LLMService().generate_explanations(requests, mode='llm')
+
+    now = timezone.now()
+    enriched = []
+    for a, explanation in zip(assessments, explanations):
+        if not explanation.get('success'):
+            continue
+        a.json_output['llm_generated_explanation'] = {
+            field: explanation[field] for field in EXPLANATION_FIELDS
+        }
+        a.json_output['quality_metrics']['llm_generation_success'] = True
+        a.json_output['quality_metrics']['explanation_source'] = 'llm'
+        a.updated_at = now
+        enriched.append(a)
+    DrugAssessment.objects.bulk_update(enriched, ['json_output', 'updated_at'])
+    return len(claimed)
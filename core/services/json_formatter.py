@@ -2,11 +2,12 @@ from datetime import datetime
 
 class JSONFormatter:
     @staticmethod
-    def format_output(assessment_data, llm_data, patient_id):
+    def format_output(assessment_data, llm_data, patient_id, stage_seconds=None):
         """
         Formats findings into the STRICT JSON schema required.
+        stage_seconds (pipeline stage -> seconds) is added to quality_metrics.
         """
-        return {
+        output = {
             "patient_id": str(patient_id),
             "drug": assessment_data['drug'],
             "timestamp": datetime.utcnow().isoformat() + "Z",
@@ -17,7 +18,7 @@ class JSONFormatter:
             },
             "pharmacogenomic_profile": {
                 "primary_gene": assessment_data['gene'],
-                "diplotype": assessment_data.get('diplotype', "*X/*Y"), # Simplified
+                "diplotype": assessment_data.get('diplotype', "Unknown"),
                 "phenotype": assessment_data['phenotype'],
                 "detected_variants": [
                     {
@@ -42,6 +43,14 @@ class JSONFormatter:
             "quality_metrics": {
                 "vcf_parsing_success": True,
                 "genes_detected_count": len(assessment_data.get('detected_variants', [])),
-                "llm_generation_success": llm_data.get('success', False)
+                "llm_generation_success": llm_data.get('success', False),
+                "explanation_source": llm_data.get('source', 'llm')
             }
         }
+        if assessment_data.get('guideline_version'):
+            output["quality_metrics"]["guideline_version"] = assessment_data['guideline_version']
+        if stage_seconds:
+            output["quality_metrics"]["stage_seconds"] = {
+                stage: round(seconds, 4) for stage, seconds in stage_seconds.items()
+            }
+        return output
@@ -1,51 +1,175 @@
 import os
 import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
 
+from . import metrics
+from .explanation_cache import ExplanationCache, fingerprint, prompt_inputs
+from .local_explainer import local_explanation
+
+SYSTEM_PROMPT = "You are a clinical pharmacogenomics expert. Always respond with valid JSON only."
+
+PROMPT_TEMPLATE = (
+    "Act as a clinical pharmacogenomics expert. "
+    "Provide a structured clinical explanation for the following pharmacogenomic assessment.\n\n"
+    "Drug: {drug}\n"
+    "Primary Gene: {gene}\n"
+    "Inferred Phenotype: {phenotype}\n"
+    "Risk Level: {risk_label}\n"
+    "Detected rsIDs: {detected_rsids}\n\n"
+    "Return ONLY a JSON object with exactly these four keys:\n"
+    '{{\n'
+    '  "summary": "A concise clinical summary",\n'
+    '  "biological_mechanism": "How the genetic variant affects drug metabolism or transport",\n'
+    '  "clinical_impact": "What this means for the patient (toxicity, efficacy, etc.)",\n'
+    '  "variant_evidence": "Mention the rsIDs and CPIC alignment notes"\n'
+    '}}\n\n'
+    "Keep it professional, clear, and actionable. Return ONLY valid JSON, no markdown."
+)
+
+# auto: llm when GROQ_API_KEY is set, local otherwise. hybrid: local now,
+# with the rows flagged for LLM enrichment by the job worker later.
+EXPLANATION_MODES = ('auto', 'local', 'llm', 'hybrid')
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+_executor = None
+_session = None
+_pool_lock = threading.Lock()
+
+
+def explanation_cache(model):
+    """Process-wide ExplanationCache for a model and the current prompt template."""
+    with _caches_lock:
+        if model not in _caches:
+            _caches[model] = ExplanationCache(fingerprint(model, SYSTEM_PROMPT, PROMPT_TEMPLATE))
+        return _caches[model]
+
+
+def _pool():
+    """
+    Process-wide thread pool (LLM_MAX_CONCURRENCY workers) and the
+    keep-alive requests.Session its workers share.
+    """
+    global _executor, _session
+    if _executor is None:
+        with _pool_lock:
+            if _executor is None:
+                size = getattr(settings, 'LLM_MAX_CONCURRENCY', 8)
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=size))
+                _session = session
+                _executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='llm')
+    return _executor, _session
+
 
 class LLMService:
     """LLM Service using Groq API (LLaMA models via Groq Cloud)."""
 
     GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+    DEFAULT_MODEL = "llama-3.3-70b-versatile"
 
     def __init__(self):
         self.api_key = getattr(settings, 'GROQ_API_KEY', None)
+        self.model = getattr(settings, 'GROQ_MODEL', None) or self.DEFAULT_MODEL
+        self.cache = explanation_cache(self.model)
+
+    def explanation_mode(self, mode=None):
+        """Resolves a requested (or the EXPLANATION_MODE) mode to local, llm or hybrid."""
+        mode = mode or getattr(settings, 'EXPLANATION_MODE', 'auto')
+        if mode not in EXPLANATION_MODES:
+            raise ValueError(f"Unknown explanation mode {mode!r}; use one of {', '.join(EXPLANATION_MODES)}.")
+        if mode == 'auto':
+            return 'llm' if self.api_key else 'local'
+        if mode == 'hybrid' and not self.api_key:
+            return 'local'
+        return mode
 
     def generate_explanation(self, data):
         """
-        Generates clinical explanation using Groq.
+        Generates clinical explanation using Groq, answering repeated
+        drug/gene/phenotype/risk/rsID combinations from the explanation cache.
         Expected data keys: gene, drug, phenotype, risk_label, detected_variants (list)
         """
-        if not self.api_key:
-            return {
-                "summary": "LLM Service not configured. Set GROQ_API_KEY in .env",
-                "biological_mechanism": "N/A",
-                "clinical_impact": "N/A",
-                "variant_evidence": "N/A",
-                "success": False,
-            }
+        return self.generate_explanations([data])[0]
+
+    def generate_explanations(self, items, mode=None):
+        """
+        generate_explanation() for several requests at once, returned in
+        the same order. Cache misses are sent to Groq concurrently on the
+        shared pool, at most LLM_REQUEST_CONCURRENCY at a time for this
+        call; identical requests within the batch share one API call.
+
+        In local and hybrid mode (see explanation_mode()) every explanation
+        comes from the local template engine, and hybrid ones are marked
+        "enrich". Failed or unconfigured LLM calls also fall back to it.
+        """
+        results = [None] * len(items)
+        for i, explanation in self.iter_explanations(items, mode):
+            results[i] = explanation
+        return results
+
+    def iter_explanations(self, items, mode=None):
+        """
+        Like generate_explanations(), but yields (index, explanation) pairs
+        as soon as each one is ready: cache hits first, then Groq answers
+        in completion order.
+        """
+        mode = self.explanation_mode(mode)
+        if mode != 'llm' or not self.api_key:
+            outcome = 'local' if mode != 'llm' else 'unconfigured'
+            metrics.inc('pharmaguard_llm_explanations_total', len(items), outcome=outcome)
+            for i, data in enumerate(items):
+                explanation = local_explanation(data)
+                if mode == 'hybrid':
+                    explanation['enrich'] = True
+                yield i, explanation
+            return
+
+        pending = {}
+        for i, data in enumerate(items):
+            cached = self.cache.get(data)
+            if cached is not None:
+                metrics.inc('pharmaguard_llm_explanations_total', outcome='cached')
+                yield i, cached
+            else:
+                pending.setdefault(self.cache.key(data), []).append(i)
+
+        executor, session = _pool()
+        limit = getattr(settings, 'LLM_REQUEST_CONCURRENCY', 6)
+        queued = list(pending.values())
+        running = {}
+        while queued or running:
+            while queued and len(running) < limit:
+                indices = queued.pop(0)
+                running[executor.submit(self._request_explanation, items[indices[0]], session)] = indices
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            # Cache writes stay on this thread so the pool only does network I/O.
+            for future in done:
+                indices = running.pop(future)
+                explanation = future.result()
+                metrics.inc(
+                    'pharmaguard_llm_explanations_total', len(indices),
+                    outcome='success' if explanation.get('success') else 'failure',
+                )
+                self.cache.set(items[indices[0]], explanation)
+                for i in indices:
+                    yield i, dict(explanation) if explanation.get('success') else local_explanation(items[i])
 
-        detected_rsids = ', '.join(
-            [v.get('rsid', 'unknown') for v in data.get('detected_variants', [])]
-        ) or 'None detected'
-
-        prompt = (
-            "Act as a clinical pharmacogenomics expert. "
-            "Provide a structured clinical explanation for the following pharmacogenomic assessment.\n\n"
-            f"Drug: {data.get('drug', 'N/A')}\n"
-            f"Primary Gene: {data.get('gene', 'N/A')}\n"
-            f"Inferred Phenotype: {data.get('phenotype', 'N/A')}\n"
-            f"Risk Level: {data.get('risk_label', 'N/A')}\n"
-            f"Detected rsIDs: {detected_rsids}\n\n"
-            "Return ONLY a JSON object with exactly these four keys:\n"
-            '{\n'
-            '  "summary": "A concise clinical summary",\n'
-            '  "biological_mechanism": "How the genetic variant affects drug metabolism or transport",\n'
-            '  "clinical_impact": "What this means for the patient (toxicity, efficacy, etc.)",\n'
-            '  "variant_evidence": "Mention the rsIDs and CPIC alignment notes"\n'
-            '}\n\n'
-            "Keep it professional, clear, and actionable. Return ONLY valid JSON, no markdown."
+    def _request_explanation(self, data, session=requests):
+        inputs = prompt_inputs(data)
+        prompt = PROMPT_TEMPLATE.format(
+            drug=inputs['drug'],
+            gene=inputs['gene'],
+            phenotype=inputs['phenotype'],
+            risk_label=inputs['risk_label'],
+            detected_rsids=', '.join(inputs['rsids']) or 'None detected',
         )
 
         try:
@@ -55,11 +179,11 @@ class LLMService:
             }
 
             payload = {
-                "model": "llama-3.3-70b-versatile",
+                "model": self.model,
                 "messages": [
                     {
                         "role": "system",
-                        "content": "You are a clinical pharmacogenomics expert. Always respond with valid JSON only.",
+                        "content": SYSTEM_PROMPT,
                     },
                     {
                         "role": "user",
@@ -70,12 +194,16 @@ class LLMService:
                 "max_tokens": 1024,
             }
 
-            response = requests.post(
-                self.GROQ_API_URL,
-                headers=headers,
-                json=payload,
-                timeout=30,
-            )
+            start = time.perf_counter()
+            try:
+                response = session.post(
+                    self.GROQ_API_URL,
+                    headers=headers,
+                    json=payload,
+                    timeout=30,
+                )
+            finally:
+                metrics.observe('pharmaguard_llm_request_seconds', time.perf_counter() - start)
             response.raise_for_status()
 
             result = response.json()
@@ -0,0 +1,88 @@
+import json
+import os
+from functools import lru_cache
+
+from django.conf import settings
+
+from .cpic_guidelines import current_guidelines
+
+DEFAULT_KNOWLEDGE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'data', 'explanation_knowledge.json'
+)
+
+
+def knowledge_path():
+    return getattr(settings, 'EXPLANATION_KNOWLEDGE_PATH', None) or DEFAULT_KNOWLEDGE_PATH
+
+
+@lru_cache(maxsize=None)
+def knowledge(path=None):
+    """The curated gene/drug explanation text, loaded once per path."""
+    with open(path or knowledge_path()) as handle:
+        return json.load(handle)
+
+
+@lru_cache(maxsize=4096)
+def _static_sections(drug, gene, phenotype, phenotype_name, risk_label, action):
+    """Everything except the variant evidence, which depends on the rsIDs."""
+    kb = knowledge(knowledge_path())
+    fallback = kb['fallback']
+    fields = {'drug': drug, 'gene': gene, 'phenotype': phenotype, 'action': action}
+    gene_info = kb['genes'].get(gene)
+    drug_info = kb['drugs'].get(drug)
+
+    if gene_info is None:
+        return (
+            f"No pharmacogenomic guideline covers {drug}. {action}".strip(),
+            fallback['mechanism'].format(**fields),
+            fallback['unsupported'].format(**fields),
+        )
+
+    effect = gene_info['phenotypes'].get(phenotype) or fallback['unknown_phenotype'].format(**fields)
+    mechanism = drug_info['mechanism'] if drug_info else fallback['mechanism'].format(**fields)
+    impact = (drug_info or {}).get('impacts', {}).get(risk_label) or fallback['impact'].format(**fields)
+    status = f"{gene} {phenotype_name} ({phenotype})" if phenotype_name else f"{gene} phenotype {phenotype}"
+    return (
+        f"{drug}: {risk_label} for a {status}. {action}".strip(),
+        f"{gene_info['role']} {effect} {mechanism}",
+        impact,
+    )
+
+
+def local_explanation(data):
+    """
+    Template-based explanation from the knowledge file, with the same four
+    sections as an LLM explanation. Takes the explanation request dict
+    (drug, gene, phenotype, risk_label, action, detected_variants).
+    """
+    drug = str(data.get('drug', 'N/A')).strip().upper()
+    gene = data.get('gene', 'N/A')
+    phenotype = data.get('phenotype', 'Unknown')
+    gene_phenotypes = current_guidelines().gene_phenotypes
+    summary, mechanism, impact = _static_sections(
+        drug, gene, phenotype, gene_phenotypes.get(gene, {}).get(phenotype),
+        data.get('risk_label', 'Unknown'), data.get('action', ''),
+    )
+
+    variants = data.get('detected_variants', [])
+    if gene not in gene_phenotypes:
+        evidence = knowledge(knowledge_path())['fallback']['unsupported_evidence'].format(drug=drug)
+    elif variants:
+        listed = ', '.join(f"{v.get('rsid') or 'unknown'} ({v.get('genotype', '?')})" for v in variants)
+        evidence = f"Detected {gene} variants: {listed}."
+    else:
+        evidence = f"No {gene} variants were detected; reference alleles are assumed."
+    if gene in gene_phenotypes:
+        evidence += (
+            f" Recommendation follows the CPIC guideline for {drug.lower()} "
+            f"(https://cpicpgx.org/guidelines/guideline-for-{drug.lower()}/)."
+        )
+
+    return {
+        "summary": summary,
+        "biological_mechanism": mechanism,
+        "clinical_impact": impact,
+        "variant_evidence": evidence,
+        "success": False,
+        "source": "local",
+    }
@@ -0,0 +1,247 @@
+"""
+In-process counters and latency histograms, rendered in the Prometheus
+text exposition format by MetricsView.
+
+Every process (web workers, job workers) records into its own registry.
+When METRICS_DIR is set, each one also writes a snapshot there at most
+every METRICS_FLUSH_INTERVAL seconds, and the metrics endpoint sums the
+snapshots of all processes. Snapshots of processes that have exited are
+folded into metrics-exited.json, so their counts survive and the
+directory does not grow with every restarted worker.
+"""
+import atexit
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# name -> (type, help)
+METRICS = {
+    'pharmaguard_stage_seconds': ('histogram', "Pipeline stage latency."),
+    'pharmaguard_llm_request_seconds': ('histogram', "Groq API round-trip latency."),
+    'pharmaguard_llm_explanations_total': (
+        'counter', "Explanations by outcome (success, failure, cached, local, unconfigured)."
+    ),
+    'pharmaguard_uploads_total': ('counter', "VCF uploads received, by source."),
+    'pharmaguard_vcf_bytes_parsed_total': ('counter', "Uncompressed VCF bytes parsed."),
+    'pharmaguard_variants_kept_total': ('counter', "Pharmacogene variants kept by the parser."),
+}
+
+EXITED = 'metrics-exited.json'
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.flushed_at = 0.0
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self._maybe_flush()
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # Per-bucket (non-cumulative) counts, then sum and count.
+                histogram = self.histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += seconds
+            histogram[-1] += 1
+        self._maybe_flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(h)] for (name, labels), h in self.histograms.items()],
+            }
+
+    def _maybe_flush(self, force=False):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+        now = time.monotonic()
+        with self.lock:
+            if not force and now - self.flushed_at < interval:
+                return
+            self.flushed_at = now
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"metrics-{os.getpid()}.json")
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as handle:
+            json.dump(self.snapshot(), handle)
+        os.replace(tmp, path)
+
+
+registry = Registry()
+atexit.register(lambda: registry._maybe_flush(force=True))
+
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    registry.observe(name, seconds, **labels)
+
+
+@contextmanager
+def timed(stage, timings=None):
+    """
+    Records the block's duration under pharmaguard_stage_seconds{stage=...}
+    and, when given, in the timings dict.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        observe('pharmaguard_stage_seconds', seconds, stage=stage)
+        if timings is not None:
+            timings[stage] = seconds
+
+
+def record_parse(size, variants):
+    inc('pharmaguard_vcf_bytes_parsed_total', size)
+    inc('pharmaguard_variants_kept_total', len(variants))
+
+
+def _pid(path):
+    """The process ID in a metrics-<pid>.json name, None for the aggregate."""
+    name = os.path.basename(path)[len('metrics-'):-len('.json')]
+    return int(name) if name.isdigit() else None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(snapshots):
+    """Sums snapshots into {(name, labels): value} and {(name, labels): values}."""
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                merged[i] += value
+    return counters, histograms
+
+
+def prune(directory):
+    """
+    Folds the snapshots of exited processes into metrics-exited.json and
+    removes them. PIDs are only meaningful on this host, so METRICS_DIR
+    must not be shared between hosts or containers.
+    """
+    own = os.getpid()
+    dead = [
+        path for path in glob.glob(os.path.join(directory, 'metrics-*.json'))
+        if _pid(path) not in (None, own) and not _alive(_pid(path))
+    ]
+    if not dead:
+        return
+    with open(os.path.join(directory, 'metrics.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        aggregate = os.path.join(directory, EXITED)
+        snapshots = [snapshot for snapshot in map(_read, [aggregate, *dead]) if snapshot]
+        counters, histograms = _merge(snapshots)
+        tmp = f"{aggregate}.{own}.tmp"
+        with open(tmp, 'w') as handle:
+            json.dump({
+                'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+                'histograms': [[name, labels, values] for (name, labels), values in histograms.items()],
+            }, handle)
+        os.replace(tmp, aggregate)
+        for path in dead:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _snapshots():
+    """This process's live registry plus the other processes' snapshots."""
+    snapshots = [registry.snapshot()]
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if directory:
+        prune(directory)
+        own = f"metrics-{os.getpid()}.json"
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            if os.path.basename(path) == own:
+                continue
+            snapshot = _read(path)
+            if snapshot is not None:
+                snapshots.append(snapshot)
+    return snapshots
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def render():
+    """All metrics in Prometheus text format (version 0.0.4)."""
+    counters, histograms = _merge(_snapshots())
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+        else:
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS, values):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {values[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {values[-2]}")
+                lines.append(f"{name}_count{_labels(labels)} {values[-1]}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,141 @@
+import os
+
+from django.db import transaction
+
+from core.models import DrugAssessment, GuidelineVersion, PatientVariant, PatientGenePhenotype
+from . import metrics
+from .cpic_guidelines import loaded_guidelines
+from .vcf_parser import VCFParser
+from .risk_engine import RiskEngine
+from .json_formatter import JSONFormatter
+
+
+def parse_variants(path):
+    """Validated, parsed variants of a stored VCF; raises ValueError on failure."""
+    parser = VCFParser(path)
+    validation_ok, msg = parser.validate()
+    if not validation_ok:
+        raise ValueError(msg)
+    parsing_results = parser.parse()
+    if not parsing_results['success']:
+        raise ValueError(parsing_results['error'])
+    metrics.record_parse(os.path.getsize(path), parsing_results['variants'])
+    return parsing_results['variants']
+
+
+def predict(variants, drug_names):
+    """RiskEngine predictions for drug_names, each tagged with its drug."""
+    predictions = RiskEngine(variants).predict_many(drug_names)
+    for drug_name, prediction in zip(drug_names, predictions):
+        prediction['drug'] = drug_name
+    return predictions
+
+
+def explanation_requests(predictions):
+    return [
+        {
+            'drug': prediction['drug'],
+            'gene': prediction['gene'],
+            'phenotype': prediction['phenotype'],
+            'risk_label': prediction['risk_label'],
+            'action': prediction.get('action', ''),
+            'detected_variants': prediction.get('detected_variants', []),
+        }
+        for prediction in predictions
+    ]
+
+
+def assessment_rows(patient, predictions, explanations, stage_seconds=None):
+    """
+    Unsaved DrugAssessment rows for a patient's predictions; stage_seconds
+    is recorded in each row's quality_metrics.
+    """
+    return [
+        DrugAssessment(
+            patient=patient,
+            drug_name=prediction['drug'],
+            risk_label=prediction['risk_label'],
+            confidence_score=prediction['confidence_score'],
+            severity=prediction['severity'],
+            json_output=JSONFormatter.format_output(
+                prediction, explanation, patient.patient_id, stage_seconds
+            ),
+            needs_enrichment=bool(explanation.get('enrich')),
+            guideline_version=prediction.get('guideline_version', ''),
+            gene=prediction['gene'],
+            phenotype_call=prediction.get('phenotype_call', ''),
+        )
+        for prediction, explanation in zip(predictions, explanations)
+    ]
+
+
+def variant_rows(patient, variants):
+    """Unsaved PatientVariant rows for parsed (or detected) variants."""
+    return [
+        PatientVariant(
+            patient=patient,
+            rsid=v.get('rsid') or '',
+            gene=v['gene'],
+            chromosome=v['chromosome'],
+            position=int(v['position']),
+            genotype=v.get('genotype', 'Unknown'),
+        )
+        for v in variants
+    ]
+
+
+def gene_phenotype_rows(patient, profiles):
+    """
+    Unsaved PatientGenePhenotype rows, one per gene, from prediction dicts
+    or stored pharmacogenomic_profile blocks (gene/primary_gene, diplotype,
+    phenotype_call or phenotype, activity_score). The caller's phenotype
+    code is stored, not the rule-resolved phenotype, so profiles whose call
+    has no rule are still found by it. Unsupported drugs (gene "N/A") are
+    skipped.
+    """
+    rows = {}
+    for profile in profiles:
+        gene = profile.get('gene') or profile.get('primary_gene')
+        if not gene or gene == 'N/A' or gene in rows:
+            continue
+        rows[gene] = PatientGenePhenotype(
+            patient=patient,
+            gene=gene,
+            diplotype=profile.get('diplotype') or 'Unknown',
+            phenotype=profile.get('phenotype_call') or profile.get('phenotype') or 'Unknown',
+            activity_score=profile.get('activity_score'),
+        )
+    return list(rows.values())
+
+
+_recorded_guidelines = set()
+
+
+def record_guidelines(versions):
+    """
+    Stores a GuidelineVersion snapshot of each guideline version (once per
+    process), so reassess_guidelines can later diff it against a newer one.
+    """
+    for version in set(versions) - _recorded_guidelines:
+        guidelines = loaded_guidelines(version)
+        if guidelines is None:
+            continue
+        GuidelineVersion.objects.get_or_create(version=version, defaults={'content': guidelines.raw})
+        transaction.on_commit(lambda version=version: _recorded_guidelines.add(version))
+
+
+def save_profiles(patient_rows):
+    """
+    Bulk-inserts the normalized variant and phenotype rows for
+    (patient, variants, predictions) triples and records the guideline
+    versions the predictions used; call inside the transaction that writes
+    the assessments.
+    """
+    variants, phenotypes, versions = [], [], set()
+    for patient, patient_variants, predictions in patient_rows:
+        variants.extend(variant_rows(patient, patient_variants))
+        phenotypes.extend(gene_phenotype_rows(patient, predictions))
+        versions.update(p['guideline_version'] for p in predictions if p.get('guideline_version'))
+    PatientVariant.objects.bulk_create(variants, batch_size=1000)
+    PatientGenePhenotype.objects.bulk_create(phenotypes, batch_size=1000, ignore_conflicts=True)
+    record_guidelines(versions)
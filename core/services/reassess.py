@@ -0,0 +1,185 @@
+"""
+Re-evaluation of stored assessments after a guideline change.
+
+The old and new rule tables are diffed into the (gene, phenotype call)
+keys whose outcome changed, the assessment_rule_key_idx index finds the
+rows stored under those keys, and only those rows are recomputed from
+their stored variants. Explanations are regenerated only for rows whose
+risk label changed.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from core.models import DrugAssessment, GuidelineVersion, PatientGenePhenotype
+from . import analytics
+from .cpic_guidelines import parse_guidelines
+from .json_formatter import JSONFormatter
+from .llm_service import LLMService
+from .pipeline import explanation_requests, gene_phenotype_rows, predict, record_guidelines
+from .risk_engine import resolve_rule
+from .vcf_store import patient_variants
+
+
+def stale_versions(current):
+    """Guideline versions of stored assessments other than `current` ('' = unversioned)."""
+    return list(
+        DrugAssessment.objects.exclude(guideline_version=current.version)
+        .order_by('guideline_version').values_list('guideline_version', flat=True).distinct()
+    )
+
+
+def snapshot(version):
+    """The Guidelines recorded for `version`, or None if it was never stored."""
+    stored = GuidelineVersion.objects.filter(version=version).first()
+    return parse_guidelines(bytes(stored.content), require_rules=False) if stored else None
+
+
+def rule_changes(old, new):
+    """
+    Diffs two Guidelines. Returns ({(gene, phenotype): drugs}, {gene: drugs}):
+    the rule keys whose outcome changed, and drugs whose rows all need
+    recomputing because their gene or its activity bands changed, keyed by
+    the gene ('N/A' if unsupported) their rows were stored under. Drugs
+    are the upper-cased rule names.
+    """
+    keyed, whole = {}, {}
+    for drug in set(old.drug_gene) | set(new.drug_gene):
+        gene = old.drug_gene.get(drug)
+        if gene != new.drug_gene.get(drug) or (
+            old.activity_phenotypes.get(gene) != new.activity_phenotypes.get(gene)
+        ):
+            whole.setdefault(gene or 'N/A', set()).add(drug)
+            continue
+        phenotypes = {'NM', *old.rules.get(drug, {}).get(gene, {}), *new.rules.get(drug, {}).get(gene, {})}
+        for phenotype in phenotypes:
+            if any(
+                resolve_rule(old.rules, drug, gene, phenotype, has_variants)
+                != resolve_rule(new.rules, drug, gene, phenotype, has_variants)
+                for has_variants in (False, True)
+            ):
+                keyed.setdefault((gene, phenotype), set()).add(drug)
+    return keyed, whole
+
+
+def last_assessment_id(version):
+    """Highest id stored under `version`, or 0; taken before diffing."""
+    return DrugAssessment.objects.filter(guideline_version=version).aggregate(last=Max('id'))['last'] or 0
+
+
+def mark_unaffected(version, current, up_to):
+    """
+    Moves the rows of `version` up to id `up_to` to the current version in
+    one UPDATE, so later runs don't diff them again. Call after reassess()
+    has updated the affected ones: every row left is one the diff showed
+    the rule change doesn't touch. Rows stored since the diff keep their
+    version for the next run. Returns the number of rows moved.
+    """
+    return DrugAssessment.objects.filter(guideline_version=version, id__lte=up_to).update(
+        guideline_version=current.version
+    )
+
+
+def affected_assessments(version, keyed, whole):
+    """Ids of the assessments stored under `version` that rule_changes() affects."""
+    query = Q()
+    for gene, phenotype in keyed:
+        query |= Q(gene=gene, phenotype_call=phenotype)
+    for gene in whole:
+        query |= Q(gene=gene)
+    if not query:
+        return []
+
+    rows = (
+        DrugAssessment.objects.filter(query, guideline_version=version)
+        .order_by('id').values_list('id', 'drug_name', 'gene', 'phenotype_call')
+    )
+    ids = []
+    for assessment_id, drug_name, gene, phenotype in rows.iterator():
+        drug = drug_name.upper().strip()
+        if drug in whole.get(gene, ()) or drug in keyed.get((gene, phenotype), ()):
+            ids.append(assessment_id)
+    return ids
+
+
+def reassess(ids, batch_size=500, explanation_mode=None):
+    """
+    Recomputes the given assessments with the current guidelines, in
+    batches of batch_size. Returns (rows updated, rows relabelled).
+    """
+    updated = relabelled = 0
+    for start in range(0, len(ids), batch_size):
+        batch_updated, batch_relabelled = _reassess_batch(ids[start:start + batch_size], explanation_mode)
+        updated += batch_updated
+        relabelled += batch_relabelled
+    return updated, relabelled
+
+
+def _stored_explanation(json_output):
+    quality = json_output.get('quality_metrics', {})
+    return {
+        **json_output.get('llm_generated_explanation', {}),
+        'success': quality.get('llm_generation_success', False),
+        'source': quality.get('explanation_source', 'llm'),
+    }
+
+
+def _reassess_batch(ids, explanation_mode):
+    rows = list(
+        DrugAssessment.objects.filter(id__in=ids)
+        .select_related('patient', 'patient__content').order_by('patient_id', 'id')
+    )
+    by_patient = {}
+    for row in rows:
+        by_patient.setdefault(row.patient_id, []).append(row)
+
+    predictions, profiles = {}, []
+    for patient_rows in by_patient.values():
+        patient = patient_rows[0].patient
+        patient_predictions = predict(patient_variants(patient), [row.drug_name for row in patient_rows])
+        for row, prediction in zip(patient_rows, patient_predictions):
+            predictions[row.id] = prediction
+        profiles.extend(gene_phenotype_rows(patient, patient_predictions))
+
+    relabelled = [row.id for row in rows if predictions[row.id]['risk_label'] != row.risk_label]
+    explanations = {}
+    if relabelled:
+        explanations = dict(zip(relabelled, LLMService().generate_explanations(
+            explanation_requests([predictions[i] for i in relabelled]), mode=explanation_mode
+        )))
+
+    old_keys = [analytics.counter_key(row) for row in rows]
+    now = timezone.now()
+    for row in rows:
+        prediction = predictions[row.id]
+        explanation = explanations.get(row.id) or _stored_explanation(row.json_output)
+        stage_seconds = row.json_output.get('quality_metrics', {}).get('stage_seconds')
+        row.json_output = JSONFormatter.format_output(prediction, explanation, row.patient.patient_id)
+        if stage_seconds:
+            row.json_output['quality_metrics']['stage_seconds'] = stage_seconds
+        row.risk_label = prediction['risk_label']
+        row.severity = prediction['severity']
+        row.confidence_score = prediction['confidence_score']
+        row.guideline_version = prediction['guideline_version']
+        row.gene = prediction['gene']
+        row.phenotype_call = prediction.get('phenotype_call', '')
+        if row.id in explanations:
+            row.needs_enrichment = bool(explanation.get('enrich'))
+        row.updated_at = now
+
+    with transaction.atomic():
+        DrugAssessment.objects.bulk_update(rows, [
+            'risk_label', 'severity', 'confidence_score', 'json_output', 'guideline_version',
+            'gene', 'phenotype_call', 'needs_enrichment', 'updated_at',
+        ])
+        PatientGenePhenotype.objects.bulk_create(
+            profiles, update_conflicts=True, unique_fields=['patient', 'gene'],
+            update_fields=['diplotype', 'phenotype', 'activity_score'],
+        )
+        record_guidelines({prediction['guideline_version'] for prediction in predictions.values()})
+        deltas = Counter(map(analytics.counter_key, rows))
+        deltas.subtract(old_keys)
+        analytics.adjust(deltas)
+    return len(rows), len(relabelled)
@@ -1,68 +1,239 @@
-from .cpic_guidelines import RULES, DRUG_GENE_MAPPING
+import numpy as np
 
-class RiskEngine:
-    def __init__(self, variants):
-        self.variants = variants
+from .cpic_guidelines import current_guidelines
+from .diplotype_caller import diplotype_callers, observed_copies
 
-    def predict(self, drug_name):
-        drug_name = drug_name.upper().strip()
-        gene = DRUG_GENE_MAPPING.get(drug_name)
-        
-        if not gene:
-            return {
-                "risk_label": "Unknown",
-                "severity": "Low",
-                "confidence_score": 0.0,
-                "action": "Drug not supported in current database.",
-                "gene": "N/A",
-                "phenotype": "Unknown"
-            }
-
-        # Find variants for this gene
-        gene_variants = [v for v in self.variants if v['gene'] == gene]
-        
-        # Logic to determine phenotype from variants (simplified for hackathon)
-        phenotype = self._infer_phenotype(gene, gene_variants)
-        
-        rule = RULES.get(drug_name, {}).get(gene, {}).get(phenotype)
-        
-        if rule:
-            return {
-                "risk_label": rule["risk"],
-                "severity": rule["severity"],
-                "confidence_score": 0.95 if gene_variants else 0.5,
-                "action": rule["action"],
-                "gene": gene,
-                "phenotype": phenotype,
-                "detected_variants": gene_variants
-            }
-        
+# Gene call used when a gene has no allele definitions to call from.
+UNCALLED = {"diplotype": "Unknown", "activity_score": None, "phenotype": "NM"}
+
+
+def resolve_rule(rules, drug_name, gene, phenotype, has_variants):
+    """Maps (drug, gene, phenotype) to the prediction fields via the guideline rules."""
+    if not gene:
         return {
-            "risk_label": "Safe", # Default if no risk variants found
+            "risk_label": "Unknown",
             "severity": "Low",
-            "confidence_score": 0.8,
-            "action": "No specific risk variants detected for this gene.",
+            "confidence_score": 0.0,
+            "action": "Drug not supported in current database.",
+            "gene": "N/A",
+            "phenotype": "Unknown"
+        }
+
+    rule = rules.get(drug_name, {}).get(gene, {}).get(phenotype)
+
+    if rule:
+        return {
+            "risk_label": rule["risk"],
+            "severity": rule["severity"],
+            "confidence_score": 0.95 if has_variants else 0.5,
+            "action": rule["action"],
             "gene": gene,
-            "phenotype": "Normal Metabolizer",
-            "detected_variants": gene_variants
+            "phenotype": phenotype,
         }
 
-    def _infer_phenotype(self, gene, variants):
+    return {
+        "risk_label": "Safe", # Default if no risk variants found
+        "severity": "Low",
+        "confidence_score": 0.8,
+        "action": "No specific risk variants detected for this gene.",
+        "gene": gene,
+        "phenotype": phenotype,
+    }
+
+
+class CompiledRules:
+    """
+    One Guidelines version's rules and drug-gene mapping compiled into
+    integer-coded tables.
+
+    Drugs, genes and phenotypes are numbered once; every possible outcome of
+    resolve_rule() is precomputed into outcomes, and table[drug, phenotype,
+    has_variants] holds the outcome number. The same table serves the
+    per-patient path (as nested lists) and the cohort path (as an array).
+    """
+
+    def __init__(self, guidelines):
+        self.guidelines = guidelines
+        self.version = guidelines.version
+        rules = guidelines.rules
+        self.drugs = tuple(guidelines.drug_gene)
+        self.drug_index = {drug: i for i, drug in enumerate(self.drugs)}
+        self.drug_gene = tuple(guidelines.drug_gene[drug] for drug in self.drugs)
+
+        phenotypes = {
+            phenotype
+            for genes in rules.values()
+            for gene_rules in genes.values()
+            for phenotype in gene_rules
+        }
+        phenotypes.update(ph for bands in guidelines.activity_phenotypes.values() for _, ph in bands)
+        phenotypes.discard('NM')
+        # Code 0 is the default "NM" phenotype.
+        self.phenotypes = ('NM',) + tuple(sorted(phenotypes))
+        self.phenotype_index = {ph: i for i, ph in enumerate(self.phenotypes)}
+
+        self.outcomes = []
+        interned = {}
+        table = np.zeros((len(self.drugs), len(self.phenotypes), 2), dtype=np.int32)
+        for d, drug in enumerate(self.drugs):
+            for p, phenotype in enumerate(self.phenotypes):
+                for has_variants in (0, 1):
+                    outcome = resolve_rule(rules, drug, self.drug_gene[d], phenotype, bool(has_variants))
+                    key = tuple(outcome.items())
+                    if key not in interned:
+                        interned[key] = len(self.outcomes)
+                        self.outcomes.append(outcome)
+                    table[d, p, has_variants] = interned[key]
+        self.table = table
+        self.table_rows = table.tolist()
+        self.unknown = resolve_rule(rules, None, None, None, False)
+        self.unknown["diplotype"] = "N/A"
+        self.unknown["guideline_version"] = self.version
+
+
+_compiled = None
+
+
+def compiled_rules():
+    """
+    CompiledRules of the current guideline version, compiled once per
+    version. Callers hold on to the object they got, so a hot reload never
+    changes the rules under an assessment that is already running.
+    """
+    global _compiled
+    guidelines = current_guidelines()
+    compiled = _compiled
+    if compiled is None or compiled.guidelines is not guidelines:
+        compiled = _compiled = CompiledRules(guidelines)
+    return compiled
+
+
+class RiskEngine:
+    def __init__(self, variants):
+        self.variants = variants
+        # Group variants by gene once per patient; every drug reuses it.
+        self.variants_by_gene = {}
+        for v in variants:
+            self.variants_by_gene.setdefault(v['gene'], []).append(v)
+        self._gene_calls = {}
+
+    def predict(self, drug_name):
+        return self.predict_many([drug_name])[0]
+
+    def predict_many(self, drug_names):
+        """Assesses several drugs for this patient in one pass."""
+        rules = compiled_rules()
+        results = []
+        for drug_name in drug_names:
+            d = rules.drug_index.get(drug_name.upper().strip())
+            if d is None:
+                results.append(dict(rules.unknown))
+                continue
+
+            gene = rules.drug_gene[d]
+            gene_variants = self.variants_by_gene.get(gene, [])
+            gene_call = self._gene_call(gene, rules)
+            phenotype = rules.phenotype_index[gene_call["phenotype"]]
+            prediction = dict(rules.outcomes[rules.table_rows[d][phenotype][bool(gene_variants)]])
+            prediction["diplotype"] = gene_call["diplotype"]
+            prediction["activity_score"] = gene_call["activity_score"]
+            prediction["detected_variants"] = list(gene_variants)
+            prediction["phenotype_call"] = gene_call["phenotype"]
+            prediction["guideline_version"] = rules.version
+            results.append(prediction)
+        return results
+
+    def _gene_call(self, gene, rules):
         """
-        Infers phenotype from variants. 
-        In production, this would use a diplotype caller like Aldy or Stargazer.
-        For the hackathon, we use simple rule-of-thumb inference.
+        Diplotype, activity score and phenotype of one gene, called once per
+        patient and CompiledRules version.
         """
-        if not variants:
-            return "NM" # Default to Normal Metabolizer if no variants found
-        
-        # Example: if rs12248560 (*17) is found in CYP2C19, it might be UM
-        # If rs1057910 (*3) is found in CYP2C9, it might be PM
-        for v in variants:
-            if v['rsid'] == 'rs12248560': return 'UM'
-            if v['rsid'] == 'rs1057910': return 'PM'
-            if v['rsid'] == 'rs4149056': return 'deficient'
-            if v['rsid'] == 'rs1142345': return 'low'
-            if v['rsid'] == 'rs1801133': return 'deficient'
-        
-        return "NM"
+        gene_call = self._gene_calls.get((gene, rules.version))
+        if gene_call is None:
+            caller = diplotype_callers().get(gene)
+            variants = self.variants_by_gene.get(gene, [])
+            gene_call = self._gene_calls[gene, rules.version] = (
+                caller.call([(v, observed_copies(v)) for v in variants], rules.guidelines.activity_phenotypes)
+                if caller else UNCALLED
+            )
+        return gene_call
+
+    @staticmethod
+    def predict_cohort(cohort, drug_names):
+        """
+        Vectorized predict() over a VCFParser.parse_cohort() result.
+
+        Each sample gets what predict_many() returns for its own
+        single-sample VCF: detected_variants are all sites of the drug's
+        gene with that sample's genotype, whether or not it carries them.
+        Returns one list of predictions (in drug_names order) per sample.
+        """
+        rules = compiled_rules()
+        sites = cohort["sites"]
+        genotypes = cohort["genotypes"]
+        n_samples = genotypes.shape[0]
+
+        gene_columns = {}
+        for column, site in enumerate(sites):
+            gene_columns.setdefault(site["gene"], []).append(column)
+
+        # Per gene: phenotype code and diplotype call of every sample plus its
+        # genotype at each site. Samples share a handful of dosage patterns,
+        # so the caller runs once per distinct pattern rather than once per
+        # sample.
+        callers = diplotype_callers()
+        activity_phenotypes = rules.guidelines.activity_phenotypes
+        gene_calls = {}
+        for gene, columns in gene_columns.items():
+            columns = np.array(columns)
+            dosages = (genotypes[:, columns, :] > 0).sum(axis=2)
+            patterns, inverse = np.unique(dosages, axis=0, return_inverse=True)
+            pattern_calls = [
+                callers[gene].call([
+                    (sites[columns[i]], int(copies)) for i, copies in enumerate(pattern)
+                ], activity_phenotypes) if gene in callers else UNCALLED
+                for pattern in patterns.tolist()
+            ]
+            pattern_codes = np.array([rules.phenotype_index[c["phenotype"]] for c in pattern_calls])
+            phenotypes = pattern_codes[inverse.reshape(-1)]
+            sample_calls = [pattern_calls[i] for i in inverse.reshape(-1).tolist()]
+            gene_sites = [sites[column] for column in columns.tolist()]
+            labels = {}
+            detected = []
+            for calls in genotypes[:, columns].tolist():
+                variants = []
+                for site, call in zip(gene_sites, calls):
+                    key = tuple(call)
+                    label = labels.get(key)
+                    if label is None:
+                        label = labels[key] = "/".join(str(a) if a >= 0 else "." for a in call)
+                    variant = dict(site)
+                    variant["genotype"] = label
+                    variants.append(variant)
+                detected.append(variants)
+            gene_calls[gene] = (phenotypes, np.ones(n_samples, dtype=bool), detected, sample_calls)
+
+        empty = [[] for _ in range(n_samples)]
+        no_calls = (
+            np.zeros(n_samples, dtype=np.int64), np.zeros(n_samples, dtype=bool), empty,
+            [UNCALLED] * n_samples,
+        )
+        results = [[] for _ in range(n_samples)]
+        for drug_name in drug_names:
+            d = rules.drug_index.get(drug_name.upper().strip())
+            if d is None:
+                for sample_results in results:
+                    sample_results.append(dict(rules.unknown))
+                continue
+
+            phenotypes, has_variants, detected, sample_calls = gene_calls.get(rules.drug_gene[d], no_calls)
+            outcome_ids = rules.table[d, phenotypes, has_variants.astype(np.int64)].tolist()
+            for sample, sample_results in enumerate(results):
+                prediction = dict(rules.outcomes[outcome_ids[sample]])
+                prediction["diplotype"] = sample_calls[sample]["diplotype"]
+                prediction["activity_score"] = sample_calls[sample]["activity_score"]
+                prediction["detected_variants"] = detected[sample]
+                prediction["phenotype_call"] = sample_calls[sample]["phenotype"]
+                prediction["guideline_version"] = rules.version
+                sample_results.append(prediction)
+        return results
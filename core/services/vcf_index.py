@@ -0,0 +1,379 @@
+import os
+import struct
+import threading
+import zlib
+from contextlib import closing
+
+from .allele_index import definitions_path, read_definitions
+from .vcf_parser import iter_lines, read_chunks
+
+# Query windows are the allele-definition sites, padded so an indel whose
+# POS anchors just before a site is still read; sites closer than
+# REGION_GAP are queried as one window.
+REGION_PADDING = 1000
+REGION_GAP = 10000
+
+# The allele definitions use GRCh38 coordinates. An index is only used for a
+# file whose ##contig lengths say GRCh38 too; anything else (GRCh37, no
+# contig lengths) is streamed, where rsIDs are matched wherever they are.
+GRCH38_LENGTHS = {
+    '1': 248956422, '2': 242193529, '3': 198295559, '4': 190214555, '5': 181538259,
+    '6': 170805979, '7': 159345973, '8': 145138636, '9': 138394717, '10': 133797422,
+    '11': 135086622, '12': 133275309, '13': 114364328, '14': 107043718, '15': 101991189,
+    '16': 90338345, '17': 83257441, '18': 80373285, '19': 58617616, '20': 64444167,
+    '21': 46709983, '22': 50818468, 'X': 156040895, 'Y': 57227415,
+}
+
+TABIX_MIN_SHIFT = 14
+TABIX_DEPTH = 5
+
+# Uncompressed bytes per BGZF block (htslib's default) and the empty block
+# that terminates a BGZF file.
+BGZF_BLOCK_SIZE = 0xff00
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+
+class BGZFReader:
+    """Random access to a BGZF file through htslib-style virtual offsets."""
+
+    def __init__(self, file_path):
+        self.handle = open(file_path, 'rb')
+
+    def close(self):
+        self.handle.close()
+
+    def read_block(self, coffset):
+        """Returns (decompressed data, compressed size) of the block at coffset."""
+        self.handle.seek(coffset)
+        header = self.handle.read(18)
+        if len(header) < 18 or header[:4] != b'\x1f\x8b\x08\x04':
+            raise ValueError(f"Not a BGZF block at offset {coffset}.")
+        xlen = struct.unpack('<H', header[10:12])[0]
+        extra = header[12:] + self.handle.read(xlen - 6)
+        bsize = None
+        pos = 0
+        while pos + 4 <= len(extra):
+            si1, si2, slen = extra[pos], extra[pos + 1], struct.unpack('<H', extra[pos + 2:pos + 4])[0]
+            if si1 == 66 and si2 == 67:
+                bsize = struct.unpack('<H', extra[pos + 4:pos + 6])[0]
+            pos += 4 + slen
+        if bsize is None:
+            raise ValueError(f"BGZF block at offset {coffset} has no BC field.")
+        cdata = self.handle.read(bsize - xlen - 19)
+        self.handle.read(8)  # CRC32 + ISIZE
+        return zlib.decompress(cdata, -15), bsize + 1
+
+    def read_range(self, start, end):
+        """Decompresses the bytes between two virtual offsets."""
+        coffset, uoffset = start >> 16, start & 0xFFFF
+        end_coffset, end_uoffset = end >> 16, end & 0xFFFF
+        parts = []
+        while coffset <= end_coffset:
+            data, size = self.read_block(coffset)
+            stop = end_uoffset if coffset == end_coffset else len(data)
+            parts.append(data[uoffset:stop])
+            coffset += size
+            uoffset = 0
+        return b''.join(parts)
+
+
+class BGZFWriter:
+    """
+    Writes a BGZF (bgzip) stream to a binary file object: gzip members of at
+    most BGZF_BLOCK_SIZE uncompressed bytes carrying the BC block-size field,
+    so the output can be tabix-indexed and read with BGZFReader.
+    """
+
+    def __init__(self, handle, level=6):
+        self.handle = handle
+        self.level = level
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= BGZF_BLOCK_SIZE:
+            self._write_block(bytes(self.buffer[:BGZF_BLOCK_SIZE]))
+            del self.buffer[:BGZF_BLOCK_SIZE]
+
+    def close(self):
+        """Writes the pending block and the EOF marker; the handle stays open."""
+        if self.buffer:
+            self._write_block(bytes(self.buffer))
+            self.buffer.clear()
+        self.handle.write(BGZF_EOF)
+
+    def _write_block(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        cdata = compressor.compress(data) + compressor.flush()
+        self.handle.write(
+            struct.pack('<4BI2BH2BHH', 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, 66, 67, 2, len(cdata) + 25)
+            + cdata
+            + struct.pack('<II', zlib.crc32(data), len(data))
+        )
+
+
+def reg2bins(beg, end, min_shift, depth):
+    """Bins overlapping [beg, end) in the UCSC/htslib binning scheme."""
+    bins = []
+    end -= 1
+    shift = min_shift + depth * 3
+    offset = 0
+    for level in range(depth + 1):
+        bins.extend(range(offset + (beg >> shift), offset + (end >> shift) + 1))
+        shift -= 3
+        offset += 1 << (level * 3)
+    return bins
+
+
+_regions = {}
+_regions_lock = threading.Lock()
+
+
+def definition_regions(tsv_path=None):
+    """
+    BED-style (chrom, beg, end, gene) windows, 0-based half-open and
+    disjoint, around every site of the allele-definition TSV (gene is that
+    of the window's first site); re-read when the file changes.
+    """
+    tsv_path = tsv_path or definitions_path()
+    key = (tsv_path, os.stat(tsv_path).st_mtime_ns)
+    with _regions_lock:
+        if key not in _regions:
+            sites = sorted(
+                (row['chrom'], int(row['pos']), row['gene']) for row in read_definitions(tsv_path)
+            )
+            regions = []
+            for chrom, pos, gene in sites:
+                beg, end = max(0, pos - 1 - REGION_PADDING), pos + REGION_PADDING
+                last = regions[-1] if regions else None
+                if last and last[0] == chrom and beg <= last[2] + REGION_GAP:
+                    last[2] = max(last[2], end)
+                else:
+                    regions.append([chrom, beg, end, gene])
+            _regions.clear()
+            _regions[key] = [tuple(region) for region in regions]
+        return _regions[key]
+
+
+def _bare_chrom(chrom):
+    return chrom[3:] if chrom.startswith('chr') else chrom
+
+
+def _find_ref(names, chrom):
+    """Index of chrom in the contig names, accepting either chr-prefix style."""
+    bare = _bare_chrom(chrom)
+    for candidate in (chrom, bare, 'chr' + bare):
+        if candidate in names:
+            return names.index(candidate)
+    return None
+
+
+class _Buffer:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return values
+
+    def skip(self, size):
+        self.pos += size
+
+    def read(self, size):
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return chunk
+
+
+class VCFIndex:
+    """
+    Reader for tabix (.tbi) and CSI (.csi) indexes of bgzipped VCFs.
+    Only the bin -> chunk tables of the references holding regions are
+    decoded; the linear index is applied for tabix files to skip chunks
+    that end before the query start.
+    """
+
+    def __init__(self, vcf_path, names, bins, linear, min_shift, depth, regions):
+        self.vcf_path = vcf_path
+        self.regions = regions
+        self.names = names
+        self.bins = bins
+        self.linear = linear
+        self.min_shift = min_shift
+        self.depth = depth
+
+    @classmethod
+    def for_vcf(cls, vcf_path, regions=None):
+        """
+        Loads the index next to vcf_path for the given regions (default:
+        definition_regions()), or returns None if there isn't one.
+        """
+        if not vcf_path.endswith('.gz'):
+            return None
+        regions = definition_regions() if regions is None else regions
+        for suffix, loader in (('.tbi', cls._load_tbi), ('.csi', cls._load_csi)):
+            index_path = vcf_path + suffix
+            if os.path.exists(index_path):
+                data = b''.join(read_chunks(index_path))
+                return loader(vcf_path, _Buffer(data), regions)
+        return None
+
+    @classmethod
+    def _load_tbi(cls, vcf_path, buf, regions):
+        if buf.read(4) != b'TBI\x01':
+            raise ValueError("Invalid tabix index.")
+        n_ref, _fmt, _seq, _beg, _end, _meta, _skip, l_nm = buf.unpack('<8i')
+        names = cls._split_names(buf.read(l_nm))
+        wanted = cls._wanted_refs(names, regions)
+        bins, linear = [], []
+        for ref_id in range(n_ref):
+            bins.append(cls._read_bins(buf, ref_id in wanted, '<Ii'))
+            n_intv = buf.unpack('<i')[0]
+            if ref_id in wanted:
+                linear.append(buf.unpack(f'<{n_intv}Q'))
+            else:
+                buf.skip(n_intv * 8)
+                linear.append(())
+        return cls(vcf_path, names, bins, linear, TABIX_MIN_SHIFT, TABIX_DEPTH, regions)
+
+    @classmethod
+    def _load_csi(cls, vcf_path, buf, regions):
+        if buf.read(4) != b'CSI\x01':
+            raise ValueError("Invalid CSI index.")
+        min_shift, depth, l_aux = buf.unpack('<3i')
+        aux = buf.read(l_aux)
+        if len(aux) >= 28:
+            l_nm = struct.unpack_from('<i', aux, 24)[0]
+            names = cls._split_names(aux[28:28 + l_nm])
+        else:
+            names = cls._header_contigs(vcf_path)
+        wanted = cls._wanted_refs(names, regions)
+        bins = [
+            cls._read_bins(buf, ref_id in wanted, '<IQi')
+            for ref_id in range(buf.unpack('<i')[0])
+        ]
+        return cls(vcf_path, names, bins, None, min_shift, depth, regions)
+
+    @staticmethod
+    def _read_bins(buf, keep, bin_fmt):
+        """Reads one reference's bin table; skipped refs are not decoded."""
+        ref_bins = {}
+        for _ in range(buf.unpack('<i')[0]):
+            bin_header = buf.unpack(bin_fmt)
+            n_chunk = bin_header[-1]
+            if keep:
+                offsets = buf.unpack(f'<{n_chunk * 2}Q')
+                ref_bins[bin_header[0]] = list(zip(offsets[::2], offsets[1::2]))
+            else:
+                buf.skip(n_chunk * 16)
+        return ref_bins
+
+    @staticmethod
+    def _wanted_refs(names, regions):
+        return {_find_ref(names, chrom) for chrom, _beg, _end, _gene in regions} - {None}
+
+    @staticmethod
+    def _split_names(raw):
+        return [name.decode() for name in raw.split(b'\x00') if name]
+
+    @staticmethod
+    def _header_lines(vcf_path):
+        header = []
+        with closing(read_chunks(vcf_path)) as chunks:
+            for line in iter_lines(chunks):
+                if not line.startswith(b'#'):
+                    break
+                header.append(line)
+        return header
+
+    @staticmethod
+    def _contigs(header):
+        """{contig: declared length or None} from ##contig header lines."""
+        contigs = {}
+        for line in header:
+            if line.startswith(b'##contig=<'):
+                attributes = dict(
+                    item.split(b'=', 1) for item in line[10:].rstrip(b'\r>').split(b',') if b'=' in item
+                )
+                if b'ID' in attributes:
+                    length = attributes.get(b'length', b'')
+                    contigs[attributes[b'ID'].decode()] = int(length) if length.isdigit() else None
+        return contigs
+
+    @classmethod
+    def _header_contigs(cls, vcf_path):
+        return list(cls._contigs(cls._header_lines(vcf_path)))
+
+    def matches_streaming(self):
+        """
+        Whether fetch_lines() keeps what a full scan would. The windows only
+        cover the definition sites in GRCh38, so every queried contig must
+        be declared with its GRCh38 length, and the file must not declare a
+        GENE INFO tag (tagged lines are kept wherever they are). Otherwise
+        the caller streams the whole file.
+        """
+        header = self._header_lines(self.vcf_path)
+        if any(line.startswith(b'##INFO=<ID=GENE,') for line in header):
+            return False
+        declared = {_bare_chrom(name): length for name, length in self._contigs(header).items()}
+        return all(
+            declared.get(_bare_chrom(chrom)) is not None
+            and declared[_bare_chrom(chrom)] == GRCH38_LENGTHS.get(_bare_chrom(chrom))
+            for chrom, _beg, _end, _gene in self.regions
+        )
+
+    def _ref_id(self, chrom):
+        return _find_ref(self.names, chrom)
+
+    def chunks(self, chrom, beg, end):
+        """Merged (start, end) virtual offset ranges that may hold [beg, end)."""
+        ref_id = self._ref_id(chrom)
+        if ref_id is None or ref_id >= len(self.bins):
+            return []
+        ref_bins = self.bins[ref_id]
+        min_offset = 0
+        if self.linear is not None and self.linear[ref_id]:
+            window = min(beg >> TABIX_MIN_SHIFT, len(self.linear[ref_id]) - 1)
+            min_offset = self.linear[ref_id][window]
+
+        found = sorted(
+            chunk
+            for bin_id in reg2bins(beg, end, self.min_shift, self.depth)
+            for chunk in ref_bins.get(bin_id, ())
+            if chunk[1] > min_offset
+        )
+        merged = []
+        for start, stop in found:
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], stop)
+            else:
+                merged.append([start, stop])
+        return merged
+
+    def fetch_lines(self):
+        """
+        Yields the header followed by every record overlapping the regions,
+        decoding only the BGZF blocks that the index points at.
+        """
+        yield from self._header_lines(self.vcf_path)
+
+        # Visit regions in file order so the output matches a full scan.
+        located = sorted(
+            (self._ref_id(chrom), beg, end, chrom)
+            for chrom, beg, end, _gene in self.regions
+            if self._ref_id(chrom) is not None
+        )
+        reader = BGZFReader(self.vcf_path)
+        try:
+            for _ref_id, beg, end, chrom in located:
+                for start, stop in self.chunks(chrom, beg, end):
+                    for line in reader.read_range(start, stop).split(b'\n'):
+                        fields = line.split(b'\t', 2)
+                        if len(fields) < 3 or line.startswith(b'#'):
+                            continue
+                        if beg < int(fields[1]) <= end:
+                            yield line
+        finally:
+            reader.close()
@@ -1,5 +1,72 @@
-import vcf
 import os
+import zlib
+
+import numpy as np
+import vcf
+
+from .allele_index import get_allele_index
+
+# Read size for the streaming tokenizer. Large reads keep the per-line cost
+# dominated by bytes.split rather than by Python-level I/O calls.
+CHUNK_SIZE = 1 << 20
+
+# Data lines are resolved against the allele index in batches of this size,
+# so the rsID lookups run as one vectorized binary search per batch.
+LOOKUP_BATCH = 8192
+
+
+def read_chunks(file_path, chunk_size=CHUNK_SIZE):
+    """Yields decompressed byte chunks from a plain or gzip/bgzip VCF."""
+    with open(file_path, 'rb') as handle:
+        magic = handle.read(2)
+        handle.seek(0)
+        if magic == b'\x1f\x8b':
+            yield from _inflate_chunks(iter(lambda: handle.read(chunk_size), b''))
+        else:
+            yield from iter(lambda: handle.read(chunk_size), b'')
+
+
+def _inflate_chunks(chunks):
+    """Decompresses concatenated gzip members (bgzip writes one per block)."""
+    inflater = _Inflater()
+    for chunk in chunks:
+        yield from inflater.feed(chunk)
+    yield from inflater.flush()
+
+
+class _Inflater:
+    """Incremental gzip decoder that continues across member boundaries."""
+
+    def __init__(self):
+        self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+    def feed(self, chunk):
+        out = []
+        while chunk:
+            data = self.decompressor.decompress(chunk)
+            if data:
+                out.append(data)
+            if not self.decompressor.eof:
+                break
+            chunk = self.decompressor.unused_data
+            self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        return out
+
+    def flush(self):
+        tail = self.decompressor.flush()
+        return [tail] if tail else []
+
+
+def iter_lines(chunks):
+    """Splits a stream of byte chunks into lines without the trailing newline."""
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
 
 class VCFParser:
     REQUIRED_GENES = ['CYP2D6', 'CYP2C19', 'CYP2C9', 'SLCO1B1', 'TPMT', 'DPYD']
@@ -7,12 +74,13 @@ class VCFParser:
     def __init__(self, file_path):
         self.file_path = file_path
         self.variants = []
+        self.sample_names = []
 
     def validate(self):
         """Basic validation of VCF extension and existence."""
         if not os.path.exists(self.file_path):
             return False, "File does not exist."
-        if not self.file_path.endswith('.vcf'):
+        if not self.file_path.endswith(('.vcf', '.vcf.gz')):
             return False, "Not a VCF file."
         return True, ""
 
@@ -25,16 +93,231 @@ class VCFParser:
             "error": None
         }
 
+        try:
+            for variant_info in self._scan(self._lines()):
+                results["variants"].append(variant_info)
+                results["genes_detected"].add(variant_info["gene"])
+
+            results["success"] = True
+            results["genes_detected"] = list(results["genes_detected"])
+        except Exception as e:
+            results["error"] = str(e)
+            results["success"] = False
+
+        return results
+
+    def parse_cohort(self):
+        """
+        Decodes every sample at the target sites into a columnar genotype
+        matrix: genotypes is int8 (samples x sites x 2) with -1 for missing
+        alleles, and missing flags calls with any missing allele.
+        """
+        results = {
+            "samples": [],
+            "sites": [],
+            "genotypes": None,
+            "missing": None,
+            "genes_detected": [],
+            "success": False,
+            "error": None
+        }
+
+        try:
+            sites, columns = [], []
+            codes = {}
+            for fields, gene_name in self._select(self._lines()):
+                sites.append(self._site(fields, gene_name))
+                columns.append(self._sample_genotypes(fields[5], codes))
+
+            genotypes = np.full((len(self.sample_names), len(sites), 2), -1, dtype=np.int8)
+            for column_index, column in enumerate(columns):
+                genotypes[:, column_index, :] = column
+
+            results["samples"] = self.sample_names
+            results["sites"] = sites
+            results["genotypes"] = genotypes
+            results["missing"] = (genotypes < 0).any(axis=2)
+            results["genes_detected"] = list({site["gene"] for site in sites})
+            results["success"] = True
+        except Exception as e:
+            results["error"] = str(e)
+            results["success"] = False
+
+        return results
+
+    def _lines(self):
+        """
+        Indexed bgzipped GRCh38 files are read only around the allele
+        definition sites; anything else (no .tbi/.csi index, another
+        assembly, GENE= tags) is streamed end to end. Both return the same
+        variants.
+        """
+        from .vcf_index import VCFIndex
+
+        index = VCFIndex.for_vcf(self.file_path)
+        if index is not None and index.matches_streaming():
+            return index.fetch_lines()
+        return iter_lines(read_chunks(self.file_path))
+
+    def _select(self, lines):
+        """
+        Streaming tokenizer over raw VCF lines.
+
+        Each data line is split only as far as the ID column first, and its
+        rsID (or CHROM:POS:REF:ALT when the ID is missing) is resolved
+        against the allele index a batch at a time. INFO is decoded only for
+        lines carrying a GENE= tag. Yields (fields, gene) for the kept lines,
+        where fields[5] is the undecoded QUAL..samples tail. Sample names from
+        the #CHROM header are left in self.sample_names.
+        """
+        batch = []
+
+        for line in lines:
+            if line[:1] == b'#':
+                if line[:6] == b'#CHROM':
+                    header = line.rstrip(b'\r').split(b'\t')
+                    self.sample_names = [name.decode() for name in header[9:]]
+                continue
+            if not line:
+                continue
+
+            fields = line.split(b'\t', 5)
+            if len(fields) < 6:
+                continue
+            batch.append(fields)
+            if len(batch) >= LOOKUP_BATCH:
+                yield from self._resolve_batch(batch)
+                batch = []
+
+        yield from self._resolve_batch(batch)
+
+    def _resolve_batch(self, batch):
+        required = frozenset(self.REQUIRED_GENES)
+        index = get_allele_index()
+        indexed_genes = index.genes_for_rsids([fields[2] for fields in batch])
+
+        for fields, gene_name in zip(batch, indexed_genes):
+            rest = fields[5]
+            if b'GENE=' in rest:
+                info = rest.split(b'\t', 3)[2]
+                gene_name = self._info_gene(info) or gene_name
+            elif not gene_name and fields[2] == b'.':
+                found = index.lookup_position(
+                    fields[0], int(fields[1]), fields[3], fields[4].split(b',', 1)[0]
+                )
+                gene_name = found[0] if found else None
+
+            if gene_name in required:
+                yield fields, gene_name
+
+    def _scan(self, lines):
+        """Builds the single-sample variant dicts from the selected lines."""
+        for fields, gene_name in self._select(lines):
+            variant_info = self._site(fields, gene_name)
+            variant_info["genotype"] = (
+                self._first_genotype(fields[5]) if self.sample_names else "Unknown"
+            )
+            yield variant_info
+
+    @staticmethod
+    def _site(fields, gene_name):
+        """Sample-independent description of a selected line."""
+        raw_id = fields[2]
+        alt = fields[4].split(b',', 1)[0].decode()
+        rest = fields[5]
+        star = None
+        if b'STAR=' in rest:
+            star = VCFParser._info_value(rest.split(b'\t', 3)[2], b'STAR=')
+        return {
+            "rsid": raw_id.decode() if raw_id != b'.' else None,
+            "chromosome": fields[0].decode(),
+            "position": int(fields[1]),
+            "gene": gene_name,
+            "ref": fields[3].decode(),
+            "alt": alt if alt != '.' else None,
+            "star": star
+        }
+
+    @staticmethod
+    def _info_gene(info):
+        """Returns the first GENE= value from a raw INFO column."""
+        return VCFParser._info_value(info, b'GENE=')
+
+    @staticmethod
+    def _info_value(info, prefix):
+        """Returns the first value of a KEY= prefix from a raw INFO column."""
+        for entry in info.rstrip(b'\r').split(b';'):
+            if entry[:len(prefix)] == prefix:
+                return entry[len(prefix):].split(b',', 1)[0].decode() or None
+        return None
+
+    @staticmethod
+    def _first_genotype(rest):
+        """Decodes the GT of the first sample from the QUAL..samples tail."""
+        columns = rest.rstrip(b'\r').split(b'\t', 5)
+        if len(columns) < 5:
+            return "Unknown"
+        keys = columns[3].split(b':')
+        if b'GT' not in keys:
+            return "Unknown"
+        values = columns[4].split(b':')
+        index = keys.index(b'GT')
+        gt = values[index] if index < len(values) else b'.'
+        return "/".join(
+            allele.decode() for allele in gt.replace(b'|', b'/').split(b'/')
+        )
+
+    def _sample_genotypes(self, rest, codes):
+        """
+        Allele codes for every sample of one line as an (n_samples, 2) array.
+        codes caches raw GT strings -> code pairs; a cohort only has a handful.
+        """
+        columns = rest.rstrip(b'\r').split(b'\t')
+        samples = columns[4:]
+        keys = columns[3].split(b':') if len(columns) > 3 else []
+        if b'GT' not in keys or len(samples) != len(self.sample_names):
+            return np.full((len(self.sample_names), 2), -1, dtype=np.int8)
+        if keys[0] == b'GT':
+            gts = [sample.split(b':', 1)[0] for sample in samples]
+        else:
+            index = keys.index(b'GT')
+            gts = [(sample.split(b':') + [b'.'] * index)[index] for sample in samples]
+
+        pairs = []
+        for gt in gts:
+            pair = codes.get(gt)
+            if pair is None:
+                alleles = [
+                    int(allele) if allele not in (b'.', b'') else -1
+                    for allele in gt.replace(b'|', b'/').split(b'/')
+                ]
+                pair = codes[gt] = (alleles * 2)[:2]
+            pairs.append(pair)
+        return np.array(pairs, dtype=np.int8)
+
+    def parse_pyvcf(self):
+        """
+        Reference implementation that builds a full PyVCF3 record per line.
+        Kept for benchmarking against the streaming tokenizer in parse().
+        """
+        results = {
+            "variants": [],
+            "genes_detected": set(),
+            "success": False,
+            "error": None
+        }
+
         try:
             vcf_reader = vcf.Reader(filename=self.file_path)
             for record in vcf_reader:
-                # In a real scenario, gene info might be in the 'INFO' field or can be mapped via rsID
-                # For this hackathon version, we look for 'GENE' or 'CSQ' in INFO or use rsID mapping
-                gene_name = record.INFO.get('GENE', [None])[0]
+                gene_name = record.INFO.get('GENE')
+                if isinstance(gene_name, list):
+                    gene_name = gene_name[0]
                 rsid = record.ID
-                
-                # Simple mapping if GENE tag missing (demonstration logic)
-                # In production, we'd use a more robust lookup
+                star = record.INFO.get('STAR')
+                if isinstance(star, list):
+                    star = star[0]
+
                 if not gene_name and rsid:
                     gene_name = self._lookup_gene_by_rsid(rsid)
 
@@ -46,7 +329,8 @@ class VCFParser:
                         "genotype": "/".join(map(str, record.samples[0].gt_alleles)) if record.samples else "Unknown",
                         "gene": gene_name,
                         "ref": record.REF,
-                        "alt": str(record.ALT[0]) if record.ALT else None
+                        "alt": str(record.ALT[0]) if record.ALT and record.ALT[0] else None,
+                        "star": star
                     }
                     results["variants"].append(variant_info)
                     results["genes_detected"].add(gene_name)
@@ -60,14 +344,6 @@ class VCFParser:
         return results
 
     def _lookup_gene_by_rsid(self, rsid):
-        # Placeholder for rsID -> Gene mapping
-        # In a full app, this would query a local DB or API
-        mapping = {
-            'rs12248560': 'CYP2C19',
-            'rs1057910': 'CYP2C9',
-            'rs4149056': 'SLCO1B1',
-            'rs1061170': 'CYP2D6',
-            'rs1801133': 'DPYD',
-            'rs1142345': 'TPMT',
-        }
-        return mapping.get(rsid)
+        found = get_allele_index().lookup_rsid(rsid)
+        return found[0] if found else None
+
@@ -0,0 +1,220 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import IntegrityError, transaction
+
+from core.models import VCFContent
+from .pipeline import parse_variants
+from .vcf_index import BGZFWriter
+
+COPY_CHUNK = 1 << 20
+
+
+def _extension(name):
+    if name.endswith('.vcf.gz'):
+        return '.vcf.gz'
+    if name.endswith('.vcf'):
+        return '.vcf'
+    raise ValueError("Not a VCF file.")
+
+
+def _incoming_dir():
+    """
+    Scratch directory next to the stored VCFs, so a finished upload is
+    moved into place with a rename. None for storages without local paths.
+    """
+    try:
+        path = default_storage.path('vcf_uploads/incoming')
+    except NotImplementedError:
+        return None
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class VCFSink:
+    """
+    Receives a VCF as a stream of byte chunks and, in that single pass,
+    hashes it and writes it (bgzip-compressed when VCF_STORE_COMPRESS is
+    set) to a scratch file. save() then turns it into a VCFContent without
+    reading the data again. Parsing is left to the job worker
+    (content_variants()), which skips it for content parsed before. Data
+    past max_size bytes is dropped and save() raises ValueError.
+    """
+
+    def __init__(self, name, max_size=None):
+        extension = _extension(name)
+        compress = extension == '.vcf' and getattr(settings, 'VCF_STORE_COMPRESS', True)
+        if compress:
+            extension = '.vcf.gz'
+        self.extension = extension
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.max_size = max_size
+        self.tmp = tempfile.NamedTemporaryFile(
+            suffix=extension, dir=_incoming_dir(), delete=False
+        )
+        self.out = BGZFWriter(self.tmp) if compress else self.tmp
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.tmp is None:
+            return
+        if self.max_size is not None and self.size > self.max_size:
+            self.discard()
+            return
+        self.digest.update(chunk)
+        self.out.write(chunk)
+
+    def discard(self):
+        if self.tmp is not None:
+            self.tmp.close()
+            os.unlink(self.tmp.name)
+            self.tmp = None
+
+    def save(self):
+        """
+        Returns the VCFContent for the received data. Content seen before is
+        returned as is, with its parsed variants, and the new copy dropped.
+        """
+        if self.tmp is None:
+            raise ValueError(f"VCF uploads are limited to {self.max_size // (1 << 20)} MB.")
+        if self.out is not self.tmp:
+            self.out.close()
+        self.tmp.close()
+        sha256 = self.digest.hexdigest()
+
+        existing = VCFContent.objects.filter(sha256=sha256).first()
+        if existing is not None and existing.file:
+            self.discard()
+            return existing
+
+        stored_name = f"vcf_uploads/{sha256[:2]}/{sha256}{self.extension}"
+        if _incoming_dir() is not None:
+            # Same hash, same bytes: an existing file at this name is reused.
+            path = default_storage.path(stored_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                self.discard()
+            else:
+                os.replace(self.tmp.name, path)
+                # The scratch file is created 0600; apply what the storage would.
+                os.chmod(path, getattr(default_storage, 'file_permissions_mode', None) or 0o644)
+                self.tmp = None
+        else:
+            with open(self.tmp.name, 'rb') as stored:
+                stored_name = default_storage.save(stored_name, File(stored))
+            self.discard()
+
+        if existing is not None:
+            # Raw file was dropped by compact_storage; keep this copy again.
+            existing.file = stored_name
+            VCFContent.objects.filter(id=existing.id).update(file=stored_name)
+            return existing
+
+        try:
+            with transaction.atomic():
+                return VCFContent.objects.create(sha256=sha256, file=stored_name, size=self.size)
+        except IntegrityError:
+            # Another upload of the same content won the race; keep its copy.
+            winner = VCFContent.objects.get(sha256=sha256)
+            if winner.file.name != stored_name:
+                default_storage.delete(stored_name)
+            return winner
+
+
+class StreamedVCF(UploadedFile):
+    """
+    An upload that VCFUploadHandler already hashed and wrote while
+    the request body was read. Pass it to store_vcf(); if it never is, the
+    scratch file is removed when Django closes the request's files.
+    """
+
+    def __init__(self, sink, name, content_type, size, charset):
+        super().__init__(None, name, content_type, size, charset)
+        self.sink = sink
+        self.content = None
+
+    def save(self):
+        if self.content is None:
+            self.content = self.sink.save()
+        return self.content
+
+    def close(self):
+        if self.content is None:
+            self.sink.discard()
+
+
+class VCFUploadHandler(FileUploadHandler):
+    """
+    Feeds .vcf/.vcf.gz uploads into a VCFSink chunk by chunk as they are
+    received, instead of spooling them to memory or a temp file first, and
+    rejects those larger than VCF_UPLOAD_MAX_SIZE bytes. Other uploads fall
+    through to the next handler.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        try:
+            self.sink = VCFSink(self.file_name, getattr(settings, 'VCF_UPLOAD_MAX_SIZE', None))
+        except ValueError:
+            self.sink = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.sink is None:
+            return raw_data
+        self.sink.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.sink is None:
+            return None
+        return StreamedVCF(self.sink, self.file_name, self.content_type, file_size, self.charset)
+
+    def upload_interrupted(self):
+        if getattr(self, 'sink', None) is not None:
+            self.sink.discard()
+
+
+def store_vcf(handle, name):
+    """
+    Content-addressed storage for an uploaded VCF.
+
+    The upload is hashed and written in one pass over its chunks
+    (see VCFSink). If a VCFContent with the same SHA-256 exists it is
+    returned and nothing is stored; otherwise the file is saved once under
+    vcf_uploads/<hash>.
+    """
+    if isinstance(handle, StreamedVCF):
+        return handle.save()
+    sink = VCFSink(name)
+    chunks = handle.chunks(COPY_CHUNK) if hasattr(handle, 'chunks') else iter(
+        lambda: handle.read(COPY_CHUNK), b''
+    )
+    try:
+        for chunk in chunks:
+            sink.write(chunk)
+    except BaseException:
+        sink.discard()
+        raise
+    return sink.save()
+
+
+def content_variants(content):
+    """Parsed variants of a stored VCF, parsing it only the first time."""
+    if content.variants is None:
+        content.variants = parse_variants(content.file.path)
+        VCFContent.objects.filter(id=content.id).update(variants=content.variants)
+    return content.variants
+
+
+def patient_variants(patient):
+    """Variants for a patient, from its stored content when it has one."""
+    if patient.content_id is not None:
+        return content_variants(patient.content)
+    return parse_variants(patient.uploaded_file.path)
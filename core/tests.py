@@ -0,0 +1,744 @@
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import io
+import json
+import tempfile
+from dataclasses import replace
+from datetime import timedelta
+from types import MappingProxyType
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from core.models import (
+    AssessmentCounter, AssessmentJob, CachedExplanation, DrugAssessment, GuidelineVersion, Patient, PatientVariant,
+    VCFContent,
+)
+from core.services import allele_index, analytics, diplotype_caller, llm_service, metrics
+from core.services.allele_index import AlleleIndex, definitions_path, get_allele_index, read_definitions
+from core.services.diplotype_caller import diplotype_callers
+from core.services.drug_names import drug_matcher, normalize_drugs
+from core.services.cpic_guidelines import GuidelineError, current_guidelines, load_guidelines, parse_guidelines
+from core.services.jobs import JobRunner, claim, claim_next, enqueue
+from core.services.llm_service import LLMService
+from core.services.pipeline import assessment_rows, predict, save_profiles
+from core.services.risk_engine import RiskEngine, resolve_rule
+from core.services.vcf_store import content_variants, store_vcf
+from core.services.vcf_index import (
+    GRCH38_LENGTHS, TABIX_DEPTH, TABIX_MIN_SHIFT, BGZFReader, BGZFWriter, VCFIndex, definition_regions,
+)
+from core.services.vcf_parser import VCFParser, iter_lines, read_chunks
+
+SAMPLE_VCF_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sample_vcf')
+
+
+def _reg2bin(beg, end, min_shift, depth):
+    """The smallest bin holding [beg, end) (htslib's hts_reg2bin)."""
+    end -= 1
+    level, shift = depth, min_shift
+    offset = ((1 << depth * 3) - 1) // 7
+    while level > 0:
+        if beg >> shift == end >> shift:
+            return offset + (beg >> shift)
+        level -= 1
+        shift += 3
+        offset -= 1 << level * 3
+    return 0
+
+
+def write_bgzf(path, data):
+    with open(path, 'wb') as handle:
+        writer = BGZFWriter(handle)
+        writer.write(data)
+        writer.close()
+
+
+def _virtual_offsets(path):
+    """A function mapping uncompressed offsets of a BGZF file to virtual offsets."""
+    reader = BGZFReader(path)
+    starts = []
+    try:
+        coffset = uoffset = 0
+        size = os.path.getsize(path)
+        while coffset < size:
+            data, block_size = reader.read_block(coffset)
+            starts.append((uoffset, coffset, len(data)))
+            coffset += block_size
+            uoffset += len(data)
+    finally:
+        reader.close()
+
+    def virtual(offset):
+        for block_start, block_coffset, length in starts:
+            if offset < block_start + length or length == 0:
+                return (block_coffset << 16) | (offset - block_start)
+        raise ValueError(offset)
+    return virtual
+
+
+def write_index(vcf_path, csi=False, min_shift=TABIX_MIN_SHIFT, depth=TABIX_DEPTH):
+    """
+    Writes a .tbi (or .csi) index for a BGZF VCF the way tabix would: every
+    record's chunk in the bin of its span, plus the tabix linear index.
+    """
+    text = b''.join(read_chunks(vcf_path))
+    virtual = _virtual_offsets(vcf_path)
+    names, refs = [], {}
+    offset = 0
+    for line in text.split(b'\n')[:-1]:
+        start, offset = offset, offset + len(line) + 1
+        if line.startswith(b'#'):
+            continue
+        chrom, pos, _id, ref = line.split(b'\t', 4)[:4]
+        beg = int(pos) - 1
+        end = beg + len(ref)
+        if chrom.decode() not in refs:
+            names.append(chrom.decode())
+            refs[chrom.decode()] = ({}, {})
+        bins, linear = refs[chrom.decode()]
+        chunk = (virtual(start), virtual(offset))
+        bins.setdefault(_reg2bin(beg, end, min_shift, depth), []).append(chunk)
+        for window in range(beg >> TABIX_MIN_SHIFT, ((end - 1) >> TABIX_MIN_SHIFT) + 1):
+            linear.setdefault(window, chunk[0])
+
+    names_blob = b''.join(name.encode() + b'\x00' for name in names)
+    body = struct.pack('<i', len(names))
+    for name in names:
+        bins, linear = refs[name]
+        body += struct.pack('<i', len(bins))
+        for bin_id, chunks in sorted(bins.items()):
+            if csi:
+                body += struct.pack('<IQi', bin_id, chunks[0][0], len(chunks))
+            else:
+                body += struct.pack('<Ii', bin_id, len(chunks))
+            body += b''.join(struct.pack('<QQ', *chunk) for chunk in chunks)
+        if not csi:
+            intervals, last = [], 0
+            for window in range(max(linear) + 1 if linear else 0):
+                last = linear.get(window, last)
+                intervals.append(last)
+            body += struct.pack('<i', len(intervals)) + struct.pack(f'<{len(intervals)}Q', *intervals)
+
+    header = struct.pack('<7i', 2, 1, 2, 0, ord('#'), 0, len(names_blob)) + names_blob
+    if csi:
+        write_bgzf(vcf_path + '.csi', b'CSI\x01' + struct.pack('<3i', min_shift, depth, len(header)) + header + body)
+    else:
+        write_bgzf(vcf_path + '.tbi', b'TBI\x01' + struct.pack('<i', len(names)) + header + body[4:])
+
+
+def grch38_vcf(lines=4000, seed=3, contig_lengths=GRCH38_LENGTHS, gene_info=False):
+    """
+    A single-sample VCF with a record at every allele-definition site among
+    `lines` random records on the same chromosomes, sorted by position.
+    """
+    rng = random.Random(seed)
+    sites = {(row['chrom'], int(row['pos'])): row for row in read_definitions(definitions_path())}
+    chroms = sorted({chrom for chrom, _pos in sites}, key=lambda c: int(c))
+    records = [
+        (chrom, pos, row['rsid'], row['ref'], row['alt'] if row['alt'] != '.' else 'T')
+        for (chrom, pos), row in sites.items()
+    ]
+    for _ in range(lines):
+        chrom = rng.choice(chroms)
+        records.append((chrom, rng.randrange(1, 140_000_000), '.', 'A', 'G'))
+    records.sort(key=lambda r: (chroms.index(r[0]), r[1]))
+
+    header = ['##fileformat=VCFv4.2']
+    if gene_info:
+        header.append('##INFO=<ID=GENE,Number=1,Type=String,Description="Gene">')
+    header += [f'##contig=<ID=chr{chrom},length={contig_lengths[chrom]}>' for chrom in chroms]
+    header.append('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE')
+    body = [
+        f'chr{chrom}\t{pos}\t{rsid}\t{ref}\t{alt}\t100\tPASS\t.\tGT\t{rng.choice(["0/0", "0/1", "1/1"])}'
+        for chrom, pos, rsid, ref, alt in records
+    ]
+    return ('\n'.join(header + body) + '\n').encode()
+
+
+class AlleleReloadTests(SimpleTestCase):
+    HEADER = 'gene\tallele\trsid\tchrom\tpos\tref\talt\n'
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.definitions = os.path.join(tmp, 'allele_definitions.tsv')
+        self.write_definitions('CYP2C9\t*3\trs1057910\t10\t94981296\tA\tC\n')
+        with open(os.path.join(tmp, 'allele_functions.tsv'), 'w') as handle:
+            handle.write('gene\tallele\tactivity\nCYP2C9\t*1\t1\nCYP2C9\t*3\t0\n')
+        self.index = os.path.join(tmp, 'allele_index.bin')
+        settings = override_settings(
+            ALLELE_DEFINITIONS_PATH=self.definitions, ALLELE_INDEX_PATH=self.index, ALLELE_RELOAD_INTERVAL=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        for module, name in ((allele_index, '_index'), (diplotype_caller, '_callers')):
+            patcher = mock.patch.object(module, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_definitions(self, rows, age=0):
+        with open(self.definitions, 'w') as handle:
+            handle.write(self.HEADER + rows)
+        stamp = os.path.getmtime(self.definitions) + age
+        os.utime(self.definitions, (stamp, stamp))
+
+    def test_edited_definitions_are_picked_up(self):
+        self.assertEqual(get_allele_index().lookup_rsid('rs1057910'), ('CYP2C9', '*3'))
+        self.assertNotIn('*2', diplotype_callers()['CYP2C9'].alleles)
+
+        self.write_definitions(
+            'CYP2C9\t*2\trs1799853\t10\t94942290\tC\tT\n'
+            'CYP2C9\t*3\trs1057910\t10\t94981296\tA\tC\n',
+            age=10,
+        )
+        self.assertEqual(get_allele_index().lookup_rsid('rs1799853'), ('CYP2C9', '*2'))
+        self.assertIn('*2', diplotype_callers()['CYP2C9'].alleles)
+
+    def test_a_replaced_index_is_mapped_again(self):
+        self.assertIsNone(get_allele_index().lookup_rsid('rs4244285'))
+        AlleleIndex.build([{'gene': 'CYP2C19', 'allele': '*2', 'rsid': 'rs4244285'}], self.index + '.new')
+        os.replace(self.index + '.new', self.index)
+        self.assertEqual(get_allele_index().lookup_rsid('rs4244285'), ('CYP2C19', '*2'))
+
+
+class TokenizerTests(SimpleTestCase):
+    def test_parse_matches_pyvcf(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        # Gene-tagged samples, and untagged records resolved through the
+        # allele index, plain and bgzipped.
+        paths = [os.path.join(SAMPLE_VCF_DIR, name) for name in ('test_patient.vcf', 'test_data2.vcf')]
+        data = grch38_vcf(lines=2000)
+        for name in ('untagged.vcf', 'untagged.vcf.gz'):
+            path = os.path.join(tmp, name)
+            if name.endswith('.gz'):
+                write_bgzf(path, data)
+            else:
+                with open(path, 'wb') as handle:
+                    handle.write(data)
+            paths.append(path)
+
+        for path in paths:
+            with self.subTest(path=os.path.basename(path)):
+                fast, slow = VCFParser(path).parse(), VCFParser(path).parse_pyvcf()
+                self.assertTrue(fast['success'], fast['error'])
+                self.assertTrue(slow['success'], slow['error'])
+                self.assertTrue(fast['variants'])
+                self.assertEqual(fast['variants'], slow['variants'])
+                self.assertEqual(sorted(fast['genes_detected']), sorted(slow['genes_detected']))
+
+
+class IndexedVCFTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def _bgzip(self, name, data, csi=False):
+        path = os.path.join(self.tmp, name)
+        write_bgzf(path, data)
+        write_index(path, csi=csi)
+        return path
+
+    def _streamed(self, path):
+        parser = VCFParser(path)
+        parser._lines = lambda: iter_lines(read_chunks(path))
+        return parser.parse()
+
+    def test_bgzf_writer_round_trip(self):
+        data = os.urandom(3 * 0xff00 + 123).hex().encode()
+        path = os.path.join(self.tmp, 'data.gz')
+        write_bgzf(path, data)
+        self.assertEqual(b''.join(read_chunks(path)), data)
+
+        virtual = _virtual_offsets(path)
+        reader = BGZFReader(path)
+        try:
+            self.assertEqual(reader.read_range(virtual(70000), virtual(200000)), data[70000:200000])
+        finally:
+            reader.close()
+
+    def test_tbi_and_csi_indexes_select_definition_sites(self):
+        data = grch38_vcf()
+        for csi in (False, True):
+            with self.subTest(csi=csi):
+                path = self._bgzip(f'cohort{int(csi)}.vcf.gz', data, csi=csi)
+                index = VCFIndex.for_vcf(path)
+                self.assertIsNotNone(index)
+                self.assertEqual(index.linear is None, csi)
+                self.assertTrue(index.matches_streaming())
+
+                fetched = [line for line in index.fetch_lines() if not line.startswith(b'#')]
+                total = sum(1 for line in data.split(b'\n') if line and not line.startswith(b'#'))
+                self.assertLess(len(fetched), total / 10)
+                for line in fetched:
+                    chrom, pos = line.split(b'\t', 2)[:2]
+                    self.assertTrue(any(
+                        'chr' + c == chrom.decode() and beg < int(pos) <= end
+                        for c, beg, end, _gene in definition_regions()
+                    ))
+
+    def test_indexed_parse_matches_streaming_parse(self):
+        data = grch38_vcf()
+        for csi in (False, True):
+            with self.subTest(csi=csi):
+                path = self._bgzip(f'patient{int(csi)}.vcf.gz', data, csi=csi)
+                indexed, streamed = VCFParser(path).parse(), self._streamed(path)
+                self.assertTrue(indexed['success'], indexed['error'])
+                self.assertTrue(indexed['variants'])
+                self.assertEqual(indexed['variants'], streamed['variants'])
+
+    def test_other_assemblies_and_gene_tags_are_streamed(self):
+        grch37 = dict(GRCH38_LENGTHS, **{'1': 249250621, '22': 51304566})
+        for name, data in (
+            ('grch37.vcf.gz', grch38_vcf(contig_lengths=grch37)),
+            ('tagged.vcf.gz', grch38_vcf(gene_info=True)),
+        ):
+            with self.subTest(name):
+                path = self._bgzip(name, data)
+                self.assertFalse(VCFIndex.for_vcf(path).matches_streaming())
+                self.assertEqual(VCFParser(path).parse()['variants'], self._streamed(path)['variants'])
+
+    def test_indexed_sample_vcf_matches_streaming_parse(self):
+        for sample in sorted(os.listdir(SAMPLE_VCF_DIR)):
+            with self.subTest(sample):
+                with open(os.path.join(SAMPLE_VCF_DIR, sample), 'rb') as handle:
+                    text = handle.read()
+                header = [line for line in text.split(b'\n') if line.startswith(b'#')]
+                records = sorted(
+                    (line for line in text.split(b'\n') if line and not line.startswith(b'#')),
+                    key=lambda line: (line.split(b'\t')[0], int(line.split(b'\t')[1])),
+                )
+                path = self._bgzip(sample + '.gz', b'\n'.join(header + records) + b'\n')
+                indexed, streamed = VCFParser(path).parse(), self._streamed(path)
+                self.assertEqual(indexed['variants'], streamed['variants'])
+                self.assertTrue(indexed['variants'])
+
+
+
+class CohortPredictionTests(SimpleTestCase):
+    DRUGS = ['CODEINE', 'WARFARIN', 'CLOPIDOGREL', 'SIMVASTATIN', 'AZATHIOPRINE', 'FLUOROURACIL', 'ASPIRIN']
+    GENOTYPES = ['0/0', '0/1', '1/1', './.', '0|1']
+
+    def test_cohort_predictions_match_single_sample_predictions(self):
+        with open(os.path.join(SAMPLE_VCF_DIR, 'test_patient.vcf'), 'rb') as handle:
+            lines = handle.read().decode().splitlines()
+        header = [line for line in lines if line.startswith('##')]
+        records = [line.split('\t')[:9] for line in lines if line and not line.startswith('#')]
+        rng = random.Random(5)
+        calls = [[rng.choice(self.GENOTYPES) for _ in records] for _ in range(6)]
+        calls[0] = ['0/0'] * len(records)
+
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        def write(name, samples):
+            path = os.path.join(tmp, name)
+            columns = '\t'.join(['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT'] + [
+                f'S{i}' for i in samples
+            ])
+            with open(path, 'w') as handle:
+                handle.write('\n'.join(header + [columns] + [
+                    '\t'.join(record + [calls[i][n] for i in samples]) for n, record in enumerate(records)
+                ]) + '\n')
+            return path
+
+        cohort = VCFParser(write('cohort.vcf', range(len(calls)))).parse_cohort()
+        self.assertTrue(cohort['success'], cohort['error'])
+        cohort_predictions = RiskEngine.predict_cohort(cohort, self.DRUGS)
+        for sample in range(len(calls)):
+            with self.subTest(sample=sample):
+                single = VCFParser(write(f'sample{sample}.vcf', [sample])).parse()
+                self.assertTrue(single['success'], single['error'])
+                self.assertEqual(
+                    cohort_predictions[sample], RiskEngine(single['variants']).predict_many(self.DRUGS)
+                )
+
+    def test_batch_predictions_match_single_drug_predictions(self):
+        guidelines = current_guidelines()
+        drugs = self.DRUGS + ['codeine ', 'Warfarin', 'CODEINE']
+        patients = {
+            name: VCFParser(os.path.join(SAMPLE_VCF_DIR, name)).parse()['variants']
+            for name in ('test_patient.vcf', 'test_data2.vcf')
+        }
+        patients['no variants'] = []
+        for name, variants in patients.items():
+            batch = RiskEngine(variants).predict_many(drugs)
+            for drug, prediction in zip(drugs, batch):
+                with self.subTest(vcf=name, drug=drug):
+                    self.assertEqual(prediction, RiskEngine(variants).predict(drug))
+                    # The compiled table agrees with the uncompiled rules.
+                    gene = guidelines.drug_gene.get(drug.upper().strip())
+                    expected = resolve_rule(
+                        guidelines.rules, drug.upper().strip(), gene, prediction.get('phenotype_call'),
+                        bool(prediction.get('detected_variants')),
+                    )
+                    self.assertEqual({key: prediction[key] for key in expected}, expected)
+
+
+class SampleVCFPredictionTests(SimpleTestCase):
+    # (risk_label, severity, phenotype, diplotype) per drug; decreased- and
+    # no-function calls must never come out Safe.
+    EXPECTED = {
+        'test_data2.vcf': {
+            'CODEINE': ('Adjust Dosage', 'Medium', 'IM', '*1/*4'),
+            'WARFARIN': ('Adjust Dosage', 'Medium', 'IM', '*1/*3'),
+            'CLOPIDOGREL': ('Adjust Dosage', 'Medium', 'IM', '*1/*2'),
+            'SIMVASTATIN': ('Toxic', 'High', 'low', '*1/*5'),
+            'AZATHIOPRINE': ('Safe', 'Low', 'normal', '*1/*1'),
+            'FLUOROURACIL': ('Toxic', 'High', 'low', '*1/*2A'),
+        },
+        'test_patient.vcf': {
+            'CODEINE': ('Safe', 'Low', 'NM', '*1/*1'),
+            'WARFARIN': ('Toxic', 'High', 'PM', '*3/*3'),
+            'CLOPIDOGREL': ('Safe', 'Low', 'RM', '*1/*17'),
+            'SIMVASTATIN': ('Toxic', 'High', 'low', '*1/*5'),
+            'AZATHIOPRINE': ('Toxic', 'High', 'low', '*1/*3C'),
+            'FLUOROURACIL': ('Toxic', 'High', 'low', '*1/rs1801133'),
+        },
+    }
+
+    def test_sample_vcf_predictions(self):
+        for name, expected in self.EXPECTED.items():
+            variants = VCFParser(os.path.join(SAMPLE_VCF_DIR, name)).parse()['variants']
+            predictions = RiskEngine(variants).predict_many(list(expected))
+            for prediction, (drug, (risk, severity, phenotype, diplotype)) in zip(predictions, expected.items()):
+                with self.subTest(vcf=name, drug=drug):
+                    self.assertEqual(
+                        (prediction['risk_label'], prediction['severity'], prediction['phenotype'],
+                         prediction['phenotype_call'], prediction['diplotype']),
+                        (risk, severity, phenotype, phenotype, diplotype),
+                    )
+
+    def test_every_activity_phenotype_needs_a_rule(self):
+        data = json.loads(load_guidelines().raw)
+        del data['rules']['SIMVASTATIN']['SLCO1B1']['low']
+        with self.assertRaisesMessage(GuidelineError, 'SIMVASTATIN/SLCO1B1/low'):
+            parse_guidelines(json.dumps(data).encode())
+        # Older versions are still readable for reassessment diffs.
+        old = parse_guidelines(json.dumps(data).encode(), require_rules=False)
+        self.assertNotIn('low', old.rules['SIMVASTATIN']['SLCO1B1'])
+
+
+class GuidelineSnapshotTests(SimpleTestCase):
+    def test_gene_calls_use_the_compiled_rules_guidelines(self):
+        # The engine's snapshot calls every CYP2D6 activity PM, unlike the
+        # guidelines the rest of the process sees.
+        current = current_guidelines()
+        snapshot = replace(current, version='snapshot', activity_phenotypes=MappingProxyType(
+            {**current.activity_phenotypes, 'CYP2D6': ((float('inf'), 'PM'),)}
+        ))
+        path = os.path.join(SAMPLE_VCF_DIR, 'test_patient.vcf')
+        variants = VCFParser(path).parse()['variants']
+        cohort = VCFParser(path).parse_cohort()
+        with mock.patch('core.services.risk_engine.current_guidelines', return_value=snapshot):
+            single = RiskEngine(variants).predict('CODEINE')
+            [[from_cohort]] = RiskEngine.predict_cohort(cohort, ['CODEINE'])
+        for prediction in (single, from_cohort):
+            self.assertEqual(prediction['phenotype_call'], 'PM')
+            self.assertEqual(prediction['risk_label'], 'Ineffective')
+            self.assertEqual(prediction['guideline_version'], 'snapshot')
+
+
+class DrugNameTests(SimpleTestCase):
+    def test_brand_and_salt_names_map_to_canonical_drugs(self):
+        text = 'Plavix 75 mg daily, 5-FU infusion; Tylenol #3 PRN\nwarfarin sodium 5mg, Aspirin 81 mg, PLAVIX'
+        self.assertEqual(normalize_drugs(text), ['CLOPIDOGREL', 'FLUOROURACIL', 'CODEINE', 'WARFARIN', 'Aspirin 81 mg'])
+
+    def test_screen_reports_matching_and_unmatched_entries(self):
+        drugs, matches, unmatched = drug_matcher().screen(
+            'co-codamol and Coumadin\nTylenol; 3 tablets\n\nTylenol with Tylenol 3\nimuran'
+        )
+        self.assertEqual(drugs, ['CODEINE', 'WARFARIN', 'AZATHIOPRINE'])
+        self.assertEqual(matches, [
+            {'entry': 'co-codamol and Coumadin', 'drugs': ['CODEINE', 'WARFARIN']},
+            # A partial name ("Tylenol with") falls back to the full one after it.
+            {'entry': 'Tylenol with Tylenol 3', 'drugs': ['CODEINE']},
+            {'entry': 'imuran', 'drugs': ['AZATHIOPRINE']},
+        ])
+        # Names never match across entry separators.
+        self.assertEqual(unmatched, ['Tylenol', '3 tablets'])
+
+
+class PagingParamsTests(TestCase):
+    def test_limits_outside_range_are_rejected(self):
+        for url in ('/api/patients/', '/api/assessments/'):
+            for query in ('limit=0', 'limit=-1', 'limit=1001', 'limit=x', 'after=x'):
+                with self.subTest(url=url, query=query):
+                    self.assertEqual(self.client.get(f'{url}?{query}').status_code, 400)
+            response = self.client.get(f'{url}?limit=1000')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {'results': [], 'next_after': None})
+
+
+class AssessmentDetailTests(TestCase):
+    def test_pretty_flag(self):
+        patient = Patient.objects.create(uploaded_file='vcf_uploads/patient.vcf')
+        assessment = DrugAssessment.objects.create(
+            patient=patient, drug_name='CODEINE', risk_label='Safe', confidence_score=0.9,
+            severity='Low', json_output={'drug': 'CODEINE'},
+        )
+        for query, pretty in (('', False), ('pretty=0', False), ('pretty=false', False), ('pretty=no', False),
+                              ('pretty=1', True), ('pretty=true', True), ('pretty=Yes', True)):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/assessment/{assessment.id}/?{query}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(b'\n' in response.content, pretty)
+
+
+class StaleJobTests(TestCase):
+    @override_settings(JOB_STALE_AFTER=600)
+    def test_jobs_without_a_heartbeat_are_requeued(self):
+        patient = Patient.objects.create(uploaded_file='vcf_uploads/patient.vcf')
+        dead, slow = enqueue(patient, ['CODEINE']), enqueue(patient, ['WARFARIN'])
+        now = timezone.now()
+        AssessmentJob.objects.filter(id=dead.id).update(
+            status='running', stage='explain', started_at=now - timedelta(seconds=900),
+            heartbeat_at=now - timedelta(seconds=601),
+        )
+        # Started long ago, but its worker is still alive.
+        AssessmentJob.objects.filter(id=slow.id).update(
+            status='running', started_at=now - timedelta(hours=1), heartbeat_at=now - timedelta(seconds=60),
+        )
+
+        job = claim_next()
+        self.assertEqual(job.id, dead.id)
+        self.assertEqual(job.status, 'running')
+        self.assertEqual(job.stage, '')
+        self.assertGreater(job.heartbeat_at, now)
+        self.assertEqual(AssessmentJob.objects.get(id=slow.id).status, 'running')
+        self.assertIsNone(claim_next())
+
+    def test_a_second_run_of_a_job_replaces_its_assessments(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        drugs = ['CODEINE', 'SIMVASTATIN']
+        with override_settings(MEDIA_ROOT=media):
+            with open(os.path.join(SAMPLE_VCF_DIR, 'test_patient.vcf'), 'rb') as handle:
+                upload = SimpleUploadedFile('patient.vcf', handle.read())
+            content = store_vcf(upload, upload.name)
+            patient = Patient.objects.create(uploaded_file=content.file.name, content=content)
+            job = enqueue(patient, drugs, 'local')
+            # The first run is presumed dead and the job is claimed again,
+            # but both runs finish.
+            for _ in range(2):
+                self.assertEqual(JobRunner(claim(job.id) or job).run().status, 'done')
+                variants = PatientVariant.objects.filter(patient=patient).count()
+                AssessmentJob.objects.filter(id=job.id).update(status='queued')
+
+        self.assertEqual(DrugAssessment.objects.filter(patient=patient).count(), len(drugs))
+        self.assertEqual(set(job.assessments.values_list('drug_name', flat=True)), set(drugs))
+        self.assertEqual(AssessmentCounter.objects.aggregate(total=Sum('count'))['total'], len(drugs))
+        content.refresh_from_db()
+        self.assertEqual(variants, len(content.variants))
+
+    def test_long_medication_lists_are_kept_whole(self):
+        patient = Patient.objects.create(uploaded_file='vcf_uploads/patient.vcf')
+        drugs = [f'UNLISTED DRUG {i}' for i in range(100)]
+        job = enqueue(patient, drugs)
+        self.assertGreater(len(job.drugs), 500)
+        self.assertEqual(AssessmentJob.objects.get(id=job.id).drugs.split(','), drugs)
+
+
+class PatientQueryTests(TestCase):
+    def _query(self, gene, phenotype):
+        response = self.client.get(f'/api/patients/?gene={gene}&phenotype={phenotype}')
+        return [row['patient_id'] for row in response.json()['results']]
+
+    def test_profiles_store_the_called_phenotype(self):
+        # Calls without a rule resolve to the default "Normal Metabolizer";
+        # the profile must still be found by the caller's code.
+        saved = Patient.objects.create(patient_id='saved', uploaded_file='vcf_uploads/a.vcf')
+        save_profiles([(saved, [], [{
+            'gene': 'SLCO1B1', 'diplotype': '*1/*5', 'phenotype': 'Normal Metabolizer',
+            'phenotype_call': 'low', 'activity_score': 1.0,
+        }])])
+        backfilled = Patient.objects.create(patient_id='backfilled', uploaded_file='vcf_uploads/b.vcf')
+        DrugAssessment.objects.create(
+            patient=backfilled, drug_name='CLOPIDOGREL', risk_label='Safe', confidence_score=0.8,
+            severity='Low', gene='CYP2C19', phenotype_call='RM', json_output={'pharmacogenomic_profile': {
+                'primary_gene': 'CYP2C19', 'diplotype': '*1/*17', 'phenotype': 'Normal Metabolizer',
+                'detected_variants': [],
+            }},
+        )
+        call_command('backfill_patient_profiles', stdout=io.StringIO())
+
+        self.assertEqual(self._query('SLCO1B1', 'low'), ['saved'])
+        self.assertEqual(self._query('CYP2C19', 'RM'), ['backfilled'])
+        self.assertEqual(self._query('CYP2C19', 'Normal Metabolizer'), [])
+
+
+class ExplanationCacheTests(TestCase):
+    REQUEST = {
+        'drug': 'CODEINE', 'gene': 'CYP2D6', 'phenotype': 'PM', 'risk_label': 'Ineffective',
+        'detected_variants': [{'rsid': 'rs3892097'}],
+    }
+    ANSWER = {
+        'summary': 'Poor metabolizer.', 'biological_mechanism': 'No CYP2D6 activity.',
+        'clinical_impact': 'No analgesia.', 'variant_evidence': 'rs3892097.', 'success': True,
+    }
+    FAILURE = dict.fromkeys(('summary', 'biological_mechanism', 'clinical_impact', 'variant_evidence'), 'Error.')
+
+    @override_settings(GROQ_API_KEY='test', GROQ_MODEL='cache-test', EXPLANATION_MODE='llm')
+    def test_failed_explanations_are_never_cached(self):
+        with mock.patch.dict(llm_service._caches, clear=True), mock.patch.object(
+            LLMService, '_request_explanation', side_effect=[dict(self.FAILURE, success=False), self.ANSWER],
+        ) as request:
+            failed = LLMService().generate_explanation(self.REQUEST)
+            self.assertNotEqual(failed['summary'], 'Error.')
+            self.assertFalse(CachedExplanation.objects.exists())
+            self.assertIsNone(LLMService().cache.get(self.REQUEST))
+
+            # The next request asks again, and its answer is cached.
+            self.assertEqual(LLMService().generate_explanation(self.REQUEST), self.ANSWER)
+            self.assertEqual(LLMService().generate_explanation(self.REQUEST), self.ANSWER)
+            self.assertEqual(request.call_count, 2)
+            self.assertEqual(CachedExplanation.objects.count(), 1)
+
+
+class ReassessTests(TestCase):
+    def _old_assessments(self):
+        """CODEINE (labelled Toxic) and WARFARIN rows saved under an older version."""
+        current = current_guidelines()
+        data = json.loads(current.raw)
+        data['rules']['CODEINE']['CYP2D6']['IM']['risk'] = 'Toxic'
+        raw = json.dumps(data).encode()
+        old = parse_guidelines(raw, require_rules=False)
+        GuidelineVersion.objects.create(version=old.version, content=raw)
+
+        variants = VCFParser(os.path.join(SAMPLE_VCF_DIR, 'test_data2.vcf')).parse()['variants']
+        content = VCFContent.objects.create(sha256='0' * 64, file='vcf_uploads/x.vcf', size=1, variants=variants)
+        patient = Patient.objects.create(uploaded_file=content.file.name, content=content)
+        predictions = predict(variants, ['CODEINE', 'WARFARIN'])
+        explanation = {'summary': '', 'biological_mechanism': '', 'clinical_impact': '', 'variant_evidence': ''}
+        rows = assessment_rows(patient, predictions, [explanation] * 2)
+        rows[0].risk_label = 'Toxic'
+        for row in rows:
+            row.guideline_version = old.version
+        return current, analytics.save_assessments(rows)
+
+    def _counts(self):
+        return {(row.drug, row.risk_label): row.count for row in AssessmentCounter.objects.all()}
+
+    def test_only_affected_rows_are_recomputed(self):
+        current, (codeine, warfarin) = self._old_assessments()
+        warfarin_updated = DrugAssessment.objects.get(id=warfarin.id).updated_at
+
+        out = io.StringIO()
+        call_command('reassess_guidelines', explanations='local', stdout=out)
+        self.assertIn('1 affected assessments', out.getvalue())
+        codeine, warfarin = DrugAssessment.objects.get(id=codeine.id), DrugAssessment.objects.get(id=warfarin.id)
+        self.assertEqual((codeine.risk_label, codeine.guideline_version), ('Adjust Dosage', current.version))
+        # Unaffected: only the version column moves forward.
+        self.assertEqual((warfarin.guideline_version, warfarin.updated_at), (current.version, warfarin_updated))
+
+        out = io.StringIO()
+        call_command('reassess_guidelines', explanations='local', stdout=out)
+        self.assertEqual(out.getvalue(), '')
+
+    def test_counters_follow_saves_and_relabels(self):
+        _current, (_codeine, warfarin) = self._old_assessments()
+        saved = {('CODEINE', 'Toxic'): 1, ('WARFARIN', warfarin.risk_label): 1}
+        self.assertEqual(self._counts(), saved)
+
+        call_command('reassess_guidelines', explanations='local', stdout=io.StringIO())
+        relabelled = {('CODEINE', 'Toxic'): 0, ('CODEINE', 'Adjust Dosage'): 1, ('WARFARIN', warfarin.risk_label): 1}
+        self.assertEqual(self._counts(), relabelled)
+        self.assertEqual(analytics.distribution('risk_label', drug='codeine')['counts'], [
+            {'value': 'Adjust Dosage', 'count': 1, 'share': 1.0},
+        ])
+        # The incremental counters agree with a full recount.
+        analytics.rebuild()
+        self.assertEqual({key: n for key, n in self._counts().items() if n}, {
+            key: n for key, n in relabelled.items() if n
+        })
+
+
+class VCFStoreTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+
+    def _store(self):
+        with open(os.path.join(SAMPLE_VCF_DIR, 'test_patient.vcf'), 'rb') as handle:
+            upload = SimpleUploadedFile('patient.vcf', handle.read())
+        return store_vcf(upload, upload.name)
+
+    @override_settings(VCF_UPLOAD_MAX_SIZE=1 << 20)
+    def test_uploads_over_the_size_limit_are_rejected(self):
+        with open(os.path.join(SAMPLE_VCF_DIR, 'test_patient.vcf'), 'rb') as handle:
+            data = handle.read()
+        big = SimpleUploadedFile('big.vcf', data + data.splitlines(keepends=True)[-1] * 30000)
+        with override_settings(MEDIA_ROOT=self.media):
+            response = self.client.post('/upload/', {'uploaded_file': big, 'drugs': 'CODEINE'})
+        self.assertContains(response, 'VCF uploads are limited to 1 MB.')
+        self.assertFalse(VCFContent.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media, 'vcf_uploads', 'incoming')), [])
+
+    def test_uploads_are_parsed_once_by_the_worker(self):
+        with override_settings(MEDIA_ROOT=self.media):
+            content = self._store()
+            self.assertIsNone(content.variants)
+            variants = content_variants(content)
+            self.assertTrue(variants)
+            with mock.patch('core.services.vcf_store.parse_variants') as parse:
+                again = self._store()
+                self.assertEqual(again.id, content.id)
+                self.assertEqual(content_variants(again), variants)
+            parse.assert_not_called()
+
+    def test_stored_files_get_storage_permissions(self):
+        for mode, expected in ((None, 0o644), (0o640, 0o640)):
+            with self.subTest(mode=mode), override_settings(MEDIA_ROOT=self.media, FILE_UPLOAD_PERMISSIONS=mode):
+                content = self._store()
+                self.assertEqual(os.stat(content.file.path).st_mode & 0o777, expected)
+                content.file.delete(save=False)
+                content.delete()
+
+
+class MetricsSnapshotTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _exited_pid(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        return process.pid
+
+    def _write(self, pid, uploads):
+        with open(os.path.join(self.directory, f'metrics-{pid}.json'), 'w') as handle:
+            json.dump({
+                'counters': [['pharmaguard_uploads_total', [['source', 'test']], uploads]],
+                'histograms': [],
+            }, handle)
+
+    def _uploads(self):
+        with override_settings(METRICS_DIR=self.directory):
+            rendered = metrics.render()
+        for line in rendered.splitlines():
+            if line.startswith('pharmaguard_uploads_total{source="test"}'):
+                return int(line.split()[-1])
+        return 0
+
+    def test_exited_processes_are_folded_into_one_file(self):
+        self._write(self._exited_pid(), 2)
+        self._write(self._exited_pid(), 3)
+        self._write(os.getppid(), 4)
+
+        self.assertEqual(self._uploads(), 9)
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.directory) if name.endswith('.json')),
+            sorted(['metrics-exited.json', f'metrics-{os.getppid()}.json']),
+        )
+        # Folded counts are kept, and counted once, by later scrapes.
+        self._write(self._exited_pid(), 1)
+        self.assertEqual(self._uploads(), 10)
+        self.assertEqual(self._uploads(), 10)
@@ -5,5 +5,15 @@ urlpatterns = [
     path('', views.LandingView.as_view(), name='landing'),
     path('upload/', views.UploadView.as_view(), name='upload'),
     path('results/<int:patient_id>/', views.ResultsView.as_view(), name='results'),
+    path('jobs/<int:job_id>/', views.JobView.as_view(), name='job'),
+    path('api/jobs/<int:job_id>/', views.JobStatusAPI.as_view(), name='job_status'),
+    path('api/jobs/<int:job_id>/stream/', views.JobStreamView.as_view(), name='job_stream'),
+    path('api/patients/', views.PatientQueryAPI.as_view(), name='patient_query'),
+    path('api/patients/bulk/', views.BulkIngestAPI.as_view(), name='bulk_ingest'),
+    path('api/patients/<int:patient_id>/screen/', views.MedicationScreenAPI.as_view(), name='medication_screen'),
+    path('api/analytics/distribution/', views.AnalyticsDistributionAPI.as_view(), name='analytics_distribution'),
+    path('api/analytics/timeseries/', views.AnalyticsTimeseriesAPI.as_view(), name='analytics_timeseries'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('api/assessments/', views.AssessmentListAPI.as_view(), name='assessment_list'),
     path('api/assessment/<int:assessment_id>/', views.AssessmentDetailAPI.as_view(), name='assessment_detail'),
 ]
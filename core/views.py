@@ -1,16 +1,35 @@
-import json
+import tarfile
+import zipfile
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
 from django.views import View
 from django.views.generic import TemplateView
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
 from django.utils.html import format_html
+from rest_framework import status
+from rest_framework.parsers import MultiPartParser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from .forms import VCFUploadForm 
-from .models import Patient, DrugAssessment 
-from .services.vcf_parser import VCFParser 
-from .services.risk_engine import RiskEngine
-from .services.llm_service import LLMService
-from .services.json_formatter import JSONFormatter
+from .models import Patient, DrugAssessment, AssessmentJob, PatientVariant, PatientGenePhenotype
+from .services import analytics, metrics
+from .services.assessment_payloads import assessment_json, assessment_payload
+from .services.drug_names import drug_matcher, normalize_drugs
+from .services.pipeline import predict
+from .services.vcf_store import patient_variants, store_vcf
+from .services.jobs import enqueue, job_status, STAGES
+from .services.job_stream import job_events
+from .services.bulk_ingest import BulkIngestor, archive_members
+from .services.llm_service import EXPLANATION_MODES
 
 
 class LandingView(View):
@@ -29,64 +48,33 @@ class LandingView(View):
         if not uploaded_file or not drug_input:
             return render(request, 'core/landing.html', {'error': 'Please provide both a VCF file and target medications.'})
 
-        # Create Patient record
-        patient = Patient.objects.create(
-            uploaded_file=uploaded_file
-        )
-
-        drug_names = drug_input.split(',')
-
-        # Step 1: Parse VCF
-        parser = VCFParser(patient.uploaded_file.path)
-        validation_ok, msg = parser.validate()
-        if not validation_ok:
-            return render(request, 'core/landing.html', {
-                'error': msg
-            })
+        drug_names = normalize_drugs(drug_input)
+        explanation_mode = _explanation_mode(request.POST)
 
-        parsing_results = parser.parse()
-        if not parsing_results['success']:
+        # Step 1: Store VCF once per content (parsing happens in the job worker)
+        metrics.inc('pharmaguard_uploads_total', source='landing')
+        try:
+            with metrics.timed('store'):
+                content = store_vcf(uploaded_file, uploaded_file.name)
+        except ValueError as e:
             return render(request, 'core/landing.html', {
-                'error': parsing_results['error']
+                'error': str(e)
             })
 
-        # Step 2: Risk Prediction & LLM Explanation
-        risk_engine = RiskEngine(parsing_results['variants'])
-        llm_service = LLMService()
-
-        for drug_name in drug_names:
-            drug_name = drug_name.strip()
-            if not drug_name:
-                continue
-
-            prediction = risk_engine.predict(drug_name)
-            prediction['drug'] = drug_name
-
-            # Generate LLM explanation
-            explanation = llm_service.generate_explanation({
-                'drug': drug_name,
-                'gene': prediction['gene'],
-                'phenotype': prediction['phenotype'],
-                'risk_label': prediction['risk_label'],
-                'detected_variants': prediction.get('detected_variants', []),
-            })
+        # Create Patient record
+        patient = Patient.objects.create(
+            content=content, uploaded_file=content.file.name
+        )
 
-            # Format to Strict JSON
-            final_json = JSONFormatter.format_output(
-                prediction, explanation, patient.patient_id
-            )
+        # Step 2: Queue parsing, risk prediction and LLM explanations
+        job = enqueue(patient, drug_names, explanation_mode)
+        return redirect('job', job_id=job.id)
 
-            # Save Assessment
-            DrugAssessment.objects.create(
-                patient=patient,
-                drug_name=drug_name,
-                risk_label=prediction['risk_label'],
-                confidence_score=prediction['confidence_score'],
-                severity=prediction['severity'],
-                json_output=final_json,
-            )
 
-        return redirect('results', patient_id=patient.id)
+def _explanation_mode(data):
+    """Optional per-request `explanations` mode; unknown values use the default."""
+    mode = data.get('explanations', '')
+    return mode if mode in EXPLANATION_MODES else ''
 
 
 class UploadView(View):
@@ -97,134 +85,443 @@ class UploadView(View):
     def post(self, request):
         form = VCFUploadForm(request.POST, request.FILES)
         if form.is_valid():
-            patient = form.save()
-            drug_names = form.cleaned_data['drugs'].split(',')
-
-            # Step 1: Parse VCF
-            parser = VCFParser(patient.uploaded_file.path)
-            validation_ok, msg = parser.validate()
-            if not validation_ok:
+            drug_names = normalize_drugs(form.cleaned_data['drugs'])
+
+            # Step 1: Store VCF once per content (parsing happens in the job worker)
+            uploaded_file = form.cleaned_data['uploaded_file']
+            metrics.inc('pharmaguard_uploads_total', source='upload')
+            try:
+                with metrics.timed('store'):
+                    content = store_vcf(uploaded_file, uploaded_file.name)
+            except ValueError as e:
                 return render(request, 'core/upload.html', {
-                    'form': form, 'error': msg
-                })
-
-            parsing_results = parser.parse()
-            if not parsing_results['success']:
-                return render(request, 'core/upload.html', {
-                    'form': form, 'error': parsing_results['error']
+                    'form': form, 'error': str(e)
                 })
+            patient = Patient.objects.create(
+                content=content, uploaded_file=content.file.name
+            )
 
-            # Step 2: Risk Prediction & LLM Explanation
-            risk_engine = RiskEngine(parsing_results['variants'])
-            llm_service = LLMService()
+            # Step 2: Queue parsing, risk prediction and LLM explanations
+            job = enqueue(patient, drug_names, _explanation_mode(request.POST))
+            return redirect('job', job_id=job.id)
 
-            for drug_name in drug_names:
-                drug_name = drug_name.strip()
-                if not drug_name:
-                    continue
+        return render(request, 'core/upload.html', {'form': form})
 
-                prediction = risk_engine.predict(drug_name)
-                prediction['drug'] = drug_name
 
-                # Generate LLM explanation
-                explanation = llm_service.generate_explanation({
-                    'drug': drug_name,
-                    'gene': prediction['gene'],
-                    'phenotype': prediction['phenotype'],
-                    'risk_label': prediction['risk_label'],
-                    'detected_variants': prediction.get(
-                        'detected_variants', []
-                    ),
-                })
+def _results_state(request, patient_id):
+    """
+    Count, newest id and latest update of a patient's assessments: the
+    validators for the results page, computed once per request.
+    """
+    state = getattr(request, '_results_state', None)
+    if state is None:
+        state = request._results_state = DrugAssessment.objects.filter(
+            patient_id=patient_id
+        ).aggregate(count=Count('id'), last_id=Max('id'), updated=Max('updated_at'))
+    return state
 
-                # Format to Strict JSON
-                final_json = JSONFormatter.format_output(
-                    prediction, explanation, patient.patient_id
-                )
 
-                # Save Assessment
-                DrugAssessment.objects.create(
-                    patient=patient,
-                    drug_name=drug_name,
-                    risk_label=prediction['risk_label'],
-                    confidence_score=prediction['confidence_score'],
-                    severity=prediction['severity'],
-                    json_output=final_json,
-                )
+def results_etag(request, patient_id):
+    state = _results_state(request, patient_id)
+    updated = state['updated'].timestamp() if state['updated'] else 0
+    return f"results-{patient_id}-{state['count']}-{state['last_id']}-{updated}"
 
-            return redirect('results', patient_id=patient.id)
 
-        return render(request, 'core/upload.html', {'form': form})
+def results_last_modified(request, patient_id):
+    return _results_state(request, patient_id)['updated']
 
 
+@method_decorator(
+    condition(etag_func=results_etag, last_modified_func=results_last_modified), name='get'
+)
 class ResultsView(View):
+    """
+    The rendered page is cached under the patient's current ETag, so it is
+    built once per change to that patient's assessments; repeat visits with
+    a matching If-None-Match / If-Modified-Since get a 304.
+    """
+
     def get(self, request, patient_id):
         patient = get_object_or_404(Patient, id=patient_id)
-        raw_assessments = patient.assessments.all()
+        cache_key = f"{results_etag(request, patient_id)}-html"
+        html = cache.get(cache_key)
+        if html is None:
+            html = render_to_string('core/results.html', {
+                'patient': patient,
+                'assessments': [
+                    self._assessment_context(a) for a in patient.assessments.all()
+                ],
+            })
+            cache.set(cache_key, html, getattr(settings, 'RESULTS_CACHE_TIMEOUT', 24 * 3600))
+        return HttpResponse(html)
 
+    @staticmethod
+    def _assessment_context(a):
         # Pre-process assessments so the template
         # never needs deep dictionary lookups or nested loops
-        assessments = []
-        for a in raw_assessments:
-            jo = a.json_output or {}
-            profile = jo.get('pharmacogenomic_profile', {})
-            llm = jo.get('llm_generated_explanation', {})
-            rec = jo.get('clinical_recommendation', {})
-            variants = profile.get('detected_variants', [])
-
-            # Build variant HTML table rows
-            rows = []
-            for v in variants:
-                rows.append(
-                    '<tr><td><code>{}</code></td>'
-                    '<td>{}</td><td>{}</td></tr>'.format(
-                        v.get('rsid', ''),
-                        v.get('chromosome', ''),
-                        v.get('genotype', ''),
-                    )
-                )
-
-            if rows:
-                table_html = (
-                    '<table class="table table-sm"><thead><tr>'
-                    '<th>rsID</th><th>Chromosome</th><th>Genotype</th>'
-                    '</tr></thead><tbody>'
-                    + ''.join(rows)
-                    + '</tbody></table>'
-                )
-            else:
-                table_html = '<p class="text-muted">No variants detected.</p>'
-
-            # CSS class for risk badge (no spaces)
-            risk_css = a.risk_label.replace(' ', '') if a.risk_label else 'Unknown'
-
-            risk_data = jo.get('risk_assessment', {})
-
-            assessments.append({
-                'id': a.id,
-                'drug_name': a.drug_name,
-                'risk_label': a.risk_label,
-                'risk_css': risk_css,
-                'gene_name': profile.get('primary_gene', 'N/A'),
-                'diplotype': profile.get('diplotype', 'N/A'),
-                'phenotype': profile.get('phenotype', 'N/A'),
-                'confidence_score': risk_data.get('confidence_score', 'N/A'),
-                'severity': risk_data.get('severity', 'N/A'),
-                'summary': llm.get('summary', 'No summary available.'),
-                'mechanism': llm.get('biological_mechanism', 'N/A'),
-                'evidence': llm.get('variant_evidence', 'N/A'),
-                'action': rec.get('action', 'No recommendation.'),
-                'variant_table': table_html,
-                'json_pretty': json.dumps(jo, indent=2),
-            })
+        jo = a.json_output or {}
+        profile = jo.get('pharmacogenomic_profile', {})
+        llm = jo.get('llm_generated_explanation', {})
+        rec = jo.get('clinical_recommendation', {})
+        variants = profile.get('detected_variants', [])
+
+        # Build variant HTML table rows
+        rows = [
+            format_html(
+                '<tr><td><code>{}</code></td><td>{}</td><td>{}</td></tr>',
+                v.get('rsid', ''),
+                v.get('chromosome', ''),
+                v.get('genotype', ''),
+            )
+            for v in variants
+        ]
+
+        if rows:
+            table_html = (
+                '<table class="table table-sm"><thead><tr>'
+                '<th>rsID</th><th>Chromosome</th><th>Genotype</th>'
+                '</tr></thead><tbody>'
+                + ''.join(rows)
+                + '</tbody></table>'
+            )
+        else:
+            table_html = '<p class="text-muted">No variants detected.</p>'
+
+        # CSS class for risk badge (no spaces)
+        risk_css = a.risk_label.replace(' ', '') if a.risk_label else 'Unknown'
+
+        risk_data = jo.get('risk_assessment', {})
+
+        return {
+            'id': a.id,
+            'drug_name': a.drug_name,
+            'risk_label': a.risk_label,
+            'risk_css': risk_css,
+            'gene_name': profile.get('primary_gene', 'N/A'),
+            'diplotype': profile.get('diplotype', 'N/A'),
+            'phenotype': profile.get('phenotype', 'N/A'),
+            'confidence_score': risk_data.get('confidence_score', 'N/A'),
+            'severity': risk_data.get('severity', 'N/A'),
+            'summary': llm.get('summary', 'No summary available.'),
+            'mechanism': llm.get('biological_mechanism', 'N/A'),
+            'evidence': llm.get('variant_evidence', 'N/A'),
+            'action': rec.get('action', 'No recommendation.'),
+            'variant_table': table_html,
+            'json_pretty': assessment_json(a.id, a.updated_at, pretty=True, value=jo).decode(),
+        }
+
+
+class MetricsView(View):
+    """Pipeline metrics in the Prometheus text format."""
 
-        return render(request, 'core/results.html', {
-            'patient': patient,
-            'assessments': assessments,
-        })
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 class AssessmentDetailAPI(APIView):
+    """
+    The stored assessment JSON, sent as bytes without re-encoding;
+    ?pretty=1 (or true/yes) indents it.
+    """
+
     def get(self, request, assessment_id):
-        assessment = get_object_or_404(DrugAssessment, id=assessment_id)
-        return Response(assessment.json_output)
+        pretty = request.query_params.get('pretty', '').lower() in ('1', 'true', 'yes')
+        data = assessment_payload(assessment_id, pretty=pretty)
+        if data is None:
+            raise Http404
+        return HttpResponse(data, content_type='application/json')
+
+
+def _page_params(params, max_limit, default_limit=100):
+    """Keyset paging (limit, after) from query params; raises ValueError."""
+    try:
+        limit = int(params.get('limit', default_limit))
+        after = int(params.get('after', 0))
+    except ValueError:
+        raise ValueError("limit and after must be integers.")
+    if not 1 <= limit <= max_limit:
+        raise ValueError(f"limit must be between 1 and {max_limit}.")
+    return limit, after
+
+
+@method_decorator(gzip_page, name='dispatch')
+class AssessmentListAPI(APIView):
+    """
+    Assessments filtered by patient (id), drug, risk_label, severity and
+    since/until (created_at, ISO date or datetime), ordered by id and paged
+    with ?after=<last id>&limit=<n> (at most 1000), so every page costs the
+    same however deep a sync goes. ?fields= picks the columns (default all
+    but json_output, which is only read and decoded when requested).
+    """
+    MAX_LIMIT = 1000
+    FIELDS = (
+        'id', 'patient', 'drug_name', 'risk_label', 'severity', 'confidence_score',
+        'guideline_version', 'created_at', 'updated_at', 'json_output',
+    )
+    DEFAULT_FIELDS = FIELDS[:-1]
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            fields = self._fields(params.get('fields'))
+            limit, after = _page_params(params, self.MAX_LIMIT)
+            assessments = self._filter(DrugAssessment.objects.order_by('id'), params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The cursor needs the id even when it isn't a requested field.
+        rows = list(assessments.filter(id__gt=after).values('id', *fields)[:limit])
+        next_after = rows[-1]['id'] if len(rows) == limit else None
+        if 'id' not in fields:
+            for row in rows:
+                del row['id']
+        return Response({'results': rows, 'next_after': next_after})
+
+    def _fields(self, raw):
+        if not raw:
+            return list(self.DEFAULT_FIELDS)
+        fields = list(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+        unknown = [f for f in fields if f not in self.FIELDS]
+        if unknown or not fields:
+            raise ValueError(f"fields must be a comma-separated subset of {', '.join(self.FIELDS)}.")
+        return fields
+
+    @staticmethod
+    def _filter(assessments, params):
+        if params.get('patient'):
+            if not params['patient'].isdigit():
+                raise ValueError("patient must be a patient id.")
+            assessments = assessments.filter(patient_id=int(params['patient']))
+        if params.get('drug'):
+            assessments = assessments.filter(drug_name__iexact=params['drug'].strip())
+        for field in ('risk_label', 'severity'):
+            if params.get(field):
+                assessments = assessments.filter(**{field: params[field]})
+        for bound, lookup in (('since', 'gte'), ('until', 'lte')):
+            if not params.get(bound):
+                continue
+            moment = parse_datetime(params[bound])
+            if moment is not None:
+                if timezone.is_naive(moment):
+                    moment = timezone.make_aware(moment)
+                assessments = assessments.filter(**{f'created_at__{lookup}': moment})
+                continue
+            day = parse_date(params[bound])
+            if day is None:
+                raise ValueError(f"{bound} must be an ISO date or datetime.")
+            assessments = assessments.filter(**{f'created_at__date__{lookup}': day})
+        return assessments
+
+
+def _streaming(request):
+    """Whether responses can stream, i.e. the request came in over ASGI."""
+    return isinstance(request, ASGIRequest)
+
+
+class JobView(View):
+    def get(self, request, job_id):
+        job = get_object_or_404(AssessmentJob, id=job_id)
+        if job.status == 'done':
+            return redirect('results', patient_id=job.patient_id)
+        return render(request, 'core/job.html', {
+            'job': job, 'stages': STAGES, 'streaming': _streaming(request),
+        })
+
+
+class JobStatusAPI(APIView):
+    def get(self, request, job_id):
+        job = get_object_or_404(AssessmentJob, id=job_id)
+        return Response(job_status(job))
+
+
+class JobStreamView(View):
+    """
+    Server-sent events for a job: each drug's risk result, then its full
+    assessment JSON once the explanation is ready (see job_events()).
+    Only under ASGI is a queued job run here; under WSGI the response is
+    buffered, so the job is left to run_assessment_jobs and only followed.
+    """
+
+    async def get(self, request, job_id):
+        if not await AssessmentJob.objects.filter(id=job_id).aexists():
+            raise Http404
+        response = StreamingHttpResponse(
+            job_events(job_id, run=_streaming(request)), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class BulkIngestAPI(APIView):
+    """
+    Assesses many VCFs in one request: any number of `vcf_files` and/or
+    `archive` (.zip/.tar/.tar.gz of VCFs) uploads, plus a comma-separated
+    `drugs` list and an optional `explanations` mode (auto, local, llm,
+    hybrid). Returns the created patients and any per-file errors.
+    """
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        drug_names = normalize_drugs(request.data.get('drugs', ''))
+        vcf_files = request.FILES.getlist('vcf_files')
+        archives = request.FILES.getlist('archive')
+        if not drug_names or not (vcf_files or archives):
+            return Response(
+                {'error': 'Provide drugs and at least one of vcf_files or archive.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        explanation_mode = request.data.get('explanations') or None
+        if explanation_mode is not None and explanation_mode not in EXPLANATION_MODES:
+            return Response(
+                {'error': f"explanations must be one of {', '.join(EXPLANATION_MODES)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        ingestor = BulkIngestor(drug_names, explanation_mode=explanation_mode)
+        for upload in vcf_files:
+            ingestor.add(upload.name, upload)
+        for upload in archives:
+            try:
+                for name, member in archive_members(upload):
+                    ingestor.add(name, member)
+            except (ValueError, zipfile.BadZipFile, tarfile.TarError) as e:
+                ingestor.errors.append({'file': upload.name, 'error': str(e)})
+
+        return Response(ingestor.finish(), status=status.HTTP_201_CREATED)
+
+
+class MedicationScreenAPI(APIView):
+    """
+    Screens a free-text medication list (`medications`: drug or brand
+    names, comma-, semicolon- or line-separated, e.g. a pasted discharge
+    list) against a stored patient's variants. Supported drugs are found
+    by the synonym automaton and assessed by RiskEngine without
+    explanations; nothing is stored.
+    """
+
+    def post(self, request, patient_id):
+        medications = request.data.get('medications', '')
+        if not isinstance(medications, str) or not medications.strip():
+            return Response(
+                {'error': 'Provide medications as text.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        patient = get_object_or_404(Patient.objects.select_related('content'), id=patient_id)
+
+        drugs, matches, unmatched = drug_matcher().screen(medications)
+        entries = {drug: [m['entry'] for m in matches if drug in m['drugs']] for drug in drugs}
+        try:
+            predictions = predict(patient_variants(patient), drugs) if drugs else []
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response({
+            'patient': patient.id,
+            'assessments': [
+                {
+                    'drug': prediction['drug'],
+                    'gene': prediction['gene'],
+                    'diplotype': prediction['diplotype'],
+                    'phenotype': prediction['phenotype'],
+                    'risk_label': prediction['risk_label'],
+                    'severity': prediction['severity'],
+                    'confidence_score': prediction['confidence_score'],
+                    'action': prediction['action'],
+                    'guideline_version': prediction['guideline_version'],
+                    'entries': entries[prediction['drug']],
+                }
+                for prediction in predictions
+            ],
+            'unmatched': unmatched,
+        })
+
+
+def _analytics_filters(params):
+    """Dimension and since/until (YYYY-MM-DD) filters from query params; raises ValueError."""
+    filters = {dimension: params[dimension] for dimension in analytics.DIMENSIONS if params.get(dimension)}
+    for bound in ('since', 'until'):
+        if params.get(bound):
+            filters[bound] = parse_date(params[bound])
+            if filters[bound] is None:
+                raise ValueError(f"{bound} must be a YYYY-MM-DD date.")
+    by = params.get('by', 'risk_label')
+    if by not in analytics.DIMENSIONS:
+        raise ValueError(f"by must be one of {', '.join(analytics.DIMENSIONS)}.")
+    return by, filters
+
+
+class AnalyticsDistributionAPI(APIView):
+    """
+    Assessment counts and shares per drug, gene, phenotype or risk_label
+    (?by=), e.g. ?by=phenotype&gene=CYP2C19. Optional filters: drug, gene,
+    phenotype, risk_label, since, until. Served from AssessmentCounter.
+    """
+
+    def get(self, request):
+        try:
+            by, filters = _analytics_filters(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(analytics.distribution(by, **filters))
+
+
+class AnalyticsTimeseriesAPI(APIView):
+    """
+    Per-day or per-month (?interval=) counts and shares per value of ?by=
+    (default risk_label), e.g. ?drug=WARFARIN&interval=month for the
+    monthly Toxic rate. Same filters as AnalyticsDistributionAPI.
+    """
+
+    def get(self, request):
+        interval = request.query_params.get('interval', 'day')
+        try:
+            if interval not in analytics.INTERVALS:
+                raise ValueError(f"interval must be one of {', '.join(analytics.INTERVALS)}.")
+            by, filters = _analytics_filters(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(analytics.timeseries(interval, by, **filters))
+
+
+class PatientQueryAPI(APIView):
+    """
+    Cohort lookup over the normalized profile tables, e.g.
+    ?gene=CYP2C19&phenotype=PM or ?rsid=rs4149056&genotype=1/1.
+    Filters are ANDed; results are ordered by id and paged with
+    ?after=<last id>&limit=<n> (at most 1000).
+    """
+    MAX_LIMIT = 1000
+
+    def get(self, request):
+        params = request.query_params
+        patients = Patient.objects.order_by('id')
+
+        gene_filters = {
+            field: params[field] for field in ('gene', 'phenotype', 'diplotype') if params.get(field)
+        }
+        if gene_filters:
+            patients = patients.filter(id__in=PatientGenePhenotype.objects.filter(
+                **gene_filters
+            ).values('patient_id'))
+
+        variant_filters = {
+            field: params[field] for field in ('rsid', 'genotype') if params.get(field)
+        }
+        if variant_filters:
+            patients = patients.filter(id__in=PatientVariant.objects.filter(
+                **variant_filters
+            ).values('patient_id'))
+
+        try:
+            limit, after = _page_params(params, self.MAX_LIMIT)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = list(
+            patients.filter(id__gt=after)
+            .values('id', 'patient_id', 'sample_name', 'uploaded_at')[:limit]
+        )
+        return Response({
+            'results': results,
+            'next_after': results[-1]['id'] if len(results) == limit else None,
+        })
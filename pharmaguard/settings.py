@@ -104,6 +104,36 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'core' / 'static' / 'uploads'
 
+# VCF uploads are hashed and written to storage while the request body is
+# read (the job worker parses them); other uploads use Django's default
+# handlers.
+FILE_UPLOAD_HANDLERS = [
+    'core.services.vcf_store.VCFUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Largest VCF accepted over HTTP (uploads and bulk ingestion); files
+# assessed from the server's disk (assess_cohort) have no limit
+VCF_UPLOAD_MAX_SIZE = int(os.environ.get('VCF_UPLOAD_MAX_SIZE', 5 * 1024 * 1024))
+
+# Store plain .vcf uploads bgzip-compressed (still block-addressable for
+# tabix region reads)
+VCF_STORE_COMPRESS = os.environ.get('VCF_STORE_COMPRESS', 'True') == 'True'
+
+# compact_storage drops raw VCFs older than this many days once their
+# variants are parsed
+VCF_RETENTION_DAYS = int(os.environ.get('VCF_RETENTION_DAYS', 90))
+
+# CPIC rules file; every process re-checks it at most this often (seconds)
+# and switches to a changed, valid version without a restart
+CPIC_GUIDELINES_PATH = os.environ.get('CPIC_GUIDELINES_PATH') or None
+GUIDELINES_RELOAD_INTERVAL = float(os.environ.get('GUIDELINES_RELOAD_INTERVAL', 5.0))
+
+# Allele definitions and their binary index are re-checked as often and
+# rebuilt or mapped again when they change
+ALLELE_RELOAD_INTERVAL = float(os.environ.get('ALLELE_RELOAD_INTERVAL', 5.0))
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -111,8 +141,45 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
-    ]
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
+# Rendered results pages are cached per patient and ETag; point CACHES at a
+# shared backend (file, database, memcached) to share them across workers.
+RESULTS_CACHE_TIMEOUT = int(os.environ.get('RESULTS_CACHE_TIMEOUT', 24 * 3600))
+
+# Running jobs whose worker has sent no heartbeat (one per stage and per
+# explanation) for this many seconds are assumed dead and requeued by the
+# next claim_next(); keep it above the longest single stage step
+JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', 600))
+
+# Metrics: with METRICS_DIR set, every process (web and job workers) writes
+# its counters there and /metrics/ reports the sum over all of them. Exited
+# processes are recognised by PID, so use one directory per host.
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1.0))
+
+# Patients per transaction (and per concurrent LLM batch) in bulk ingestion
+BULK_INGEST_BATCH_SIZE = int(os.environ.get('BULK_INGEST_BATCH_SIZE', 200))
+
 # API Keys
 GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
+GROQ_MODEL = os.environ.get('GROQ_MODEL', 'llama-3.3-70b-versatile')
+
+# Concurrent LLM calls: per process (thread pool / connection pool size)
+# and per upload request.
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 8))
+LLM_REQUEST_CONCURRENCY = int(os.environ.get('LLM_REQUEST_CONCURRENCY', 6))
+
+# Explanations: auto (Groq when GROQ_API_KEY is set, else the local template
+# engine), local, llm, or hybrid (local now, Groq enrichment by the worker).
+EXPLANATION_MODE = os.environ.get('EXPLANATION_MODE', 'auto')
+
+# LLM explanation cache: in-process LRU entries and the shared DB tier both
+# expire after EXPLANATION_CACHE_TTL seconds.
+EXPLANATION_CACHE_TTL = int(os.environ.get('EXPLANATION_CACHE_TTL', 7 * 24 * 3600))
+EXPLANATION_CACHE_SIZE = int(os.environ.get('EXPLANATION_CACHE_SIZE', 2048))